@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+# API JSON của storefront chạy bản async (shop/views/async_api.py); SHOP_ASYNC_API=0 để tắt
+os.environ.setdefault('SHOP_ASYNC_API', '1')
 
 application = get_asgi_application()
@@ -1,5 +1,7 @@
 # myproject/settings.py
 import os
+import sys
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -19,6 +21,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shop.metrics.MetricsMiddleware',
+    'shop.instrumentation.QueryStatsMiddleware',
+    'shop.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +75,14 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# ===== MongoDB (shop/database.py) =====
+# Đang chạy test: `manage.py test` hoặc pytest (pytest đã được import trước settings,
+# PYTEST_VERSION do pytest >= 8.2 đặt); không dựa riêng vào argv
+TESTING = (len(sys.argv) > 1 and sys.argv[1] == "test") or "pytest" in sys.modules or "PYTEST_VERSION" in os.environ
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+# manage.py test dùng DB riêng, không bao giờ đụng dữ liệu thật
+MONGO_DB_NAME = "TraiCay_test" if TESTING else os.getenv("MONGO_DB", "TraiCay")
+
 # ===== VNPay (điền đúng TMNCODE & HASHSECRET sandbox/production của bạn) =====
 def _env(name, default=""):
     v = os.getenv(name, default)
@@ -85,3 +98,79 @@ VNPAY_PAYMENT_URL = "https://sandbox.vnpayment.vn/paymentv2/vpcpay.html"
 PUBLIC_BASE = _env("PUBLIC_BASE", " https://ayesha-rankish-fatimah.ngrok-free.dev")
 VNPAY_RETURN_URL    = f"{PUBLIC_BASE}/api/pay/vnpay/return/"
 VNPAY_IPN_URL       = f"{PUBLIC_BASE}/api/pay/vnpay/ipn/"
+
+# ===== Media (ảnh sản phẩm) =====
+# "" = Django tự trả file; "x-accel-redirect" (nginx) hoặc "x-sendfile" (Apache/lighttpd)
+MEDIA_SENDFILE = _env("MEDIA_SENDFILE", "")
+# nginx: location /_media_internal/ { internal; alias <MEDIA_ROOT>/; }
+MEDIA_ACCEL_PREFIX = _env("MEDIA_ACCEL_PREFIX", "/_media_internal/")
+# File không có hash trong tên chỉ cache ngắn rồi revalidate bằng ETag
+MEDIA_CACHE_MAX_AGE = 3600
+
+# ===== Upload ảnh xử lý nền (shop/uploads.py) =====
+UPLOAD_SPOOL_DIR = os.path.join(BASE_DIR, "upload_spool")
+UPLOAD_WORKERS = int(_env("UPLOAD_WORKERS", "2"))
+UPLOAD_QUEUE_MAX = int(_env("UPLOAD_QUEUE_MAX", "32"))
+
+# ===== ASGI: view async cho API JSON (shop/views/async_api.py, shop/database_async.py) =====
+# myproject/asgi.py đặt SHOP_ASYNC_API=1; WSGI (runserver, gunicorn wsgi, test) giữ view đồng bộ.
+# Cần pymongo >= 4.10 (AsyncMongoClient) hoặc motor. PROFILING_ENABLED là middleware đồng bộ
+# -> khi bật, Django chạy cả chuỗi trong thread như WSGI.
+ASYNC_API = not TESTING and _env("SHOP_ASYNC_API", "0") == "1"
+
+# ===== Session (shop/sessions.py) =====
+# "mongo": collection django_session + TTL index (không tranh khoá file SQLite giữa các worker)
+# "cached_mongo": như trên + đọc qua cache local (CACHES / SESSION_CACHE_ALIAS), giữ tối đa
+#                 SESSION_MONGO_CACHE_TTL giây mỗi worker
+# "db": backend mặc định của Django (SQLite) — test dùng để ngân sách lệnh Mongo không tính session
+SESSION_BACKEND = "db" if TESTING else _env("SESSION_BACKEND", "mongo")
+if SESSION_BACKEND in ("mongo", "cached_mongo"):
+    SESSION_ENGINE = "shop.sessions"
+SESSION_MONGO_CACHE = SESSION_BACKEND == "cached_mongo"
+SESSION_MONGO_CACHE_TTL = 30
+
+# ===== Bộ đếm lượt xem ghi trễ (shop/counters.py) =====
+# Gộp trong RAM mỗi worker, 1 bulk_write mỗi chu kỳ hoặc khi buffer đủ số _id; 0 = không chạy thread nền
+VIEW_COUNTER_FLUSH_INTERVAL = 0 if TESTING else 10   # giây
+VIEW_COUNTER_MAX_KEYS = 5000
+
+# ===== Phiên bản catalog + cache số liệu tổng hợp (shop/catalog.py) =====
+CATALOG_VERSION_TTL = 5        # giây mỗi worker nhớ version trước khi đọc lại từ Mongo
+CATALOG_CACHE_TIMEOUT = 3600   # giây; key gắn version nên đổi catalog là cache cũ tự bỏ
+
+# ===== Fan-out lệnh Mongo độc lập trong 1 view (shop/concurrency.py) =====
+FANOUT_WORKERS = int(_env("FANOUT_WORKERS", "16"))     # thread pool chung của process
+FANOUT_REQUEST_TIMEOUT = 10                            # giây / request, quá hạn -> DeadlineExceeded
+
+# ===== Đo lệnh Mongo theo request (shop/instrumentation.py) =====
+# Vượt 1 trong 2 ngưỡng -> log 1 dòng JSON (logger "shop.mongo")
+MONGO_QUERY_BUDGET = {"commands": 15, "ms": 150}
+# Panel nhỏ góc trái dưới trên các trang HTML
+MONGO_DEBUG_PANEL = DEBUG
+
+# ===== Slow query log (shop/slowlog.py) =====
+# find/aggregate/count lâu hơn ngưỡng (ms) -> explain("executionStats") ở thread nền,
+# lưu vào capped collection "slow_queries". "" = tắt (mặc định tắt khi chạy test)
+_slow_ms = _env("MONGO_SLOW_QUERY_MS", "100")
+MONGO_SLOW_QUERY_MS = None if TESTING or not _slow_ms else float(_slow_ms)
+MONGO_SLOW_QUERY_EXPLAIN_INTERVAL = 60     # giây, mỗi query shape tối đa 1 explain
+MONGO_SLOW_QUERY_LOG_BYTES = 16 * 1024 * 1024
+MONGO_SLOW_QUERY_LOG_MAX = 5000
+
+# ===== Metrics Prometheus (shop/metrics.py, GET /metrics) =====
+# Mỗi worker ghi snapshot <pid>.json vào đây; xoá thư mục khi restart toàn bộ để reset counter.
+# "" = chỉ số liệu của process đang trả lời /metrics (chạy 1 process)
+METRICS_DIR = "" if TESTING else _env("METRICS_DIR", os.path.join(tempfile.gettempdir(), "traicaysach-metrics"))
+METRICS_FLUSH_INTERVAL = 5  # giây
+# Có token -> bắt buộc "Authorization: Bearer <token>". Không token: production (DEBUG tắt) luôn 403,
+# DEBUG chỉ cho IP trong danh sách (sau reverse proxy REMOTE_ADDR luôn là 127.0.0.1, không tin được)
+METRICS_TOKEN = _env("METRICS_TOKEN", "")
+METRICS_ALLOWED_IPS = ("127.0.0.1", "::1")
+
+# ===== Profiler lấy mẫu (shop/profiling.py, trang /admin-panel/profiles/) =====
+PROFILING_ENABLED = _env("PROFILING_ENABLED", "0") == "1"
+PROFILING_SAMPLE_RATE = float(_env("PROFILING_SAMPLE_RATE", "0"))  # 0.01 = 1% request
+PROFILING_INTERVAL = 0.002          # giây giữa 2 lần chụp stack
+PROFILING_TOKEN_MAX_AGE = 3600      # header X-Shop-Profile hết hạn sau 1 giờ
+PROFILING_DIR = os.path.join(BASE_DIR, "profiles")
+PROFILING_MAX_PROFILES = 200
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from shop.views.media_view import serve_media
+from shop.views.metrics_view import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,6 +11,13 @@ urlpatterns = [
     path("admin-panel/", include("shop.urls")),
 ]
 
-# Thêm dòng này để load ảnh trong thư mục media
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Ảnh trong thư mục media: có Cache-Control/ETag/Range, production thì nhường cho nginx
+# (MEDIA_SENDFILE) nên worker Python không phải đẩy bytes ảnh
+urlpatterns += [
+    re_path(r"^%s(?P<path>.+)$" % settings.MEDIA_URL.lstrip("/"), serve_media, name="media"),
+]
+
+# Prometheus scrape (shop/metrics.py)
+urlpatterns += [
+    path("metrics", metrics, name="metrics"),
+]
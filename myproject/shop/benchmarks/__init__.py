@@ -0,0 +1,5 @@
+# shop/benchmarks/
+"""
+Micro-benchmark cho các hàm Python chạy trên mọi request danh sách
+(serialize đơn hàng / giỏ hàng, phân trang...). Chạy bằng `manage.py microbench`.
+"""
@@ -0,0 +1,81 @@
+# shop/benchmarks/fixtures.py
+"""
+Document mẫu giống dữ liệu thật trong Mongo (đúng các alias mà checkout ghi ra),
+dùng cố định giữa các lần chạy để số đo so sánh được.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from bson import ObjectId
+
+NOW = datetime(2025, 6, 1, 8, 30, tzinfo=dt_timezone.utc)
+ACCOUNT_ID = ObjectId("66a000000000000000000001")
+PRODUCT_IDS = [ObjectId("66b0000000000000000000%02x" % i) for i in range(1, 9)]
+PRODUCT_NAMES = ["Xoài cát Hoà Lộc (1kg)", "Bưởi da xanh Bến Tre", "Nho xanh Mỹ (500g)", "Táo Envy",
+                 "Sầu riêng Ri6", "Cam sành", "Cherry đỏ Mỹ", "Combo gia đình"]
+
+
+def account():
+    return {"_id": ACCOUNT_ID, "ho_ten": "Nguyễn Thị Mai", "email": "mai.nguyen@example.com",
+            "sdt": "0912345678", "dia_chi": "12 Quang Trung, Gò Vấp, TP.HCM"}
+
+
+def product_map():
+    """sp_map như các view tạo ra: {_id: {"ten_san_pham"}}."""
+    return {pid: {"_id": pid, "ten_san_pham": name} for pid, name in zip(PRODUCT_IDS, PRODUCT_NAMES)}
+
+
+def product_cache():
+    """product_cache cho cart_api._serialize_item (projection ten_san_pham/gia/hinh_anh)."""
+    return {
+        pid: {"_id": pid, "ten_san_pham": name, "gia": 35000 + i * 15000,
+              "hinh_anh": [f"sanpham/sp{i}.3f2a9c1b7d4e.jpg"]}
+        for i, (pid, name) in enumerate(zip(PRODUCT_IDS, PRODUCT_NAMES))
+    }
+
+
+def order(n_items=3):
+    """Đơn đặt từ giỏ: items + nguoi_nhan + đủ alias legacy (_apply_receiver_aliases, _add_legacy_fields)."""
+    items = [
+        {"san_pham_id": pid, "so_luong": i + 1, "don_gia": 35000 + i * 15000,
+         "tong_tien": (i + 1) * (35000 + i * 15000)}
+        for i, pid in enumerate(PRODUCT_IDS[:n_items])
+    ]
+    receiver = {"ten": "Nguyễn Thị Mai", "sdt": "0912345678", "dia_chi": "12 Quang Trung, Gò Vấp, TP.HCM",
+                "ghi_chu": "Giao giờ hành chính"}
+    return {
+        "_id": ObjectId("66c000000000000000000001"),
+        "tai_khoan_id": ACCOUNT_ID,
+        "items": items,
+        "tong_tien": sum(it["tong_tien"] for it in items),
+        "phuong_thuc_thanh_toan": "vnpay",
+        "trang_thai": "da_xac_nhan",
+        "ngay_tao": NOW - timedelta(days=3),
+        "nguon_dat": "cart",
+        "nguoi_nhan": receiver,
+        "ho_ten": receiver["ten"], "ho_va_ten": receiver["ten"], "ten_nguoi_nhan": receiver["ten"],
+        "so_dien_thoai": receiver["sdt"], "sdt": receiver["sdt"], "phone": receiver["sdt"],
+        "sdt_nguoi_nhan": receiver["sdt"],
+        "dia_chi": receiver["dia_chi"], "address": receiver["dia_chi"], "dia_chi_giao_hang": receiver["dia_chi"],
+        "ghi_chu": receiver["ghi_chu"], "note": receiver["ghi_chu"],
+        "san_pham_id": items[0]["san_pham_id"], "so_luong": items[0]["so_luong"], "don_gia": items[0]["don_gia"],
+    }
+
+
+def legacy_order():
+    """Đơn cũ 1 SP/đơn, không có nguoi_nhan -> mọi _pick phải rơi xuống tài khoản (nhánh chậm nhất)."""
+    return {
+        "_id": ObjectId("66c000000000000000000002"),
+        "tai_khoan_id": ACCOUNT_ID,
+        "san_pham_id": PRODUCT_IDS[0],
+        "so_luong": 2,
+        "don_gia": 85000,
+        "tong_tien": 170000,
+        "trang_thai": "hoan_thanh",
+        "ngay_tao": (NOW - timedelta(days=400)).replace(tzinfo=None),  # bản ghi cũ lưu naive UTC
+    }
+
+
+def cart_item(i=0):
+    pid = PRODUCT_IDS[i % len(PRODUCT_IDS)]
+    return {"_id": ObjectId("66d0000000000000000000%02x" % (i + 1)), "tai_khoan_id": ACCOUNT_ID,
+            "san_pham_id": pid, "ngay_tao": NOW, "so_luong": 2, "don_gia": 85000, "tong_tien": 170000}
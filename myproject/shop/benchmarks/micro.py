@@ -0,0 +1,203 @@
+# shop/benchmarks/micro.py
+"""
+Đo ns/op (timeit, lấy median của nhiều lần lặp) và cấp phát bộ nhớ (tracemalloc)
+cho từng case. Mỗi case là hàm không tham số trả về callable cần đo; fixture được
+tạo 1 lần ngoài vòng đo.
+"""
+import json
+import statistics
+import timeit
+import tracemalloc
+
+from . import fixtures
+
+CASES = {}
+
+
+def case(name):
+    def _register(factory):
+        CASES[name] = factory
+        return factory
+    return _register
+
+
+# =================== CASES ===================
+@case("donhang_view._serialize_order")
+def _serialize_order_case():
+    from ..views.donhang_view import _serialize_order
+    doc, acc, sp_map = fixtures.order(), fixtures.account(), fixtures.product_map()
+    return lambda: _serialize_order(doc, acc=acc, sp_map=sp_map)
+
+
+@case("donhang_view._serialize_order[8 items]")
+def _serialize_order_big_case():
+    from ..views.donhang_view import _serialize_order
+    doc, acc, sp_map = fixtures.order(8), fixtures.account(), fixtures.product_map()
+    return lambda: _serialize_order(doc, acc=acc, sp_map=sp_map)
+
+
+@case("donhang_view._merge_receiver_from_doc")
+def _merge_receiver_case():
+    from ..views.donhang_view import _merge_receiver_from_doc
+    doc, acc = fixtures.order(), fixtures.account()
+    return lambda: _merge_receiver_from_doc(doc, acc)
+
+
+@case("donhang_view._merge_receiver_from_doc[legacy]")
+def _merge_receiver_legacy_case():
+    from ..views.donhang_view import _merge_receiver_from_doc
+    doc, acc = fixtures.legacy_order(), fixtures.account()
+    return lambda: _merge_receiver_from_doc(doc, acc)
+
+
+@case("donhang_site._serialize")
+def _site_serialize_case():
+    from ..views.donhang_site import _serialize
+    doc, acc, sp_map = fixtures.order(), fixtures.account(), fixtures.product_map()
+    return lambda: _serialize(doc, sp_map=sp_map, acc=acc)
+
+
+@case("donhang_site._serialize[legacy]")
+def _site_serialize_legacy_case():
+    from ..views.donhang_site import _serialize
+    doc, acc, sp_map = fixtures.legacy_order(), fixtures.account(), fixtures.product_map()
+    sp = sp_map[doc["san_pham_id"]]
+    return lambda: _serialize(doc, sp=sp, acc=acc)
+
+
+@case("cart_api._serialize_item")
+def _cart_item_case():
+    from ..views.cart_api import _serialize_item
+    doc = fixtures.cart_item()
+    return lambda: _serialize_item(doc)
+
+
+@case("cart_api._serialize_item[include_product]")
+def _cart_item_product_case():
+    from ..views.cart_api import _serialize_item
+    # product_cache đã đủ -> không chạm DB, chỉ đo phần Python
+    doc, cache = fixtures.cart_item(), fixtures.product_cache()
+    return lambda: _serialize_item(doc, include_product=True, product_cache=cache)
+
+
+@case("sanpham._build_page_numbers")
+def _page_numbers_case():
+    from ..views.sanpham import _build_page_numbers
+    return lambda: _build_page_numbers(48, 120)
+
+
+@case("sanpham._build_page_numbers[short]")
+def _page_numbers_short_case():
+    from ..views.sanpham import _build_page_numbers
+    return lambda: _build_page_numbers(2, 5)
+
+
+def _orders_payload(n=100):
+    from ..views.donhang_view import _serialize_order
+    acc, sp_map = fixtures.account(), fixtures.product_map()
+    return {"items": [_serialize_order(fixtures.order(1 + i % 4), acc=acc, sp_map=sp_map) for i in range(n)],
+            "total": n, "page": 1, "page_size": n}
+
+
+@case("json.orders[100] JsonResponse+str()")
+def _json_old_case():
+    # đường cũ: str() / isoformat từng field rồi JsonResponse (json stdlib + DjangoJSONEncoder)
+    from django.core.serializers.json import DjangoJSONEncoder
+    from ..views.donhang_view import _to_local_iso
+    payload = _orders_payload()
+
+    def _stringify(o):
+        return {**o, "id": str(o["id"]), "tai_khoan_id": str(o["tai_khoan_id"]), "ngay_tao": _to_local_iso(o["ngay_tao"]),
+                "items": [{**it, "san_pham_id": str(it["san_pham_id"])} for it in o["items"]]}
+    return lambda: json.dumps({**payload, "items": [_stringify(o) for o in payload["items"]]},
+                              cls=DjangoJSONEncoder).encode()
+
+
+@case("json.orders[100] FastJsonResponse[stdlib]")
+def _json_stdlib_case():
+    from ..responses import dumps_stdlib
+    payload = _orders_payload()
+    return lambda: dumps_stdlib(payload)
+
+
+@case("json.orders[100] FastJsonResponse")
+def _json_fast_case():
+    # orjson nếu đã cài (xem responses.HAS_ORJSON), không thì giống case [stdlib]
+    from ..responses import dumps
+    payload = _orders_payload()
+    return lambda: dumps(payload)
+
+
+# =================== RUNNER ===================
+def _autorange(timer, min_time):
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            return number
+        number *= 2
+
+
+def measure_allocations(fn, calls=200):
+    """
+    - alloc_peak_bytes: đỉnh bộ nhớ tạm trong 1 lần gọi (gồm cả object trung gian)
+    - alloc_blocks / alloc_bytes: số block / byte còn giữ lại mỗi lần gọi (kết quả trả về)
+    """
+    fn()  # import lười, cache... không tính
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+
+        keep = []
+        before = tracemalloc.take_snapshot()
+        for _ in range(calls):
+            keep.append(fn())
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    diff = [d for d in after.compare_to(before, "filename") if d.size_diff > 0]
+    blocks = sum(d.count_diff for d in diff)
+    size = sum(d.size_diff for d in diff) - 8 * calls  # trừ con trỏ trong list `keep`
+    return {
+        "alloc_peak_bytes": max(0, peak - base),
+        "alloc_blocks": round(blocks / calls, 1),
+        "alloc_bytes": max(0, round(size / calls)),
+    }
+
+
+def run_case(fn, repeat=7, min_time=0.2):
+    timer = timeit.Timer(fn)
+    number = _autorange(timer, min_time / 4)
+    runs = [t / number * 1e9 for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "ns_per_op": round(statistics.median(runs), 1),
+        "ns_min": round(min(runs), 1),
+        "ns_stdev": round(statistics.stdev(runs), 1) if len(runs) > 1 else 0.0,
+        "loops": number,
+        "repeat": repeat,
+        **measure_allocations(fn),
+    }
+
+
+def run(names=None, repeat=7, min_time=0.2, progress=None):
+    results = {}
+    for name, factory in CASES.items():
+        if names and not any(n in name for n in names):
+            continue
+        results[name] = run_case(factory(), repeat=repeat, min_time=min_time)
+        if progress:
+            progress(name, results[name])
+    return results
+
+
+def compare(before: dict, after: dict):
+    """[(case, ns trước, ns sau, % thay đổi)] cho các case có ở cả 2 lần chạy."""
+    out = []
+    for name, r in after.items():
+        old = before.get(name)
+        if old and old.get("ns_per_op"):
+            out.append((name, old["ns_per_op"], r["ns_per_op"],
+                        (r["ns_per_op"] - old["ns_per_op"]) / old["ns_per_op"] * 100))
+    return out
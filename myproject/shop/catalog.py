@@ -0,0 +1,61 @@
+# shop/catalog.py
+"""
+Phiên bản catalog: 1 số nguyên tăng mỗi khi sản phẩm thay đổi theo cách làm lệch số liệu
+tổng hợp (thêm / xoá sản phẩm, đổi gia, danh_muc_id hoặc tên). Cache gắn version vào key ->
+bump 1 lần là mọi worker bỏ cache cũ, không phải xoá từng key.
+
+    key = cache_key("facets")        # "shop.catalog:facets:v42"
+    bump_version()                   # sau khi ghi san_pham
+
+- version lưu ở Mongo (cau_hinh._id = "catalog") nên mọi worker thấy chung
+- mỗi worker nhớ version CATALOG_VERSION_TTL giây -> tối đa 1 lệnh đọc / TTL / worker,
+  worker khác thấy thay đổi chậm tối đa chừng đó
+- tồn kho, da_ban, luot_xem KHÔNG bump (không đổi số đếm theo danh mục / dải giá)
+"""
+import threading
+import time
+
+from django.conf import settings
+from pymongo import ReturnDocument
+
+from .database import cau_hinh
+
+KEY_PREFIX = "shop.catalog"
+DOC_ID = "catalog"
+# field của san_pham mà dữ liệu tổng hợp phụ thuộc vào (tên: số đếm theo từ khoá q)
+FACET_FIELDS = ("gia", "danh_muc_id", "ten", "ten_san_pham")
+
+_lock = threading.Lock()
+_local = {"version": None, "expires": 0.0}
+
+
+def _remember(version):
+    with _lock:
+        _local["version"] = version
+        _local["expires"] = time.monotonic() + float(getattr(settings, "CATALOG_VERSION_TTL", 5))
+    return version
+
+
+def catalog_version() -> int:
+    with _lock:
+        if _local["version"] is not None and time.monotonic() < _local["expires"]:
+            return _local["version"]
+    doc = cau_hinh.find_one({"_id": DOC_ID}, {"version": 1})
+    return _remember(int((doc or {}).get("version", 0)))
+
+
+def bump_version() -> int:
+    doc = cau_hinh.find_one_and_update(
+        {"_id": DOC_ID}, {"$inc": {"version": 1}},
+        projection={"version": 1}, upsert=True, return_document=ReturnDocument.AFTER,
+    )
+    return _remember(int(doc["version"]))
+
+
+def touches_facets(update: dict) -> bool:
+    """update ($set của san_pham) có đổi field mà dữ liệu tổng hợp phụ thuộc không."""
+    return any(f in update for f in FACET_FIELDS)
+
+
+def cache_key(name: str) -> str:
+    return f"{KEY_PREFIX}:{name}:v{catalog_version()}"
@@ -0,0 +1,102 @@
+# shop/concurrency.py
+"""
+Chạy song song các lệnh Mongo độc lập trong 1 view (fan-out), dùng chung 1 thread pool:
+
+    cats, total, rows = gather(
+        lambda: list(danh_muc.find(...)),
+        lambda: san_pham.count_documents(filter_),
+        lambda: list(san_pham.find(filter_).limit(12)),
+        request=request,
+    )
+
+- thời gian ≈ lệnh chậm nhất thay vì tổng các lệnh (pymongo thread-safe, có pool kết nối)
+- hàm đầu tiên chạy ngay trên thread của request, các hàm còn lại vào pool
+- mỗi hàm chạy trong bản sao contextvars của request -> lệnh vẫn được đếm vào
+  request.mongo_stats (Server-Timing, ngân sách, slow query log)
+- deadline theo request: FANOUT_REQUEST_TIMEOUT giây tính từ lần gather đầu tiên; quá hạn ->
+  DeadlineExceeded, các hàm chưa chạy bị huỷ; view bắt lỗi này và bỏ phần số liệu phụ
+  (dashboard: thẻ tổng quan) thay vì trả 500
+- optional=(vị trí...): quá hạn thì chỉ bỏ các hàm đó (kết quả MISSING), hàm còn lại chờ xong bình
+  thường, kết quả đã có giữ nguyên (sanpham_list: bỏ số đếm, vẫn dùng trang sản phẩm đã đọc)
+- gọi gather() từ trong 1 hàm đang chạy ở pool thì chạy tuần tự (tránh pool tự chờ chính nó)
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(getattr(settings, "FANOUT_WORKERS", 16)),
+    thread_name_prefix="fanout",
+)
+_local = threading.local()
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+MISSING = object()  # kết quả của hàm optional bị bỏ khi hết hạn
+
+
+def request_deadline(request):
+    """time.monotonic() mà mọi gather() của request phải xong trước đó."""
+    deadline = getattr(request, "_fanout_deadline", None)
+    if deadline is None:
+        deadline = time.monotonic() + float(getattr(settings, "FANOUT_REQUEST_TIMEOUT", 10))
+        if request is not None:
+            request._fanout_deadline = deadline
+    return deadline
+
+
+def _in_pool(fn):
+    def _run():
+        _local.in_pool = True
+        try:
+            return fn()
+        finally:
+            _local.in_pool = False
+    return _run
+
+
+def _raise_failed(futures):
+    for f in futures:
+        if f.exception() is not None:
+            raise f.exception()
+
+
+def gather(*fns, request=None, timeout=None, optional=()):
+    """
+    Kết quả theo đúng thứ tự fns. Lỗi của bất kỳ hàm nào được raise lại ở đây.
+    optional: vị trí (trong fns) được phép bỏ khi hết hạn -> MISSING; khi đó các hàm còn lại được
+    chờ xong thay vì DeadlineExceeded (chạy lại còn tốn hơn chờ).
+    """
+    if len(fns) <= 1 or getattr(_local, "in_pool", False):
+        return [fn() for fn in fns]
+
+    deadline = request_deadline(request)
+    if timeout is not None:
+        deadline = min(deadline, time.monotonic() + timeout)
+
+    futures = [_executor.submit(contextvars.copy_context().run, _in_pool(fn)) for fn in fns[1:]]
+    skipped = set()
+    try:
+        first = fns[0]()
+        done, pending = wait(futures, timeout=max(0.0, deadline - time.monotonic()),
+                             return_when=FIRST_EXCEPTION)
+        _raise_failed(done)
+        if pending and not optional:
+            raise DeadlineExceeded(f"fan-out: {len(pending)}/{len(fns)} lệnh chưa xong khi hết hạn")
+        if pending:
+            dropped = {f for i, f in enumerate(futures, start=1) if i in optional and f in pending}
+            # hàm optional vừa xong giữa 2 bước thì vẫn dùng được
+            skipped = {f for f in dropped if f.cancel() or not f.done() or f.exception() is not None}
+            done, _ = wait(pending - dropped, return_when=FIRST_EXCEPTION)
+            _raise_failed(done)
+    except BaseException:
+        for f in futures:
+            f.cancel()
+        raise
+    return [first] + [MISSING if f in skipped else f.result() for f in futures]
@@ -0,0 +1,131 @@
+# shop/counters.py
+"""
+Bộ đếm ghi trễ (write-behind) cho các field kiểu luot_xem: trang chi tiết sản phẩm chỉ cộng
+vào dict trong RAM, không thêm lệnh ghi nào vào đường đọc nóng nhất.
+
+    product_views.add(sp_id)          # O(1), 1 lock
+
+- mỗi worker gộp số đếm theo _id; thread nền đẩy xuống Mongo mỗi VIEW_COUNTER_FLUSH_INTERVAL
+  giây, hoặc sớm hơn khi buffer có VIEW_COUNTER_MAX_KEYS _id -> 1 bulk_write unordered ($inc)
+- flush lần cuối khi process thoát (atexit); worker bị kill -9 mất tối đa 1 chu kỳ đếm
+- lỗi ghi -> số đếm được cộng trả lại buffer, lần sau ghi tiếp; BulkWriteError (unordered:
+  các op khác đã ghi) -> chỉ trả lại các op nằm trong writeErrors, tránh đếm 2 lần
+- VIEW_COUNTER_FLUSH_INTERVAL = 0: không chạy thread nền (test), chỉ flush khi đầy / khi thoát
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from .database import san_pham
+
+logger = logging.getLogger(__name__)
+
+VIEWS = "luot_xem"
+
+
+class BufferedCounter:
+    def __init__(self, collection, field, indexes=()):
+        self.collection = collection
+        self.field = field
+        self.indexes = list(indexes)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self._pending = {}   # _id -> số cần $inc
+        self._wake = threading.Event()
+        self._flusher = None
+        self._indexed = False
+
+    def _check_fork(self):
+        # gunicorn --preload: con kế thừa buffer của cha -> bỏ, tránh đếm 2 lần
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def _interval(self):
+        return float(getattr(settings, "VIEW_COUNTER_FLUSH_INTERVAL", 10))
+
+    def add(self, key, n=1):
+        with self._lock:
+            self._check_fork()
+            self._pending[key] = self._pending.get(key, 0) + n
+            full = len(self._pending) >= int(getattr(settings, "VIEW_COUNTER_MAX_KEYS", 5000))
+        if self._interval() <= 0:
+            if full:
+                self.flush()
+            return
+        self._ensure_flusher()
+        if full:
+            self._wake.set()
+
+    def pending(self, key=None):
+        """Số đếm chưa ghi xuống Mongo (của worker này)."""
+        with self._lock:
+            return dict(self._pending) if key is None else self._pending.get(key, 0)
+
+    # ----- ghi xuống Mongo -----
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name=f"counter-{self.field}", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        me = self._flusher
+        while self._flusher is me:  # sau fork thread cũ không còn, con tự tạo thread mới
+            self._wake.wait(self._interval())
+            self._wake.clear()
+            self.flush()
+
+    def _ensure_indexes(self):
+        if not self._indexed:
+            for keys in self.indexes:
+                self.collection.create_index(keys)
+            self._indexed = True
+
+    def flush(self) -> int:
+        """Ghi mọi số đếm đang chờ bằng 1 bulk_write unordered. Return: số _id đã ghi."""
+        with self._flush_lock:
+            with self._lock:
+                self._check_fork()
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            keys = list(batch)
+            ops = [UpdateOne({"_id": k}, {"$inc": {self.field: batch[k]}}) for k in keys]
+            try:
+                self._ensure_indexes()
+                self.collection.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                failed = {keys[err["index"]] for err in e.details.get("writeErrors", [])}
+                logger.error("Bộ đếm %s: %d/%d _id ghi lỗi, giữ lại cho lần sau: %s",
+                             self.field, len(failed), len(keys), e.details.get("writeErrors", [])[:3])
+                self._requeue({k: batch[k] for k in failed})
+                return len(keys) - len(failed)
+            except PyMongoError:
+                logger.exception("Không ghi được bộ đếm %s (%d _id), giữ lại cho lần sau", self.field, len(batch))
+                self._requeue(batch)
+                return 0
+            return len(batch)
+
+    def _requeue(self, batch):
+        with self._lock:
+            for k, n in batch.items():
+                self._pending[k] = self._pending.get(k, 0) + n
+
+
+product_views = BufferedCounter(san_pham, VIEWS, indexes=[
+    [(VIEWS, -1), ("_id", -1)],
+    [("danh_muc_id", 1), (VIEWS, -1), ("_id", -1)],
+])
+atexit.register(product_views.flush)
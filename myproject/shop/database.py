@@ -1,11 +1,15 @@
 # database.py
+from django.conf import settings
 from pymongo import MongoClient
+from .instrumentation import query_listener
 
-# Kết nối MongoDB. Nếu bạn dùng Atlas, thay chuỗi host bên dưới bằng URI Atlas.
-client = MongoClient("mongodb://localhost:27017/", uuidRepresentation="standard")
+# Kết nối MongoDB: URI / tên DB lấy từ settings (MONGO_URI, MONGO_DB_NAME).
+# query_listener: đếm lệnh Mongo theo request (Server-Timing, log vượt ngân sách)
+client = MongoClient(settings.MONGO_URI, uuidRepresentation="standard",
+                     event_listeners=[query_listener])
 
-# Chọn database
-db = client["TraiCay"]
+# Chọn database ("TraiCay", khi chạy test là "TraiCay_test")
+db = client[settings.MONGO_DB_NAME]
 
 # Giờ bạn có db.tai_khoan, db.san_pham, db.danh_muc, db.gio_hang, db.don_hang
 # Các collection
@@ -13,4 +17,8 @@ tai_khoan = db["tai_khoan"]
 danh_muc  = db["danh_muc"]
 san_pham  = db["san_pham"]
 gio_hang  = db["gio_hang"]
-don_hang  = db["don_hang"]
\ No newline at end of file
+don_hang  = db["don_hang"]
+slow_queries = db["slow_queries"]  # capped, tạo bởi shop/slowlog.py
+slow_query_stats = db["slow_query_stats"]  # số lần chậm theo (shape, giờ), shop/slowlog.py
+sessions = db["django_session"]        # SESSION_ENGINE = "shop.sessions" (TTL index)
+cau_hinh = db["cau_hinh"]              # {_id: "catalog", version} — shop/catalog.py
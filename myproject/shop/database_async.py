@@ -0,0 +1,32 @@
+# shop/database_async.py
+"""
+Kết nối MongoDB bất đồng bộ cho các view async (shop/views/async_api.py), chỉ dùng khi
+chạy qua ASGI (myproject/asgi.py bật settings.ASYNC_API).
+
+Ưu tiên AsyncMongoClient của pymongo (>= 4.10), không có thì dùng Motor. Cùng
+query_listener với shop/database.py nên Server-Timing / metrics / slow query log vẫn đúng
+(với Motor lệnh chạy trong thread pool của Motor nên không gắn được vào request).
+Client không kết nối khi import; kết nối lần đầu trên event loop của worker.
+"""
+from django.conf import settings
+
+from .instrumentation import query_listener
+
+try:
+    from pymongo import AsyncMongoClient
+    DRIVER = "pymongo"
+except ImportError:  # pymongo cũ -> Motor
+    from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+    DRIVER = "motor"
+
+client = AsyncMongoClient(settings.MONGO_URI, uuidRepresentation="standard",
+                          event_listeners=[query_listener])
+
+db = client[settings.MONGO_DB_NAME]
+
+# Các collection (cùng tên với shop/database.py)
+tai_khoan = db["tai_khoan"]
+danh_muc  = db["danh_muc"]
+san_pham  = db["san_pham"]
+gio_hang  = db["gio_hang"]
+don_hang  = db["don_hang"]
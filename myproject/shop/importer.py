@@ -0,0 +1,202 @@
+# shop/importer.py
+"""
+Import sản phẩm hàng loạt từ CSV / JSONL (dùng chung cho `manage.py import_products`
+và API admin /api/products/import/).
+
+- Đọc từng dòng (stream) -> bộ nhớ không phụ thuộc kích thước file
+- Tên danh mục -> danh_muc_id qua 1 map nạp sẵn (1 query cho cả file)
+- Upsert bằng bulk_write theo lô BATCH_SIZE thao tác, lỗi báo theo từng dòng
+"""
+import csv
+import io
+import json
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from . import pricing
+from .catalog import bump_version
+from .database import san_pham, danh_muc
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ("csv", "jsonl")
+
+
+def guess_format(filename: str, default="csv") -> str:
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if name.endswith(".csv"):
+        return "csv"
+    return default
+
+
+def iter_rows(binary_stream, fmt: str):
+    """Yield (số dòng, dict) từ stream bytes."""
+    text = io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_no, ValueError("JSON không hợp lệ")
+            continue
+        yield line_no, row
+
+
+class CategoryMap:
+    """ten_danh_muc (không phân biệt hoa thường) -> ObjectId, nạp 1 lần."""
+
+    def __init__(self, create_missing=False):
+        self.create_missing = create_missing
+        self._map = {}
+        for c in danh_muc.find({}, {"ten": 1, "ten_danh_muc": 1}):
+            for name in (c.get("ten_danh_muc"), c.get("ten")):
+                if name:
+                    self._map.setdefault(name.strip().lower(), c["_id"])
+
+    def resolve(self, value):
+        if isinstance(value, ObjectId):
+            return value
+        value = str(value or "").strip()
+        if not value:
+            return None
+        if ObjectId.is_valid(value):
+            return ObjectId(value)
+        key = value.lower()
+        if key not in self._map:
+            if not self.create_missing:
+                raise ValueError(f"Danh mục không tồn tại: {value}")
+            self._map[key] = danh_muc.insert_one({"ten_danh_muc": value}).inserted_id
+        return self._map[key]
+
+
+def _to_int(v, field):
+    if v is None or v == "":
+        return None
+    try:
+        return int(str(v).replace(",", "").strip())
+    except ValueError:
+        raise ValueError(f"{field} phải là số")
+
+
+def _to_str(v) -> str:
+    # JSONL có thể chứa số / null ở field text
+    return "" if v is None else str(v).strip()
+
+
+def row_to_operation(row: dict, categories: CategoryMap) -> UpdateOne:
+    """Chuyển 1 dòng thành UpdateOne(upsert). Key: id nếu có, không thì ten_san_pham."""
+    if not isinstance(row, dict):
+        raise ValueError("Dòng phải là object")
+
+    ten = _to_str(row.get("ten_san_pham") or row.get("ten"))
+    raw_id = _to_str(row.get("id") or row.get("_id"))
+    if raw_id and not ObjectId.is_valid(raw_id):
+        raise ValueError("id không hợp lệ")
+    if not ten and not raw_id:
+        raise ValueError("Thiếu ten_san_pham")
+
+    fields = {}
+    if ten:
+        fields["ten_san_pham"] = ten
+    if "mo_ta" in row:
+        fields["mo_ta"] = _to_str(row.get("mo_ta"))
+    gia = _to_int(row.get("gia"), "gia")
+    if gia is not None:
+        if gia < 0:
+            raise ValueError("gia phải >= 0")
+        fields["gia"] = gia
+    slt = _to_int(row.get("so_luong_ton"), "so_luong_ton")
+    if slt is not None:
+        fields["so_luong_ton"] = max(0, slt)
+
+    cat = row.get("danh_muc") or row.get("ten_danh_muc") or row.get("danh_muc_id")
+    if cat:
+        fields["danh_muc_id"] = categories.resolve(cat)
+
+    imgs = row.get("hinh_anh")
+    if isinstance(imgs, str):
+        imgs = imgs.split("|")
+    elif imgs is not None and not isinstance(imgs, list):
+        raise ValueError("hinh_anh phải là chuỗi (ngăn cách bởi |) hoặc danh sách")
+    imgs = [p for p in map(_to_str, imgs or []) if p]
+    if imgs:
+        fields["hinh_anh"] = imgs
+
+    filter_ = {"_id": ObjectId(raw_id)} if raw_id else {"ten_san_pham": ten}
+    on_insert = {} if "hinh_anh" in fields else {"hinh_anh": []}
+    if "so_luong_ton" not in fields:
+        on_insert["so_luong_ton"] = 0
+    update = {"$set": fields}
+    if on_insert:
+        update["$setOnInsert"] = on_insert
+    return UpdateOne(filter_, update, upsert=True)
+
+
+def import_products(binary_stream, fmt="csv", batch_size=BATCH_SIZE,
+                    create_categories=False, progress=None) -> dict:
+    """
+    Return report: {"rows", "inserted", "updated", "failed", "errors": [{"row", "error"}]}
+    progress: callable(report) gọi sau mỗi lô (dùng cho command in tiến độ).
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format phải là một trong {FORMATS}")
+
+    # upsert theo tên cần index, không thì mỗi thao tác là 1 COLLSCAN
+    san_pham.create_index("ten_san_pham")
+    categories = CategoryMap(create_missing=create_categories)
+    report = {"rows": 0, "inserted": 0, "updated": 0, "failed": 0, "errors": []}
+
+    def _error(line_no, msg):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": line_no, "error": msg})
+
+    ops, lines = [], []
+
+    def _flush():
+        if not ops:
+            return
+        try:
+            res = san_pham.bulk_write(ops, ordered=False)
+            report["inserted"] += res.upserted_count
+            report["updated"] += res.matched_count
+        except BulkWriteError as e:
+            det = e.details or {}
+            report["inserted"] += det.get("nUpserted", 0)
+            report["updated"] += det.get("nMatched", 0)
+            for we in det.get("writeErrors", []):
+                _error(lines[we["index"]], we.get("errmsg", "write error"))
+        ops.clear()
+        lines.clear()
+        if progress:
+            progress(report)
+
+    for line_no, row in iter_rows(binary_stream, fmt):
+        report["rows"] += 1
+        if isinstance(row, Exception):
+            _error(line_no, str(row))
+            continue
+        try:
+            ops.append(row_to_operation(row, categories))
+            lines.append(line_no)
+        except ValueError as e:
+            _error(line_no, str(e))
+            continue
+        if len(ops) >= batch_size:
+            _flush()
+    _flush()
+    if report["inserted"] or report["updated"]:
+        pricing.invalidate()  # nhiều dòng đổi giá -> tính lại cả bảng khi đọc
+        bump_version()
+    return report
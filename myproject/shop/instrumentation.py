@@ -0,0 +1,266 @@
+# shop/instrumentation.py
+"""
+Đo số lệnh Mongo theo từng request (pymongo command monitoring).
+
+- QueryStatsListener: đăng ký trên MongoClient trong shop/database.py
+- QueryStatsMiddleware: gắn stats vào request, trả header Server-Timing,
+  log 1 dòng JSON khi vượt MONGO_QUERY_BUDGET, hiện panel nhỏ khi DEBUG
+- lệnh đọc chậm hơn MONGO_SLOW_QUERY_MS được chuyển cho shop/slowlog.py (explain nền)
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.html import escape
+from pymongo import monitoring
+
+from .slowlog import EXPLAINABLE, slow_query_log, threshold_ms
+
+logger = logging.getLogger("shop.mongo")
+
+MAX_RECORDED_COMMANDS = 200
+# Lệnh nội bộ của driver, không tính vào request
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue",
+                    "buildInfo", "getnonce", "authenticate", "killCursors"}
+
+_current = contextvars.ContextVar("mongo_query_stats", default=None)
+
+
+# =================== QUERY SHAPE ===================
+def _shape_value(v):
+    if isinstance(v, dict):
+        return {k: (_shape_value(x) if k.startswith("$") or isinstance(x, dict) else "?") for k, x in v.items()}
+    if isinstance(v, list):
+        return [_shape_value(x) for x in v[:1]] if v and isinstance(v[0], dict) else "?"
+    return "?"
+
+
+def _collection_of(command_name, command):
+    coll = command.get(command_name)
+    return coll if isinstance(coll, str) else ""
+
+
+def query_shape(command_name: str, command: dict) -> str:
+    """
+    Dạng "chuẩn hoá" của câu lệnh, giá trị thay bằng "?":
+      find san_pham {"danh_muc_id": "?"} sort={"_id": "?"}
+    Dùng để gom nhóm trong báo cáo / test budget / slow query log.
+    """
+    coll = _collection_of(command_name, command)
+    if command_name in ("find", "count", "delete", "distinct"):
+        body = command.get("filter") or command.get("query") or {}
+        if command_name == "delete":
+            body = [d.get("q", {}) for d in (command.get("deletes") or [])[:1]]
+        extra = f" sort={json.dumps(_shape_value(command['sort']), default=str)}" if command.get("sort") else ""
+        return f"{command_name} {coll} {json.dumps(_shape_value(body), default=str, sort_keys=True)}{extra}"
+    if command_name == "aggregate":
+        stages = []
+        for st in command.get("pipeline") or []:
+            name = next(iter(st), "?")
+            if name == "$match":
+                stages.append(f"$match{json.dumps(_shape_value(st[name]), default=str, sort_keys=True)}")
+            elif name == "$lookup":
+                stages.append(f"$lookup({st[name].get('from', '?')})")
+            else:
+                stages.append(name)
+        return f"aggregate {coll} [{', '.join(stages)}]"
+    if command_name in ("update", "findAndModify"):
+        q = command.get("query")
+        if q is None:
+            q = ((command.get("updates") or [{}])[0] or {}).get("q", {})
+        return f"{command_name} {coll} {json.dumps(_shape_value(q), default=str, sort_keys=True)}"
+    return f"{command_name} {coll}".strip()
+
+
+# =================== PER-REQUEST STATS ===================
+class RequestQueryStats:
+    def __init__(self, request=None):
+        self.request = request  # để slow query log biết URL name / path
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest = None  # (ms, shape)
+        self.commands = []   # [(shape, ms, ok)] tối đa MAX_RECORDED_COMMANDS
+        self._lock = threading.Lock()  # có thể ghi từ nhiều thread (fan-out)
+
+    def record(self, shape: str, duration_ms: float, ok: bool = True):
+        with self._lock:
+            self.count += 1
+            self.total_ms += duration_ms
+            if self.slowest is None or duration_ms > self.slowest[0]:
+                self.slowest = (duration_ms, shape)
+            if len(self.commands) < MAX_RECORDED_COMMANDS:
+                self.commands.append((shape, duration_ms, ok))
+
+    def shapes(self):
+        """{shape: số lần} — dùng cho báo cáo lệnh lặp (N+1)."""
+        out = {}
+        for shape, _, _ in self.commands:
+            out[shape] = out.get(shape, 0) + 1
+        return out
+
+
+def current_stats():
+    return _current.get()
+
+
+class track_queries:
+    """
+    with track_queries() as stats: ...   (dùng ngoài request: command, test, benchmark)
+    """
+
+    def __enter__(self):
+        self.stats = RequestQueryStats()
+        self._token = _current.set(self.stats)
+        return self.stats
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+        return False
+
+
+class QueryStatsListener(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        stats = _current.get()
+        if stats is None or event.command_name in IGNORED_COMMANDS:
+            return
+        # chỉ giữ lại lệnh gốc khi có thể cần explain (slow query log)
+        keep = event.command_name in EXPLAINABLE and threshold_ms() is not None
+        self._pending[(event.connection_id, event.request_id)] = (
+            stats, query_shape(event.command_name, event.command),
+            (event.database_name, event.command_name, event.command) if keep else None,
+        )
+
+    def _finish(self, event, ok):
+        item = self._pending.pop((event.connection_id, event.request_id), None)
+        if item is None:
+            return
+        stats, shape, original = item
+        duration_ms = event.duration_micros / 1000.0
+        stats.record(shape, duration_ms, ok)
+        if ok and original and duration_ms >= threshold_ms():
+            request = stats.request
+            slow_query_log.submit(*original, shape, duration_ms,
+                                  url_name=_url_name(request) if request is not None else None,
+                                  path=getattr(request, "path", None))
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+
+query_listener = QueryStatsListener()
+
+
+# =================== MIDDLEWARE ===================
+def _server_timing(stats: RequestQueryStats) -> str:
+    parts = [f'mongo;dur={stats.total_ms:.2f};desc="{stats.count} cmds"']
+    if stats.slowest:
+        ms, shape = stats.slowest
+        label = shape.split(" {")[0].split(" [")[0].replace('"', "'")
+        parts.append(f'mongo-slowest;dur={ms:.2f};desc="{label}"')
+    return ", ".join(parts)
+
+
+def _panel_html(request, stats: RequestQueryStats, elapsed_ms: float) -> str:
+    rows = "".join(
+        f"<tr><td style='padding:2px 6px;text-align:right'>{n}×</td>"
+        f"<td style='padding:2px 6px;font-family:monospace'>{escape(shape)}</td></tr>"
+        for shape, n in sorted(stats.shapes().items(), key=lambda kv: -kv[1])
+    )
+    return (
+        "<details id='mongo-panel' style='position:fixed;bottom:8px;left:8px;z-index:99999;"
+        "max-width:70vw;max-height:50vh;overflow:auto;background:#263238;color:#eceff1;"
+        "font-size:12px;border-radius:8px;padding:6px 10px;opacity:.92'>"
+        f"<summary style='cursor:pointer'>Mongo: {stats.count} lệnh · {stats.total_ms:.1f} ms"
+        f" / {elapsed_ms:.1f} ms · {escape(_url_name(request))}</summary>"
+        f"<table>{rows}</table></details>"
+    )
+
+
+def _url_name(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    if match and match.url_name:
+        return f"{match.namespace}:{match.url_name}" if match.namespace else match.url_name
+    return request.path
+
+
+class QueryStatsMiddleware:
+    """Gắn request.mongo_stats, thêm Server-Timing, log request vượt ngân sách. Chạy được cả sync / async."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        budget = getattr(settings, "MONGO_QUERY_BUDGET", {}) or {}
+        self.max_commands = budget.get("commands")
+        self.max_ms = budget.get("ms")
+        self.panel = bool(getattr(settings, "MONGO_DEBUG_PANEL", False))
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestQueryStats(request)
+        request.mongo_stats = stats
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._report(request, response, stats, elapsed_ms)
+        return response
+
+    async def __acall__(self, request):
+        # contextvar theo task: request chạy song song trên cùng event loop không lẫn stats
+        stats = RequestQueryStats(request)
+        request.mongo_stats = stats
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._report(request, response, stats, elapsed_ms)
+        return response
+
+    def _report(self, request, response, stats, elapsed_ms):
+        response["Server-Timing"] = _server_timing(stats) + f', app;dur={elapsed_ms:.2f}'
+
+        over = (self.max_commands is not None and stats.count > self.max_commands) or \
+               (self.max_ms is not None and stats.total_ms > self.max_ms)
+        if over:
+            logger.warning(json.dumps({
+                "event": "mongo_budget_exceeded",
+                "method": request.method,
+                "path": request.path,
+                "url_name": _url_name(request),
+                "status": response.status_code,
+                "commands": stats.count,
+                "mongo_ms": round(stats.total_ms, 2),
+                "elapsed_ms": round(elapsed_ms, 2),
+                "slowest": {"ms": round(stats.slowest[0], 2), "shape": stats.slowest[1]} if stats.slowest else None,
+                "repeated": {s: n for s, n in stats.shapes().items() if n > 1},
+            }, ensure_ascii=False))
+
+        if (self.panel and not getattr(response, "streaming", False)
+                and "text/html" in response.get("Content-Type", "")):
+            content = response.content
+            idx = content.rfind(b"</body>")
+            if idx != -1:
+                response.content = content[:idx] + _panel_html(request, stats, elapsed_ms).encode() + content[idx:]
+                if response.has_header("Content-Length"):
+                    response["Content-Length"] = str(len(response.content))
@@ -0,0 +1,80 @@
+# shop/loaders.py
+"""
+Identity map theo request cho san_pham / tai_khoan (kiểu DataLoader):
+
+    ld = loaders_for(request)
+    ld.products.prime(sp_ids); ld.accounts.prime([tk_id])   # xếp hàng, chưa query
+    sp_map = ld.products.load_many(sp_ids)                   # 1 lệnh {"_id": {"$in": [...]}}
+    acc = ld.accounts.load(tk_id)                            # đã có trong map -> 0 lệnh
+
+Mỗi collection dùng 1 projection cố định (hợp các field mà serializer cần) nên
+id nào đã nạp thì dùng lại cho cả request; id không tồn tại cũng được nhớ (None).
+Dữ liệu trong map là ảnh chụp lúc nạp: chỉ dùng để hiển thị (tên, giá hiện tại),
+không dùng để kiểm tra tồn kho — việc đó vẫn do update_one có điều kiện đảm nhận.
+"""
+from bson import ObjectId
+
+from .database import san_pham, tai_khoan
+
+PRODUCT_FIELDS = {"ten": 1, "ten_san_pham": 1, "gia": 1}
+ACCOUNT_FIELDS = {"ho_ten": 1, "ten": 1, "email": 1, "ten_dang_nhap": 1, "username": 1,
+                  "so_dien_thoai": 1, "sdt": 1, "phone": 1, "dia_chi": 1, "address": 1}
+
+_MISSING = object()
+
+
+class Loader:
+    def __init__(self, collection, fields):
+        self.collection = collection
+        self.fields = fields
+        self._map = {}       # _id -> doc | None (không tồn tại)
+        self._queue = {}     # dict giữ thứ tự, tránh trùng id
+
+    def prime(self, ids):
+        """Xếp hàng các id chưa có trong map; query dồn lại tới lần load kế tiếp."""
+        for oid in ids:
+            if isinstance(oid, ObjectId) and oid not in self._map and oid not in self._queue:
+                self._queue[oid] = None
+        return self
+
+    def dispatch(self):
+        if not self._queue:
+            return
+        ids, self._queue = list(self._queue), {}
+        for oid in ids:
+            self._map[oid] = None
+        for doc in self.collection.find({"_id": {"$in": ids}}, self.fields):
+            self._map[doc["_id"]] = doc
+
+    def load_many(self, ids) -> dict:
+        """{_id: doc} cho các id tồn tại."""
+        ids = [oid for oid in ids if isinstance(oid, ObjectId)]
+        self.prime(ids)
+        self.dispatch()
+        return {oid: self._map[oid] for oid in ids if self._map.get(oid) is not None}
+
+    def load(self, oid):
+        if not isinstance(oid, ObjectId):
+            return None
+        doc = self._map.get(oid, _MISSING)
+        if doc is _MISSING:
+            self.prime([oid])
+            self.dispatch()
+            doc = self._map[oid]
+        return doc
+
+
+class RequestLoaders:
+    def __init__(self):
+        self.products = Loader(san_pham, PRODUCT_FIELDS)
+        self.accounts = Loader(tai_khoan, ACCOUNT_FIELDS)
+
+
+def loaders_for(request) -> RequestLoaders:
+    """Tạo lười và gắn vào request; request=None -> bộ mới (command / test)."""
+    if request is None:
+        return RequestLoaders()
+    ld = getattr(request, "_shop_loaders", None)
+    if ld is None:
+        ld = request._shop_loaders = RequestLoaders()
+    return ld
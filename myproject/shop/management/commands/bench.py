@@ -0,0 +1,461 @@
+# shop/management/commands/bench.py
+"""
+Benchmark tải HTTP theo "traffic mix" có trọng số (storefront + checkout):
+
+    python manage.py bench --duration 30 --concurrency 8                 # in-process (django.test.Client)
+    python manage.py bench --target http://127.0.0.1:8000 --duration 60  # server đang chạy
+    python manage.py bench --output bench/after.json --compare bench/before.json
+
+So sánh sync (WSGI) và async (ASGI, shop/views/async_api.py) trên các API JSON:
+
+    gunicorn myproject.wsgi -w 4 --threads 8 -b 127.0.0.1:8000
+    python manage.py bench --target http://127.0.0.1:8000 --mix api --concurrency 128 --output bench/sync.json
+    uvicorn myproject.asgi:application --workers 4 --port 8000
+    python manage.py bench --target http://127.0.0.1:8000 --mix api --concurrency 128 --compare bench/sync.json
+
+Báo cáo throughput, p50/p95/p99 và số lệnh Mongo / request (đọc từ header Server-Timing
+của QueryStatsMiddleware) cho từng endpoint, ghi ra JSON để so sánh giữa các commit.
+Bench có ghi dữ liệu (giỏ hàng, đơn hàng, tồn kho) -> chạy trên DB seed (`seed_scale`).
+"""
+import json
+import math
+import os
+import platform
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...payments.vnpay import _hmac_sha512
+
+# Trọng số mặc định (gần với log truy cập thật: đọc nhiều, đặt hàng ít)
+DEFAULT_MIX = {
+    "home": 15,
+    "catalog": 20,
+    "search": 10,
+    "product_detail": 20,
+    "cart_add": 8,
+    "cart_update": 5,
+    "checkout_cod": 3,
+    "checkout_vnpay": 2,
+    "my_orders_poll": 17,
+}
+# --mix api: chỉ các API JSON mà JS storefront gọi liên tục (đo concurrency sync vs async)
+MIX_PRESETS = {
+    "api": {
+        "api_products": 30,
+        "api_categories": 10,
+        "cart_get": 25,
+        "cart_add": 5,
+        "my_orders_count": 30,
+    },
+}
+SORTS = ["name_asc", "name_desc", "price_asc", "price_desc", "newest", "best_seller", "trending", "most_viewed"]
+SEARCH_TERMS = ["xoài", "bưởi", "cam", "nho", "táo", "sầu riêng", "combo", "sấy", "cherry", "kiwi"]
+PASSWORD = "123456"  # mật khẩu tài khoản do seed_scale sinh ra
+
+_TIMING_RE = re.compile(r'mongo;dur=([\d.]+);desc="(\d+) cmds"')
+
+
+# =================== CLIENTS ===================
+class _InProcessClient:
+    """django.test.Client: chạy đủ middleware, không qua mạng."""
+
+    def __init__(self):
+        from django.test import Client
+        self._c = Client(HTTP_HOST="localhost")
+
+    def request(self, method, path, body=None):
+        kwargs = {}
+        if body is not None:
+            kwargs = {"data": json.dumps(body), "content_type": "application/json"}
+        resp = getattr(self._c, method.lower())(path, **kwargs)
+        content = b"" if getattr(resp, "streaming", False) else resp.content
+        return resp.status_code, resp.get("Server-Timing", ""), content
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class _HttpClient:
+    """urllib + cookie jar riêng cho mỗi worker (mỗi worker = 1 phiên đăng nhập)."""
+
+    def __init__(self, base_url, timeout):
+        self.base = base_url.rstrip("/")
+        self.timeout = timeout
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect())
+
+    def request(self, method, path, body=None):
+        data, headers = None, {}
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(self.base + path, data=data, method=method, headers=headers)
+        try:
+            with self._opener.open(req, timeout=self.timeout) as resp:
+                return resp.status, resp.headers.get("Server-Timing", ""), resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get("Server-Timing", ""), e.read()
+
+
+# =================== RESULTS ===================
+class _Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}  # endpoint -> [(ms, status, mongo_cmds, mongo_ms)]
+
+    def add(self, endpoint, ms, status, timing):
+        m = _TIMING_RE.search(timing or "")
+        cmds, mongo_ms = (int(m.group(2)), float(m.group(1))) if m else (None, None)
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((ms, status, cmds, mongo_ms))
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    # nearest-rank: phần tử thứ ceil(p% * n) (đếm từ 1)
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def _summarize(samples, elapsed):
+    lat = sorted(s[0] for s in samples)
+    cmds = [s[2] for s in samples if s[2] is not None]
+    mongo_ms = [s[3] for s in samples if s[3] is not None]
+    statuses = {}
+    for s in samples:
+        statuses[str(s[1])] = statuses.get(str(s[1]), 0) + 1
+    return {
+        "count": len(samples),
+        "errors": sum(1 for s in samples if s[1] >= 500 or s[1] == 0),
+        "rps": round(len(samples) / elapsed, 2) if elapsed else None,
+        "p50_ms": round(_percentile(lat, 50), 2),
+        "p95_ms": round(_percentile(lat, 95), 2),
+        "p99_ms": round(_percentile(lat, 99), 2),
+        "mean_ms": round(sum(lat) / len(lat), 2),
+        "max_ms": round(lat[-1], 2),
+        "mongo_cmds_avg": round(sum(cmds) / len(cmds), 2) if cmds else None,
+        "mongo_cmds_max": max(cmds) if cmds else None,
+        "mongo_ms_avg": round(sum(mongo_ms) / len(mongo_ms), 2) if mongo_ms else None,
+        "statuses": statuses,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+# =================== SCENARIOS ===================
+class _Session:
+    """1 worker = 1 client đã đăng nhập + trạng thái giữa các bước (giỏ hàng, đơn)."""
+
+    def __init__(self, client, recorder, account, data, rng):
+        self.client = client
+        self.recorder = recorder
+        self.account = account
+        self.data = data
+        self.rng = rng
+
+    def call(self, endpoint, method, path, body=None):
+        started = time.perf_counter()
+        try:
+            status, timing, content = self.client.request(method, path, body)
+        except Exception:
+            status, timing, content = 0, "", b""
+        self.recorder.add(endpoint, (time.perf_counter() - started) * 1000, status, timing)
+        return status, content
+
+    def json_call(self, endpoint, method, path, body=None):
+        status, content = self.call(endpoint, method, path, body)
+        try:
+            return status, json.loads(content or b"{}")
+        except ValueError:
+            return status, {}
+
+    def product_id(self):
+        ids = self.data["products"]
+        return ids[min(int(len(ids) * self.rng.random() ** 2), len(ids) - 1)]
+
+    def receiver(self):
+        return {"ho_ten": self.account.get("ho_ten") or "Khách bench", "sdt": self.account.get("sdt") or "0900000000",
+                "dia_chi": self.account.get("dia_chi") or "1 Quang Trung, Gò Vấp, TP.HCM"}
+
+    def login(self):
+        status, _ = self.json_call("auth_login", "POST", "/api/auth/login",
+                                   {"email": self.account["email"], "mat_khau": PASSWORD})
+        return status == 200
+
+
+def sc_home(s):
+    s.call("home", "GET", "/")
+    s.call("cart_get", "GET", "/api/cart/")  # base.html gọi trên mọi trang
+
+
+def sc_catalog(s):
+    params = {"sort": s.rng.choice(SORTS), "page": s.rng.choice([1, 1, 1, 2, 3])}
+    if s.data["categories"] and s.rng.random() < 0.7:
+        params["cat"] = s.rng.choice(s.data["categories"])
+    if s.rng.random() < 0.3:
+        lo = s.rng.choice([0, 20000, 50000, 100000])
+        params.update({"min": lo, "max": lo + s.rng.choice([50000, 100000, 300000])})
+    s.call("catalog", "GET", "/sanpham/?" + urllib.parse.urlencode(params))
+
+
+def sc_search(s):
+    s.call("search", "GET", "/sanpham/?" + urllib.parse.urlencode({"q": s.rng.choice(SEARCH_TERMS)}))
+
+
+def sc_product_detail(s):
+    s.call("product_detail", "GET", f"/sanpham/{s.product_id()}/")
+
+
+def sc_cart_add(s):
+    s.json_call("cart_add", "POST", "/api/cart/items/", {"san_pham_id": s.product_id(), "so_luong": s.rng.randint(1, 3)})
+
+
+def sc_cart_update(s):
+    _, cart = s.json_call("cart_get", "GET", "/api/cart/")
+    items = cart.get("items") or []
+    if not items:
+        return sc_cart_add(s)
+    item = s.rng.choice(items)
+    s.json_call("cart_update", "PATCH", f"/api/cart/items/{item['id']}/", {"so_luong": s.rng.randint(1, 4)})
+
+
+def sc_checkout_cod(s):
+    sc_cart_add(s)
+    body = {"use_cart": True, "phuong_thuc_thanh_toan": "cod", **s.receiver()}
+    s.json_call("checkout_cod", "POST", "/api/orders/checkout/", body)
+
+
+def _signed_vnpay_params(order_id, amount):
+    """Giả lập tham số VNPay gửi về (ký HMAC đúng như payments.vnpay.verify_vnpay_params)."""
+    p = {
+        "vnp_Amount": str(int(amount) * 100),
+        "vnp_BankCode": "NCB",
+        "vnp_OrderInfo": f"Thanh toan don hang #{order_id}",
+        "vnp_PayDate": timezone.now().strftime("%Y%m%d%H%M%S"),
+        "vnp_ResponseCode": "00",
+        "vnp_TmnCode": settings.VNPAY_TMNCODE,
+        "vnp_TransactionNo": str(random.randint(10 ** 7, 10 ** 8 - 1)),
+        "vnp_TransactionStatus": "00",
+        "vnp_TxnRef": order_id,
+    }
+    raw = "&".join(f"{k}={urllib.parse.quote_plus(str(v))}" for k, v in sorted(p.items()))
+    p["vnp_SecureHash"] = _hmac_sha512(settings.VNPAY_HASHSECRET, raw)
+    return urllib.parse.urlencode(p)
+
+
+def sc_checkout_vnpay(s):
+    body = {"use_cart": False, "phuong_thuc_thanh_toan": "vnpay", **s.receiver(),
+            "items": [{"san_pham_id": s.product_id(), "so_luong": s.rng.randint(1, 2)}]}
+    status, order = s.json_call("checkout_vnpay", "POST", "/api/orders/checkout/", body)
+    order_id = order.get("id")
+    if status != 201 or not order_id:
+        return
+    s.json_call("vnpay_create", "GET", f"/api/pay/vnpay/create/{order_id}/")
+    qs = _signed_vnpay_params(order_id, order.get("tong_tien") or 0)
+    s.call("vnpay_return", "GET", f"/api/pay/vnpay/return/?{qs}")
+    s.call("vnpay_ipn", "GET", f"/api/pay/vnpay/ipn/?{qs}")
+
+
+def sc_my_orders_poll(s):
+    # base.html: đếm đơn chưa thanh toán (60s/lần) + dropdown đơn đã thanh toán khi bấm
+    s.call("my_orders_count", "GET", "/api/my-orders/count/?paid=0")
+    if s.rng.random() < 0.3:
+        s.call("my_orders_recent", "GET", "/api/my-orders/?paid=1&limit=5")
+
+
+def sc_api_products(s):
+    s.call("api_products", "GET", f"/api/products/?page={s.rng.randint(1, 20)}&page_size=12")
+
+
+def sc_api_categories(s):
+    s.call("api_categories", "GET", "/api/categories/")
+
+
+def sc_cart_get(s):
+    s.call("cart_get", "GET", "/api/cart/?include_product=1")
+
+
+def sc_my_orders_count(s):
+    s.call("my_orders_count", "GET", "/api/my-orders/count/?paid=0")
+
+
+SCENARIOS = {
+    "home": sc_home,
+    "catalog": sc_catalog,
+    "search": sc_search,
+    "product_detail": sc_product_detail,
+    "cart_add": sc_cart_add,
+    "cart_update": sc_cart_update,
+    "checkout_cod": sc_checkout_cod,
+    "checkout_vnpay": sc_checkout_vnpay,
+    "my_orders_poll": sc_my_orders_poll,
+    "api_products": sc_api_products,
+    "api_categories": sc_api_categories,
+    "cart_get": sc_cart_get,
+    "my_orders_count": sc_my_orders_count,
+}
+
+
+def _parse_mix(value):
+    if not value:
+        return dict(DEFAULT_MIX)
+    if value in MIX_PRESETS:
+        return dict(MIX_PRESETS[value])
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise CommandError(f"Kịch bản không tồn tại: {name} (có: {', '.join(SCENARIOS)})")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Trọng số không hợp lệ: {part}")
+    return mix
+
+
+# =================== COMMAND ===================
+class Command(BaseCommand):
+    help = "Benchmark tải HTTP theo traffic mix có trọng số, ghi kết quả JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", default="inprocess",
+                            help="'inprocess' (mặc định) hoặc URL server, vd http://127.0.0.1:8000")
+        parser.add_argument("--duration", type=float, default=30, help="Số giây đo (sau warmup)")
+        parser.add_argument("--warmup", type=float, default=3)
+        parser.add_argument("--concurrency", type=int, default=8, help="Số worker thread")
+        parser.add_argument("--mix", help="vd 'home=10,catalog=20,checkout_cod=2' hoặc tên preset: api (mặc định DEFAULT_MIX)")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--timeout", type=float, default=30, help="Timeout mỗi request (HTTP)")
+        parser.add_argument("--output", help="File JSON kết quả (mặc định bench/<thời gian>-<commit>.json)")
+        parser.add_argument("--compare", help="File JSON của lần chạy trước để in chênh lệch")
+
+    def handle(self, *args, **o):
+        from ...database import san_pham, danh_muc, tai_khoan
+
+        mix = _parse_mix(o["mix"])
+        workers = max(1, o["concurrency"])
+        accounts = list(tai_khoan.find({"vai_tro": "customer", "mat_khau": PASSWORD},
+                                       {"email": 1, "ho_ten": 1, "sdt": 1, "dia_chi": 1}).limit(workers))
+        data = {
+            "products": [str(d["_id"]) for d in san_pham.find({"so_luong_ton": {"$gt": 0}}, {"_id": 1}).limit(5000)],
+            "categories": [str(d["_id"]) for d in danh_muc.find({}, {"_id": 1})],
+        }
+        if not accounts or not data["products"]:
+            raise CommandError("Chưa có dữ liệu: chạy `manage.py seed_scale` trước")
+
+        inprocess = o["target"] == "inprocess"
+        if not inprocess and not o["target"].startswith(("http://", "https://")):
+            raise CommandError("--target phải là 'inprocess' hoặc URL http(s)://")
+
+        recorder = _Recorder()
+        names, weights = list(mix), list(mix.values())
+        stop_at = {"warmup": time.monotonic() + o["warmup"]}
+        stop_at["end"] = stop_at["warmup"] + o["duration"]
+        measuring = threading.Event()
+        errors = []
+
+        def _worker(n):
+            try:
+                client = _InProcessClient() if inprocess else _HttpClient(o["target"], o["timeout"])
+                rng = random.Random(f"{o['seed']}-{n}")
+                s = _Session(client, _Recorder(), accounts[n % len(accounts)], data, rng)
+                if not s.login():
+                    errors.append(f"worker {n}: đăng nhập thất bại ({s.account['email']})")
+                    return
+                while time.monotonic() < stop_at["end"]:
+                    # warmup ghi vào recorder riêng, bỏ đi
+                    s.recorder = recorder if measuring.is_set() else s.recorder
+                    SCENARIOS[rng.choices(names, weights)[0]](s)
+            except Exception as e:  # 1 worker lỗi không làm hỏng cả lần chạy
+                errors.append(f"worker {n}: {e!r}")
+
+        self.stdout.write(f"Bench {o['target']} · {workers} worker · warmup {o['warmup']}s · đo {o['duration']}s")
+        threads = [threading.Thread(target=_worker, args=(n,), daemon=True) for n in range(workers)]
+        for t in threads:
+            t.start()
+        time.sleep(max(0.0, stop_at["warmup"] - time.monotonic()))
+        measuring.set()
+        started = time.monotonic()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+        for e in errors:
+            self.stderr.write(e)
+
+        endpoints = {name: _summarize(s, elapsed) for name, s in sorted(recorder.samples.items())}
+        if not endpoints:
+            raise CommandError("Không có request nào được ghi nhận")
+        result = {
+            "meta": {
+                "commit": _git_commit(),
+                "started_at": timezone.now().isoformat(),
+                "target": o["target"],
+                "concurrency": workers,
+                "duration_s": round(elapsed, 2),
+                "warmup_s": o["warmup"],
+                "seed": o["seed"],
+                "mix": mix,
+                "python": platform.python_version(),
+                "mongo_db": settings.MONGO_DB_NAME,
+            },
+            "total": _summarize([x for s in recorder.samples.values() for x in s], elapsed),
+            "endpoints": endpoints,
+        }
+
+        self._print(result)
+        path = o["output"] or os.path.join(
+            "bench", f"{timezone.localtime().strftime('%Y%m%d-%H%M%S')}-{result['meta']['commit'] or 'nogit'}.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Đã ghi {path}"))
+
+        if o["compare"]:
+            with open(o["compare"], encoding="utf-8") as f:
+                self._print_compare(json.load(f), result)
+
+    def _print(self, result):
+        header = f"{'endpoint':<18}{'n':>7}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'cmds':>7}{'mongo':>9}{'err':>6}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        rows = list(result["endpoints"].items()) + [("TOTAL", result["total"])]
+        for name, r in rows:
+            cmds = "-" if r["mongo_cmds_avg"] is None else f"{r['mongo_cmds_avg']:.1f}"
+            mongo = "-" if r["mongo_ms_avg"] is None else f"{r['mongo_ms_avg']:.1f}"
+            self.stdout.write(
+                f"{name:<18}{r['count']:>7}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+                f"{r['p99_ms']:>9.1f}{cmds:>7}{mongo:>9}{r['errors']:>6}"
+            )
+
+    def _print_compare(self, before, after):
+        self.stdout.write(f"\nSo với {before['meta'].get('commit')} (p95 ms / lệnh Mongo):")
+        for name, r in after["endpoints"].items():
+            old = before.get("endpoints", {}).get(name)
+            if not old:
+                continue
+            dp95 = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0
+            cmds = ""
+            if r["mongo_cmds_avg"] is not None and old.get("mongo_cmds_avg") is not None:
+                cmds = f"  cmds {old['mongo_cmds_avg']:.1f} -> {r['mongo_cmds_avg']:.1f}"
+            self.stdout.write(f"  {name:<18}{old['p95_ms']:>9.1f} -> {r['p95_ms']:<9.1f}({dp95:+.0f}%){cmds}")
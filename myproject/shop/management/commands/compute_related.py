@@ -0,0 +1,33 @@
+# shop/management/commands/compute_related.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...related import BATCH_SIZE, RELATED_LIMIT, compute_related
+
+
+class Command(BaseCommand):
+    help = "Tính sẵn sản phẩm liên quan (mua cùng trong don_hang.items, bù bằng cùng danh mục)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=RELATED_LIMIT, help="Số sản phẩm liên quan / sản phẩm")
+        parser.add_argument("--since-days", type=int, help="Chỉ xét đơn trong N ngày gần nhất")
+        parser.add_argument("--min-count", type=int, default=1, help="Số đơn mua cùng tối thiểu để tính là liên quan")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **opts):
+        started = time.monotonic()
+
+        def _progress(rep):
+            self.stdout.write(f"  {rep['products']} sản phẩm · {rep['updated']} cập nhật", ending="\r")
+            self.stdout.flush()
+
+        report = compute_related(
+            limit=max(1, opts["limit"]), since_days=opts["since_days"], min_count=max(1, opts["min_count"]),
+            batch_size=max(1, opts["batch_size"]), progress=_progress,
+        )
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(
+            f"Xong {report['products']} sản phẩm trong {time.monotonic() - started:.1f}s: "
+            f"{report['co_purchase']} có dữ liệu mua cùng, {report['updated']} cập nhật"
+        ))
@@ -0,0 +1,50 @@
+# shop/management/commands/import_products.py
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...importer import BATCH_SIZE, FORMATS, guess_format, import_products
+
+
+class Command(BaseCommand):
+    help = "Import / upsert sản phẩm từ file CSV hoặc JSONL (stream, bulk_write theo lô)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Đường dẫn file, hoặc '-' để đọc từ stdin")
+        parser.add_argument("--format", choices=FORMATS, help="Mặc định đoán theo đuôi file")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--create-categories", action="store_true",
+                            help="Tự tạo danh mục chưa có thay vì báo lỗi dòng")
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        fmt = opts["format"] or guess_format(path)
+        started = time.monotonic()
+
+        def _progress(rep):
+            self.stdout.write(
+                f"  {rep['rows']} dòng · +{rep['inserted']} mới · {rep['updated']} cập nhật · {rep['failed']} lỗi",
+                ending="\r",
+            )
+            self.stdout.flush()
+
+        try:
+            stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+        except OSError as e:
+            raise CommandError(str(e))
+        with stream:
+            report = import_products(
+                stream, fmt=fmt, batch_size=max(1, opts["batch_size"]),
+                create_categories=opts["create_categories"], progress=_progress,
+            )
+
+        self.stdout.write("")
+        for err in report["errors"]:
+            self.stderr.write(f"dòng {err['row']}: {err['error']}")
+        if report["failed"] > len(report["errors"]):
+            self.stderr.write(f"... và {report['failed'] - len(report['errors'])} lỗi khác")
+        self.stdout.write(self.style.SUCCESS(
+            f"Xong {report['rows']} dòng trong {time.monotonic() - started:.1f}s: "
+            f"{report['inserted']} mới, {report['updated']} cập nhật, {report['failed']} lỗi"
+        ))
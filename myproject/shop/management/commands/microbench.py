@@ -0,0 +1,65 @@
+# shop/management/commands/microbench.py
+import json
+import os
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...benchmarks import micro
+from .bench import _git_commit
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark các hàm serialize / helper (ns/op + cấp phát bộ nhớ)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("-k", dest="names", action="append",
+                            help="Chỉ chạy case có tên chứa chuỗi này (lặp lại được)")
+        parser.add_argument("--repeat", type=int, default=7)
+        parser.add_argument("--min-time", type=float, default=0.2, help="Giây tối thiểu mỗi lần lặp")
+        parser.add_argument("--output", help="Ghi kết quả JSON")
+        parser.add_argument("--compare", help="File JSON lần chạy trước")
+        parser.add_argument("--max-regression", type=float,
+                            help="Với --compare: lỗi (exit 1) nếu case nào chậm hơn quá N%%")
+        parser.add_argument("--list", action="store_true", help="Liệt kê case rồi thoát")
+
+    def handle(self, *args, **o):
+        if o["list"]:
+            for name in micro.CASES:
+                self.stdout.write(name)
+            return
+
+        header = f"{'case':<50}{'ns/op':>11}{'±':>8}{'blocks':>8}{'bytes':>8}{'peak':>8}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+
+        def _progress(name, r):
+            self.stdout.write(f"{name:<50}{r['ns_per_op']:>11.0f}{r['ns_stdev']:>8.0f}"
+                              f"{r['alloc_blocks']:>8}{r['alloc_bytes']:>8}{r['alloc_peak_bytes']:>8}")
+
+        results = micro.run(o["names"], repeat=o["repeat"], min_time=o["min_time"], progress=_progress)
+        if not results:
+            raise CommandError("Không có case nào khớp -k")
+
+        if o["output"]:
+            os.makedirs(os.path.dirname(o["output"]) or ".", exist_ok=True)
+            with open(o["output"], "w", encoding="utf-8") as f:
+                json.dump({
+                    "meta": {"commit": _git_commit(), "started_at": timezone.now().isoformat(),
+                             "python": platform.python_version(), "implementation": platform.python_implementation()},
+                    "cases": results,
+                }, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Đã ghi {o['output']}"))
+
+        if o["compare"]:
+            with open(o["compare"], encoding="utf-8") as f:
+                before = json.load(f)
+            self.stdout.write(f"\nSo với {before.get('meta', {}).get('commit')}:")
+            worst = []
+            for name, old_ns, new_ns, pct in micro.compare(before.get("cases", {}), results):
+                self.stdout.write(f"  {name:<50}{old_ns:>10.0f} -> {new_ns:<10.0f}({pct:+.1f}%)")
+                if o["max_regression"] is not None and pct > o["max_regression"]:
+                    worst.append(name)
+            if worst:
+                raise CommandError(f"Chậm hơn quá {o['max_regression']}%: {', '.join(worst)}")
@@ -0,0 +1,37 @@
+# shop/management/commands/refresh_sales.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...sales import BATCH_SIZE, WINDOW_DAYS, ensure_indexes, rebuild, refresh_window
+
+
+class Command(BaseCommand):
+    help = f"Trượt cửa sổ bán chạy {WINDOW_DAYS} ngày (da_ban_7d) trên san_pham; --rebuild tính lại từ don_hang."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Tính lại da_ban / da_ban_7d của mọi sản phẩm từ don_hang")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **opts):
+        started = time.monotonic()
+        ensure_indexes()
+
+        if not opts["rebuild"]:
+            n = refresh_window()
+            self.stdout.write(self.style.SUCCESS(
+                f"Đã trượt cửa sổ {WINDOW_DAYS} ngày cho {n} sản phẩm trong {time.monotonic() - started:.1f}s"
+            ))
+            return
+
+        def _progress(rep):
+            self.stdout.write(f"  {rep['products']} sản phẩm · {rep['updated']} cập nhật", ending="\r")
+            self.stdout.flush()
+
+        report = rebuild(batch_size=max(1, opts["batch_size"]), progress=_progress)
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(
+            f"Xong {report['products']} sản phẩm trong {time.monotonic() - started:.1f}s: "
+            f"{report['sold']} đã có đơn, {report['updated']} cập nhật"
+        ))
@@ -0,0 +1,291 @@
+# shop/management/commands/seed_scale.py
+"""
+Sinh dữ liệu giả lập quy mô lớn, tất định theo --seed (cùng tham số -> cùng dữ liệu):
+
+    python manage.py seed_scale --products 5000 --accounts 100000 --orders 10000000 --drop
+
+- sản phẩm / danh mục / tài khoản tiếng Việt, giỏ hàng, đơn nhiều món trải đều nhiều năm
+- insert_many theo lô (--chunk), đơn hàng chia cho nhiều process khi K lớn
+"""
+import multiprocessing
+import os
+import random
+import struct
+import time
+import unicodedata
+from datetime import datetime, time as dtime, timedelta, timezone as dt_timezone
+
+from bson import ObjectId
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import MongoClient
+
+# (tên, danh mục, giá min, giá max (nghìn đồng), giống / loại)
+FRUITS = [
+    ("Xoài", "Trái cây nội địa", 35, 120, ["cát Hoà Lộc", "cát Chu", "keo", "tượng", "Úc"]),
+    ("Bưởi", "Trái cây nội địa", 40, 150, ["da xanh", "Năm Roi", "Diễn", "Phúc Trạch", "hồng"]),
+    ("Cam", "Trái cây nội địa", 25, 90, ["sành", "xoàn", "Cao Phong", "Vinh", "canh"]),
+    ("Sầu riêng", "Trái cây nội địa", 90, 350, ["Ri6", "Monthong", "Musang King", "Chuồng Bò"]),
+    ("Măng cụt", "Trái cây nội địa", 60, 160, ["Lái Thiêu", "Bến Tre", "Cái Mơn"]),
+    ("Chôm chôm", "Trái cây nội địa", 20, 70, ["Java", "nhãn", "Thái"]),
+    ("Nhãn", "Trái cây nội địa", 30, 90, ["xuồng cơm vàng", "lồng Hưng Yên", "Ido"]),
+    ("Vải", "Trái cây nội địa", 35, 110, ["thiều Lục Ngạn", "thiều Thanh Hà", "u hồng"]),
+    ("Thanh long", "Trái cây nội địa", 20, 60, ["ruột đỏ", "ruột trắng", "vàng"]),
+    ("Mít", "Trái cây nội địa", 25, 80, ["Thái", "nghệ", "tố nữ"]),
+    ("Dưa hấu", "Trái cây nội địa", 15, 45, ["Long An", "không hạt", "ruột vàng"]),
+    ("Ổi", "Trái cây nội địa", 20, 60, ["nữ hoàng", "ruột đỏ", "lê Đài Loan"]),
+    ("Táo", "Trái cây nhập khẩu", 60, 220, ["Envy", "Gala", "Fuji", "Rockit", "xanh Granny Smith"]),
+    ("Nho", "Trái cây nhập khẩu", 90, 400, ["xanh Mỹ", "đen Úc", "mẫu đơn Hàn Quốc", "Ninh Thuận"]),
+    ("Cherry", "Trái cây nhập khẩu", 250, 700, ["đỏ Mỹ", "vàng Rainier", "Úc", "Chile"]),
+    ("Việt quất", "Trái cây nhập khẩu", 150, 450, ["Chile", "Peru", "Mỹ"]),
+    ("Kiwi", "Trái cây nhập khẩu", 90, 260, ["xanh New Zealand", "vàng Zespri"]),
+    ("Lê", "Trái cây nhập khẩu", 70, 200, ["Hàn Quốc", "Nam Phi", "đỏ Mỹ"]),
+    ("Xoài sấy", "Trái cây sấy", 80, 250, ["dẻo", "muối ớt", "không đường"]),
+    ("Mít sấy", "Trái cây sấy", 70, 200, ["giòn", "Đà Lạt"]),
+    ("Chuối sấy", "Trái cây sấy", 50, 150, ["dẻo", "giòn", "Huế"]),
+    ("Combo", "Giỏ quà & combo", 200, 1200, ["gia đình", "văn phòng", "biếu Tết", "sức khoẻ"]),
+]
+PACKS = ["", "(500g)", "(1kg)", "(2kg)", "(hộp 6 trái)", "(thùng 5kg)", "loại 1", "VietGAP", "hữu cơ"]
+
+HO = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ",
+      "Hồ", "Ngô", "Dương", "Lý"]
+DEM = ["Văn", "Thị", "Minh", "Ngọc", "Hữu", "Thanh", "Quốc", "Thu", "Gia", "Hoài", "Đức", "Bảo"]
+TEN = ["An", "Bình", "Cường", "Dũng", "Hà", "Hạnh", "Hùng", "Lan", "Linh", "Mai", "Nam", "Phúc",
+       "Quân", "Tâm", "Trang", "Tuấn", "Vy", "Yến", "Khoa", "Thảo", "Long", "Nhi", "Sơn", "Oanh"]
+STREETS = ["Quang Trung", "Nguyễn Trãi", "Lê Lợi", "Trần Hưng Đạo", "Nguyễn Văn Linh", "Phan Xích Long",
+           "Cách Mạng Tháng 8", "Lý Thường Kiệt", "Võ Văn Tần", "Hai Bà Trưng", "Điện Biên Phủ"]
+DISTRICTS = [("Gò Vấp", "TP.HCM"), ("Quận 1", "TP.HCM"), ("Quận 7", "TP.HCM"), ("Bình Thạnh", "TP.HCM"),
+             ("Thủ Đức", "TP.HCM"), ("Ba Đình", "Hà Nội"), ("Cầu Giấy", "Hà Nội"), ("Hải Châu", "Đà Nẵng"),
+             ("Ninh Kiều", "Cần Thơ"), ("Biên Hoà", "Đồng Nai")]
+PAYMENTS = [("cod", 60), ("vnpay", 30), ("chuyen_khoan", 10)]
+
+PARALLEL_MIN_ORDERS = 200_000
+
+
+# =================== HELPERS ===================
+def _oid(rng, dt):
+    """ObjectId có timestamp = dt (sort theo _id vẫn đúng thứ tự thời gian), phần còn lại từ rng."""
+    return ObjectId(struct.pack(">I", int(dt.timestamp())) + rng.getrandbits(64).to_bytes(8, "big"))
+
+
+def _slug(s):
+    s = unicodedata.normalize("NFD", s.replace("Đ", "D").replace("đ", "d"))
+    return "".join(c for c in s if c.isascii() and c.isalnum()).lower()
+
+
+def _weighted(rng, pairs):
+    r = rng.uniform(0, sum(w for _, w in pairs))
+    for v, w in pairs:
+        r -= w
+        if r <= 0:
+            return v
+    return pairs[-1][0]
+
+
+def _popular_index(rng, n):
+    # lệch về đầu danh sách: vài sản phẩm bán rất chạy, phần lớn bán ít
+    return min(int(n * rng.random() ** 2.2), n - 1)
+
+
+def _order_status(rng, age_days):
+    if age_days < 2:
+        return _weighted(rng, [("cho_xu_ly", 60), ("da_xac_nhan", 30), ("da_huy", 10)])
+    if age_days < 7:
+        return _weighted(rng, [("da_xac_nhan", 20), ("dang_giao", 50), ("hoan_thanh", 20), ("da_huy", 10)])
+    return _weighted(rng, [("hoan_thanh", 88), ("da_huy", 12)])
+
+
+def build_orders(seed, chunk_no, start, count, end_ts, span_s, products, accounts):
+    """Sinh `count` đơn cho lô chunk_no (tất định theo seed + chunk_no, không phụ thuộc số process)."""
+    rng = random.Random(f"{seed}-orders-{chunk_no}")
+    docs = []
+    for _ in range(count):
+        ts = end_ts - rng.random() * span_s
+        created = datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+        acc_id, ho_ten, sdt, dia_chi = accounts[rng.randrange(len(accounts))]
+        items, seen, total = [], set(), 0
+        for _ in range(_weighted(rng, [(1, 40), (2, 30), (3, 15), (4, 10), (5, 5)])):
+            idx = _popular_index(rng, len(products))
+            if idx in seen:
+                continue
+            seen.add(idx)
+            sp_id, gia = products[idx]
+            qty = _weighted(rng, [(1, 55), (2, 25), (3, 12), (5, 8)])
+            items.append({"san_pham_id": ObjectId(sp_id), "so_luong": qty, "don_gia": gia, "tong_tien": qty * gia})
+            total += qty * gia
+        receiver = {"ten": ho_ten, "sdt": sdt, "dia_chi": dia_chi}
+        status = _order_status(rng, (end_ts - ts) / 86400)
+        doc = {
+            "_id": _oid(rng, created),
+            "tai_khoan_id": ObjectId(acc_id),
+            "items": items,
+            "tong_tien": total,
+            "phuong_thuc_thanh_toan": _weighted(rng, PAYMENTS),
+            "trang_thai": status,
+            "ngay_tao": created,
+            "nguon_dat": "cart" if rng.random() < 0.7 else "buy_now",
+            "nguoi_nhan": receiver,
+            "ho_ten": ho_ten, "sdt": sdt, "dia_chi": dia_chi,
+            # legacy 1-SP/đơn (giống ALWAYS_ADD_LEGACY_FIELDS trong donhang_view)
+            "san_pham_id": items[0]["san_pham_id"], "so_luong": items[0]["so_luong"], "don_gia": items[0]["don_gia"],
+        }
+        if status == "da_huy":
+            doc["ngay_huy"] = created + timedelta(hours=rng.randint(1, 48))
+        docs.append(doc)
+    return docs
+
+
+# =================== WORKER (process riêng) ===================
+_worker = {}
+
+
+def _worker_init(uri, db_name, payload):
+    # Mỗi process 1 MongoClient riêng (không dùng lại client của process cha)
+    _worker["coll"] = MongoClient(uri, uuidRepresentation="standard")[db_name]["don_hang"]
+    _worker.update(payload)
+
+
+def _worker_chunk(args):
+    chunk_no, start, count = args
+    w = _worker
+    docs = build_orders(w["seed"], chunk_no, start, count, w["end_ts"], w["span_s"], w["products"], w["accounts"])
+    w["coll"].insert_many(docs, ordered=False)
+    return len(docs)
+
+
+# =================== COMMAND ===================
+class Command(BaseCommand):
+    help = "Sinh dữ liệu giả lập (sản phẩm, tài khoản, giỏ hàng, đơn hàng) tất định theo --seed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--accounts", type=int, default=1000)
+        parser.add_argument("--orders", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--years", type=float, default=3, help="Đơn trải đều trong N năm gần nhất")
+        parser.add_argument("--end", help="Ngày cuối (YYYY-MM-DD), mặc định hôm nay. Cố định để tái lập đúng dữ liệu")
+        parser.add_argument("--chunk", type=int, default=5000, help="Số document mỗi insert_many")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--cart-ratio", type=float, default=0.2, help="Tỉ lệ tài khoản có giỏ hàng")
+        parser.add_argument("--drop", action="store_true", help="Xoá san_pham/tai_khoan/gio_hang/don_hang/danh_muc trước")
+
+    def handle(self, *args, **o):
+        from ... import pricing
+        from ...catalog import bump_version
+        from ...database import db, danh_muc, san_pham, tai_khoan, gio_hang, don_hang
+
+        if min(o["products"], o["accounts"]) <= 0 and o["orders"] > 0:
+            raise CommandError("Cần ít nhất 1 sản phẩm và 1 tài khoản để sinh đơn hàng")
+        try:
+            end_day = datetime.strptime(o["end"], "%Y-%m-%d").date() if o["end"] else datetime.now().date()
+        except ValueError:
+            raise CommandError("--end phải có dạng YYYY-MM-DD")
+        end = datetime.combine(end_day, dtime(23, 59, 59), tzinfo=dt_timezone.utc)
+        span_s = o["years"] * 365 * 86400
+        seed, chunk = o["seed"], max(100, o["chunk"])
+        t0 = time.monotonic()
+
+        if o["drop"]:
+            for coll in (danh_muc, san_pham, tai_khoan, gio_hang, don_hang):
+                coll.drop()
+            self.stdout.write("Đã xoá dữ liệu cũ")
+
+        # ----- Danh mục -----
+        cat_ids = {}
+        for name in sorted({f[1] for f in FRUITS}):
+            doc = danh_muc.find_one_and_update(
+                {"ten_danh_muc": name}, {"$setOnInsert": {"ten_danh_muc": name}}, upsert=True, return_document=True)
+            cat_ids[name] = doc["_id"]
+
+        # ----- Sản phẩm -----
+        rng = random.Random(f"{seed}-products")
+        products, batch = [], []
+        for i in range(o["products"]):
+            ten, cat, lo, hi, kinds = FRUITS[i % len(FRUITS)]
+            name = " ".join(p for p in (ten, rng.choice(kinds), rng.choice(PACKS)) if p) + f" #{i + 1}"
+            gia = rng.randint(lo, hi) * 1000
+            created = end - timedelta(seconds=span_s * (1 - i / max(o["products"], 1)))
+            doc = {
+                "_id": _oid(rng, created),
+                "ten_san_pham": name,
+                "mo_ta": f"{ten} {rng.choice(kinds)} tuyển chọn, giao nhanh trong ngày.",
+                "gia": gia,
+                "so_luong_ton": rng.randint(0, 500),
+                "danh_muc_id": cat_ids[cat],
+                "hinh_anh": [],
+            }
+            products.append((str(doc["_id"]), gia))
+            batch.append(doc)
+            if len(batch) >= chunk:
+                san_pham.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            san_pham.insert_many(batch, ordered=False)
+        pricing.invalidate()
+        bump_version()  # bỏ cache số liệu catalog cũ
+        self.stdout.write(f"{o['products']} sản phẩm")
+
+        # ----- Tài khoản + giỏ hàng -----
+        rng = random.Random(f"{seed}-accounts")
+        accounts, batch, carts = [], [], []
+        for i in range(o["accounts"]):
+            ho_ten = f"{rng.choice(HO)} {rng.choice(DEM)} {rng.choice(TEN)}"
+            district, city = rng.choice(DISTRICTS)
+            dia_chi = f"{rng.randint(1, 400)} {rng.choice(STREETS)}, {district}, {city}"
+            sdt = "09" + "".join(str(rng.randint(0, 9)) for _ in range(8))
+            created = end - timedelta(seconds=span_s * rng.random())
+            doc = {
+                "_id": _oid(rng, created),
+                "ho_ten": ho_ten,
+                "email": f"{_slug(ho_ten)}{i + 1}@example.com",
+                "sdt": sdt,
+                "dia_chi": dia_chi,
+                "mat_khau": "123456",
+                "vai_tro": "customer",
+            }
+            accounts.append((str(doc["_id"]), ho_ten, sdt, dia_chi))
+            batch.append(doc)
+            if products and rng.random() < o["cart_ratio"]:
+                for idx in {_popular_index(rng, len(products)) for _ in range(rng.randint(1, 4))}:
+                    qty = rng.randint(1, 3)
+                    carts.append({
+                        "tai_khoan_id": doc["_id"], "san_pham_id": ObjectId(products[idx][0]),
+                        "ngay_tao": end - timedelta(days=rng.random() * 14),
+                        "so_luong": qty, "don_gia": products[idx][1], "tong_tien": qty * products[idx][1],
+                    })
+            if len(batch) >= chunk:
+                tai_khoan.insert_many(batch, ordered=False)
+                batch = []
+            if len(carts) >= chunk:
+                gio_hang.insert_many(carts, ordered=False)
+                carts = []
+        if batch:
+            tai_khoan.insert_many(batch, ordered=False)
+        if carts:
+            gio_hang.insert_many(carts, ordered=False)
+        self.stdout.write(f"{o['accounts']} tài khoản")
+
+        # ----- Đơn hàng -----
+        total = o["orders"]
+        tasks = [(n, start, min(chunk, total - start)) for n, start in enumerate(range(0, total, chunk))]
+        end_ts = end.timestamp()
+        done = 0
+        if total >= PARALLEL_MIN_ORDERS and o["workers"] > 1:
+            payload = {"seed": seed, "end_ts": end_ts, "span_s": span_s, "products": products, "accounts": accounts}
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(o["workers"], initializer=_worker_init,
+                          initargs=(settings.MONGO_URI, db.name, payload)) as pool:
+                for n in pool.imap_unordered(_worker_chunk, tasks):
+                    done += n
+                    self.stdout.write(f"  {done}/{total} đơn hàng", ending="\r")
+        else:
+            for chunk_no, start, count in tasks:
+                docs = build_orders(seed, chunk_no, start, count, end_ts, span_s, products, accounts)
+                don_hang.insert_many(docs, ordered=False)
+                done += len(docs)
+                self.stdout.write(f"  {done}/{total} đơn hàng", ending="\r")
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(
+            f"Xong trong {time.monotonic() - t0:.1f}s: {o['products']} sản phẩm, {o['accounts']} tài khoản, "
+            f"{total} đơn hàng (seed={seed}, end={end_day})"
+        ))
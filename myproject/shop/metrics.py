@@ -0,0 +1,277 @@
+# shop/metrics.py
+"""
+Metrics kiểu Prometheus, không cần dịch vụ ngoài:
+
+- MetricsMiddleware: latency, response size, thời gian Mongo (histogram) + số request
+  đang xử lý, gắn nhãn theo URL name đã resolve ("shop:sanpham_list", ...)
+- Mỗi process giữ số liệu trong RAM (1 lock, vài phép cộng / request) và định kỳ
+  ghi snapshot ra METRICS_DIR/<pid>.json (ghi file tạm rồi os.replace)
+- /metrics gộp snapshot của mọi worker -> text format Prometheus 0.0.4
+
+Counter / histogram của worker đã chết vẫn được cộng (giá trị không bị giảm),
+gauge (in-flight) chỉ tính worker còn sống.
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+UNRESOLVED = "<unresolved>"
+
+HELP = {
+    "shop_http_requests_total": ("counter", "Số request theo URL name, method, status"),
+    "shop_http_requests_in_flight": ("gauge", "Số request đang xử lý"),
+    "shop_http_request_duration_seconds": ("histogram", "Thời gian xử lý request"),
+    "shop_http_response_size_bytes": ("histogram", "Kích thước response (không tính streaming)"),
+    "shop_mongo_duration_seconds": ("histogram", "Tổng thời gian lệnh Mongo trong 1 request"),
+    "shop_mongo_commands_total": ("counter", "Số lệnh Mongo"),
+}
+
+
+def _dir():
+    return getattr(settings, "METRICS_DIR", None)
+
+
+# =================== REGISTRY (1 / process) ===================
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.counters = {}   # (name, labels) -> float
+        self.gauges = {}     # (name, labels) -> float
+        self.hists = {}      # (name, labels) -> [bucket_counts..., sum, count]
+        self._dirty = False
+        self._flusher = None
+
+    def _check_fork(self):
+        # gunicorn --preload: con kế thừa số liệu của cha -> bỏ, tránh đếm 2 lần
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def inc(self, name, labels, value=1.0):
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0.0) + value
+            self._dirty = True
+        self._ensure_flusher()
+
+    def gauge_add(self, name, labels, value):
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            self.gauges[key] = self.gauges.get(key, 0.0) + value
+            self._dirty = True
+        self._ensure_flusher()
+
+    def observe(self, name, labels, value, buckets):
+        idx = bisect.bisect_left(buckets, value)
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            h = self.hists.get(key)
+            if h is None:
+                h = self.hists[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            h[idx] += 1           # bucket riêng (không cộng dồn), cộng dồn khi render
+            h[-2] += value
+            h[-1] += 1
+            self._dirty = True
+        self._ensure_flusher()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pid": self.pid,
+                "counters": [[n, list(l), v] for (n, l), v in self.counters.items()],
+                "gauges": [[n, list(l), v] for (n, l), v in self.gauges.items()],
+                "hists": [[n, list(l), list(h)] for (n, l), h in self.hists.items()],
+            }
+
+    # ----- ghi file -----
+    def _ensure_flusher(self):
+        if self._flusher is not None or not _dir():
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        interval = getattr(settings, "METRICS_FLUSH_INTERVAL", 5)
+        me = self._flusher
+        while self._flusher is me:  # sau fork thread cũ không còn, con tự tạo thread mới
+            time.sleep(interval)
+            self.flush()
+
+    def flush(self):
+        directory = _dir()
+        if not directory or not self._dirty:
+            return
+        self._dirty = False
+        snap = self.snapshot()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{snap['pid']}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snap, f)
+        os.replace(tmp, path)
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+# =================== GỘP + RENDER ===================
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect():
+    """Gộp snapshot của mọi process (process hiện tại lấy số liệu trong RAM)."""
+    snaps = [registry.snapshot()]
+    directory = _dir()
+    if directory:
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snap = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snap.get("pid") != registry.pid:
+                snaps.append(snap)
+
+    counters, gauges, hists = {}, {}, {}
+    for snap in snaps:
+        alive = snap["pid"] == registry.pid or _pid_alive(snap["pid"])
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(tuple(x) for x in labels))
+            counters[key] = counters.get(key, 0.0) + value
+        if alive:
+            for name, labels, value in snap["gauges"]:
+                key = (name, tuple(tuple(x) for x in labels))
+                gauges[key] = gauges.get(key, 0.0) + value
+        for name, labels, h in snap["hists"]:
+            key = (name, tuple(tuple(x) for x in labels))
+            cur = hists.get(key)
+            hists[key] = list(h) if cur is None else [a + b for a, b in zip(cur, h)]
+    return counters, gauges, hists
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+def render():
+    counters, gauges, hists = collect()
+    by_name = {}
+    for source in (counters, gauges, hists):
+        for (name, labels), value in source.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labels)} {_num(value)}")
+                continue
+            buckets = SIZE_BUCKETS if name == "shop_http_response_size_bytes" else LATENCY_BUCKETS
+            cumulative = 0
+            for bound, count in zip(buckets + (float("inf"),), value[:-2]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, ('le', _num(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {value[-2]!r}")
+            lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+# =================== MIDDLEWARE ===================
+def _view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match and match.url_name:
+        # shop.urls được include 3 lần ('', 'api/', 'admin-panel/') -> cùng 1 nhãn
+        return f"{match.app_name}:{match.url_name}" if match.app_name else match.url_name
+    return UNRESOLVED  # không dùng path làm nhãn (404 lạ -> bùng nổ số series)
+
+
+class MetricsMiddleware:
+    """Đặt trước QueryStatsMiddleware để đọc được request.mongo_stats sau khi view chạy. Chạy được cả sync / async."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        registry.gauge_add("shop_http_requests_in_flight", (), 1)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            registry.gauge_add("shop_http_requests_in_flight", (), -1)
+        self._observe(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        registry.gauge_add("shop_http_requests_in_flight", (), 1)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            registry.gauge_add("shop_http_requests_in_flight", (), -1)
+        self._observe(request, response, time.perf_counter() - started)
+        return response
+
+    def _observe(self, request, response, elapsed):
+        view = _view_label(request)
+        registry.inc("shop_http_requests_total",
+                     (("view", view), ("method", request.method), ("status", str(response.status_code))))
+        registry.observe("shop_http_request_duration_seconds", (("view", view), ("method", request.method)),
+                         elapsed, LATENCY_BUCKETS)
+        if not getattr(response, "streaming", False):
+            registry.observe("shop_http_response_size_bytes", (("view", view),), len(response.content), SIZE_BUCKETS)
+
+        stats = getattr(request, "mongo_stats", None)
+        if stats is not None:
+            registry.observe("shop_mongo_duration_seconds", (("view", view),), stats.total_ms / 1000.0,
+                             LATENCY_BUCKETS)
+            if stats.count:
+                registry.inc("shop_mongo_commands_total", (("view", view),), stats.count)
@@ -0,0 +1,115 @@
+# shop/pricing.py
+"""
+Phân bố giá của catalog cho thanh trượt khoảng giá (GET /api/products/price-range/):
+
+    {"bins": 20, "cap_nhat": ..., "keys": {
+        "all":        {"min": 15000, "max": 950000, "step": 46800, "count": 1200, "buckets": [n0, ..., n19]},
+        "<danh_muc>": {...},
+        "none":       {...},       # sản phẩm chưa có danh mục
+    }}
+
+- tính cả bảng bằng 1 aggregation ($setWindowFields lấy min/max từng danh mục, chia BINS
+  bucket cùng độ rộng), lưu sẵn ở cau_hinh._id = "gia_histogram"
+- sanpham_view thêm / xoá sản phẩm, đổi gia / danh_muc_id -> apply_change() $inc đúng bucket
+  (1 lệnh); giá mới ra ngoài [min, max] hoặc giá cũ đang là min / max -> tính lại cả bảng
+- import / seed hàng loạt -> invalidate(), lần đọc kế tiếp tự tính lại
+- đọc qua cache gắn version catalog (shop/catalog.py)
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .catalog import cache_key
+from .database import cau_hinh, san_pham
+
+BINS = 20
+DOC_ID = "gia_histogram"
+ALL = "all"
+NO_CATEGORY = "none"
+
+
+def _key(cat_id):
+    return str(cat_id) if cat_id else NO_CATEGORY
+
+
+def empty_entry():
+    return {"min": 0, "max": 0, "step": 1, "count": 0, "buckets": [0] * BINS}
+
+
+def compute() -> dict:
+    """{key: entry} cho "all" + từng danh mục, 1 aggregation trên san_pham."""
+    pipeline = [
+        {"$match": {"gia": {"$type": "number"}}},
+        # mỗi sản phẩm tính vào 2 nhóm: cả catalog + danh mục của nó
+        {"$project": {"_id": 0, "gia": 1,
+                      "k": [ALL, {"$ifNull": [{"$toString": "$danh_muc_id"}, NO_CATEGORY]}]}},
+        {"$unwind": "$k"},
+        {"$setWindowFields": {"partitionBy": "$k", "output": {"lo": {"$min": "$gia"}, "hi": {"$max": "$gia"}}}},
+        {"$set": {"step": {"$max": [1, {"$ceil": {"$divide": [{"$add": [{"$subtract": ["$hi", "$lo"]}, 1]}, BINS]}}]}}},
+        {"$group": {
+            "_id": {"k": "$k", "b": {"$floor": {"$divide": [{"$subtract": ["$gia", "$lo"]}, "$step"]}}},
+            "n": {"$sum": 1}, "lo": {"$first": "$lo"}, "hi": {"$first": "$hi"}, "step": {"$first": "$step"},
+        }},
+    ]
+    keys = {}
+    for row in san_pham.aggregate(pipeline, allowDiskUse=True):
+        entry = keys.get(row["_id"]["k"])
+        if entry is None:
+            entry = keys[row["_id"]["k"]] = {"min": row["lo"], "max": row["hi"], "step": int(row["step"]),
+                                             "count": 0, "buckets": [0] * BINS}
+        entry["buckets"][min(int(row["_id"]["b"]), BINS - 1)] += row["n"]
+        entry["count"] += row["n"]
+    return keys
+
+
+def rebuild() -> dict:
+    doc = {"bins": BINS, "keys": compute(), "cap_nhat": timezone.now()}
+    cau_hinh.replace_one({"_id": DOC_ID}, doc, upsert=True)
+    return doc
+
+
+def invalidate():
+    cau_hinh.delete_one({"_id": DOC_ID})
+
+
+def load() -> dict:
+    """Bảng đã tính sẵn (chưa có thì tính luôn), cache theo version catalog."""
+    key = cache_key(DOC_ID)
+    doc = cache.get(key)
+    if doc is None:
+        doc = cau_hinh.find_one({"_id": DOC_ID}, {"_id": 0}) or rebuild()
+        cache.set(key, doc, getattr(settings, "CATALOG_CACHE_TIMEOUT", 3600))
+    return doc
+
+
+def apply_change(old=None, new=None):
+    """
+    old / new: (danh_muc_id, gia) trước / sau khi ghi san_pham (None = chưa có / đã xoá).
+    Cộng trừ đúng bucket bằng 1 update_one, điều kiện min/max/step không đổi; không được thì tính lại.
+    """
+    if old == new:
+        return
+    changes = []  # (key, gia, +1 | -1)
+    for side, delta in ((old, -1), (new, 1)):
+        if side and isinstance(side[1], (int, float)):
+            changes += [(ALL, side[1], delta), (_key(side[0]), side[1], delta)]
+    if not changes:
+        return
+
+    doc = cau_hinh.find_one({"_id": DOC_ID}, {f"keys.{k}": 1 for k, _, _ in changes})
+    if doc is None:
+        return  # chưa tính lần nào -> lần đọc đầu tiên sẽ tính
+    keys = doc.get("keys") or {}
+    filter_, inc = {"_id": DOC_ID}, {}
+    for k, gia, delta in changes:
+        h = keys.get(k)
+        if not h or not h["min"] <= gia <= h["max"] or (delta < 0 and gia in (h["min"], h["max"])):
+            rebuild()  # khoảng giá đổi -> độ rộng bucket đổi
+            return
+        i = min(int((gia - h["min"]) // h["step"]), BINS - 1)
+        for path in (f"keys.{k}.buckets.{i}", f"keys.{k}.count"):
+            inc[path] = inc.get(path, 0) + delta
+        filter_.update({f"keys.{k}.min": h["min"], f"keys.{k}.max": h["max"], f"keys.{k}.step": h["step"]})
+    inc = {path: d for path, d in inc.items() if d}
+    if inc and cau_hinh.update_one(filter_, {"$inc": inc}).matched_count == 0:
+        rebuild()  # worker khác vừa tính lại bảng giữa chừng
@@ -0,0 +1,316 @@
+# shop/profiling.py
+"""
+Profiler lấy mẫu (statistical sampler) cho request production, bật bằng PROFILING_ENABLED.
+
+Request được profile khi:
+- random() < PROFILING_SAMPLE_RATE, hoặc
+- có header X-Shop-Profile = token ký bởi SECRET_KEY (lấy ở trang admin, hết hạn sau
+  PROFILING_TOKEN_MAX_AGE giây)
+
+Trong lúc view chạy, 1 thread phụ chụp stack của thread xử lý request mỗi
+PROFILING_INTERVAL giây (sys._current_frames). Chỉ tốn chi phí với request được chọn.
+Kết quả lưu ở PROFILING_DIR: <id>.meta.json (URL name, thời gian, lệnh Mongo, params)
+và <id>.samples.json; tải về dạng pstats hoặc speedscope.
+"""
+import json
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+HEADER = "X-Shop-Profile"
+TOKEN_SALT = "shop.profiling"
+MAX_STACK_DEPTH = 200
+MAX_PARAM_LENGTH = 200
+MAX_BODY_BYTES = 16 * 1024
+REDACTED_KEYS = ("mat_khau", "password", "token", "secret", "vnp_SecureHash")
+
+
+def _dir():
+    return getattr(settings, "PROFILING_DIR")
+
+
+# =================== TOKEN ===================
+def make_token() -> str:
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign("profile")
+
+
+def check_token(value: str) -> bool:
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            value, max_age=getattr(settings, "PROFILING_TOKEN_MAX_AGE", 3600))
+        return True
+    except signing.BadSignature:
+        return False
+
+
+# =================== SAMPLER ===================
+class Sampler:
+    """Chụp stack của 1 thread theo chu kỳ; frames được đánh số để lưu gọn."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames = []        # [(file, line, func)]
+        self._frame_index = {}
+        self.samples = []       # [[frame idx root -> leaf]]
+        self.weights = []       # giây
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+
+    def _index(self, code):
+        key = (code.co_filename, code.co_firstlineno, code.co_name)
+        idx = self._frame_index.get(key)
+        if idx is None:
+            idx = self._frame_index[key] = len(self.frames)
+            self.frames.append(key)
+        return idx
+
+    def _sample(self, weight):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            stack.append(self._index(frame.f_code))
+            frame = frame.f_back
+        if stack:
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append(weight)
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - last)
+            last = now
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+# =================== EXPORT ===================
+def to_speedscope(meta, data) -> dict:
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": [{"name": func, "file": file, "line": line} for file, line, func in data["frames"]]},
+        "profiles": [{
+            "type": "sampled",
+            "name": f"{meta['method']} {meta['path']} ({meta['url_name']})",
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(data["weights"]),
+            "samples": data["samples"],
+            "weights": data["weights"],
+        }],
+        "name": meta["id"],
+        "exporter": "shop.profiling",
+    }
+
+
+def to_pstats(data) -> bytes:
+    """
+    Dựng dict stats đúng định dạng pstats (marshal) từ các mẫu:
+    tt = thời gian ở đỉnh stack, ct = thời gian có mặt trong stack, nc = số mẫu.
+    Đọc bằng: python -m pstats file.prof  /  snakeviz file.prof
+    """
+    frames = [tuple(f) for f in data["frames"]]
+    stats = {}
+
+    def _entry(key):
+        if key not in stats:
+            stats[key] = [0, 0, 0.0, 0.0, {}]
+        return stats[key]
+
+    for stack, w in zip(data["samples"], data["weights"]):
+        seen = set()
+        for depth, idx in enumerate(stack):
+            key = frames[idx]
+            e = _entry(key)
+            leaf = depth == len(stack) - 1
+            if leaf:
+                e[2] += w
+            if key in seen:  # đệ quy: ct chỉ cộng 1 lần / mẫu
+                continue
+            seen.add(key)
+            e[0] += 1
+            e[1] += 1
+            e[3] += w
+            if depth:
+                caller = frames[stack[depth - 1]]
+                c = e[4].get(caller, (0, 0, 0.0, 0.0))
+                e[4][caller] = (c[0] + 1, c[1] + 1, c[2] + (w if leaf else 0.0), c[3] + w)
+    return marshal.dumps({k: (v[0], v[1], v[2], v[3], v[4]) for k, v in stats.items()})
+
+
+# =================== STORAGE ===================
+def _redact(params: dict) -> dict:
+    out = {}
+    for k, v in params.items():
+        if any(r.lower() in str(k).lower() for r in REDACTED_KEYS):
+            out[k] = "***"
+        elif isinstance(v, dict):
+            out[k] = _redact(v)
+        else:
+            text = v if isinstance(v, (int, float, bool)) or v is None else str(v)
+            out[k] = text[:MAX_PARAM_LENGTH] if isinstance(text, str) else text
+    return out
+
+
+def _request_params(request) -> dict:
+    params = {"query": _redact(request.GET.dict())}
+    ctype = request.content_type or ""
+    if request.method in ("POST", "PUT", "PATCH"):
+        try:
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = MAX_BODY_BYTES + 1
+        if ctype.startswith("application/json") and length <= MAX_BODY_BYTES:
+            try:
+                body = json.loads(request.body.decode("utf-8"))
+                params["body"] = _redact(body) if isinstance(body, dict) else "<json>"
+            except ValueError:
+                params["body"] = "<invalid json>"
+        elif ctype.startswith(("multipart/", "application/x-www-form-urlencoded")):
+            params["form"] = _redact(request.POST.dict())
+            if request.FILES:
+                params["files"] = [f.name for f in request.FILES.values()]
+    return params
+
+
+def save_profile(meta: dict, sampler: Sampler):
+    directory = _dir()
+    os.makedirs(directory, exist_ok=True)
+    data = {"frames": sampler.frames, "samples": sampler.samples, "weights": sampler.weights}
+    with open(os.path.join(directory, f"{meta['id']}.samples.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    with open(os.path.join(directory, f"{meta['id']}.meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    _prune(directory)
+
+
+def _prune(directory):
+    keep = getattr(settings, "PROFILING_MAX_PROFILES", 200)
+    metas = sorted((e for e in os.scandir(directory) if e.name.endswith(".meta.json")),
+                   key=lambda e: e.stat().st_mtime, reverse=True)
+    for e in metas[keep:]:
+        pid = e.name[: -len(".meta.json")]
+        for suffix in (".meta.json", ".samples.json"):
+            try:
+                os.remove(os.path.join(directory, pid + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    directory = _dir()
+    if not os.path.isdir(directory):
+        return []
+    out = []
+    for e in os.scandir(directory):
+        if e.name.endswith(".meta.json"):
+            try:
+                with open(e.path, encoding="utf-8") as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return out
+
+
+def load_profile(profile_id: str):
+    """(meta, data) hoặc None. profile_id phải là hex (không cho path traversal)."""
+    if not profile_id or any(c not in "0123456789abcdef" for c in profile_id):
+        return None
+    directory = _dir()
+    try:
+        with open(os.path.join(directory, f"{profile_id}.meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, f"{profile_id}.samples.json"), encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta, data
+
+
+def top_functions(data, limit=10):
+    """[(func, file:line, self s, total s)] theo thời gian tự thân — hiển thị nhanh trên trang admin."""
+    selfs, totals = {}, {}
+    for stack, w in zip(data["samples"], data["weights"]):
+        selfs[stack[-1]] = selfs.get(stack[-1], 0.0) + w
+        for idx in set(stack):
+            totals[idx] = totals.get(idx, 0.0) + w
+    rows = sorted(selfs.items(), key=lambda kv: -kv[1])[:limit]
+    return [(data["frames"][i][2], f"{data['frames'][i][0]}:{data['frames'][i][1]}", s, totals[i]) for i, s in rows]
+
+
+# =================== MIDDLEWARE ===================
+class ProfilingMiddleware:
+    """Đặt sau QueryStatsMiddleware (cần request.mongo_stats)."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.rate = float(getattr(settings, "PROFILING_SAMPLE_RATE", 0) or 0)
+        self.interval = float(getattr(settings, "PROFILING_INTERVAL", 0.002))
+
+    def _trigger(self, request):
+        token = request.headers.get(HEADER)
+        if token:
+            return "header" if check_token(token) else None
+        if self.rate and random.random() < self.rate:
+            return "sample"
+        return None
+
+    def __call__(self, request):
+        trigger = self._trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        params = _request_params(request)  # đọc body trước khi view tiêu thụ stream
+        sampler = Sampler(threading.get_ident(), self.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        from .instrumentation import _url_name
+        stats = getattr(request, "mongo_stats", None)
+        meta = {
+            "id": uuid.uuid4().hex,
+            "ts": timezone.now().isoformat(),
+            "trigger": trigger,
+            "url_name": _url_name(request),
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "elapsed_ms": round(elapsed_ms, 2),
+            "samples": len(sampler.samples),
+            "params": params,
+            "mongo": {
+                "count": stats.count,
+                "total_ms": round(stats.total_ms, 2),
+                "commands": [{"shape": s, "ms": round(ms, 2), "ok": ok} for s, ms, ok in stats.commands],
+            } if stats is not None else None,
+        }
+        try:
+            save_profile(meta, sampler)
+        except OSError:
+            pass  # không để lỗi ghi file làm hỏng response
+        if trigger == "header":
+            response["X-Shop-Profile-Id"] = meta["id"]
+        return response
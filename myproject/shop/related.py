@@ -0,0 +1,92 @@
+# shop/related.py
+"""
+Sản phẩm liên quan tính sẵn (offline), lưu trên sản phẩm: san_pham.san_pham_lien_quan = [ObjectId, ...]
+
+1) "hay mua cùng": đếm cặp sản phẩm xuất hiện chung trong don_hang.items (bỏ đơn đã huỷ),
+   mỗi sản phẩm lấy RELATED_LIMIT sản phẩm mua cùng nhiều nhất
+2) thiếu thì bù bằng sản phẩm mới nhất cùng danh mục (như trang chi tiết cũ)
+
+Chạy bằng `python manage.py compute_related` (cron hằng đêm); trang chi tiết chỉ đọc danh sách id.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from .database import don_hang, san_pham
+
+RELATED_LIMIT = 8
+FIELD = "san_pham_lien_quan"
+BATCH_SIZE = 1000
+
+
+def co_purchases(limit=RELATED_LIMIT, since=None, min_count=1) -> dict:
+    """{san_pham_id: [id mua cùng, nhiều lần nhất trước]} từ don_hang.items."""
+    match = {"trang_thai": {"$ne": "da_huy"}, "items.1": {"$exists": True}}
+    if since is not None:
+        match["ngay_tao"] = {"$gte": since}
+    pipeline = [
+        {"$match": match},
+        {"$project": {"_id": 0, "a": {"$setUnion": ["$items.san_pham_id", []]}}},
+        {"$project": {"a": 1, "b": "$a"}},
+        {"$unwind": "$a"},
+        {"$unwind": "$b"},
+        {"$match": {"$expr": {"$ne": ["$a", "$b"]}}},
+        {"$group": {"_id": {"a": "$a", "b": "$b"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gte": min_count}}},
+        {"$sort": {"_id.a": 1, "n": -1, "_id.b": -1}},
+        {"$group": {"_id": "$_id.a", "ids": {"$push": "$_id.b"}}},
+        {"$project": {"ids": {"$slice": ["$ids", limit]}}},
+    ]
+    return {row["_id"]: row["ids"] for row in don_hang.aggregate(pipeline, allowDiskUse=True)}
+
+
+def newest_by_category(limit=RELATED_LIMIT) -> dict:
+    """{danh_muc_id | None: [id mới nhất trước]} — lấy dư 1 để còn đủ sau khi bỏ chính nó."""
+    pipeline = [
+        {"$sort": {"_id": -1}},
+        {"$group": {"_id": "$danh_muc_id", "ids": {"$push": "$_id"}}},
+        {"$project": {"ids": {"$slice": ["$ids", limit + 1]}}},
+    ]
+    return {row["_id"]: row["ids"] for row in san_pham.aggregate(pipeline, allowDiskUse=True)}
+
+
+def pick_related(pid, cat_id, co, by_cat, newest, limit=RELATED_LIMIT) -> list:
+    out = []
+    # sản phẩm không có danh mục -> mới nhất toàn shop (giống trang cũ)
+    fallback = by_cat.get(cat_id, []) if cat_id is not None else newest
+    for rid in list(co.get(pid, [])) + list(fallback):
+        if rid != pid and rid not in out:
+            out.append(rid)
+            if len(out) >= limit:
+                break
+    return out
+
+
+def compute_related(limit=RELATED_LIMIT, since_days=None, min_count=1, batch_size=BATCH_SIZE, progress=None) -> dict:
+    since = timezone.now() - timedelta(days=since_days) if since_days else None
+    co = co_purchases(limit=limit, since=since, min_count=min_count)
+    by_cat = newest_by_category(limit=limit)
+    newest = [d["_id"] for d in san_pham.find({}, {"_id": 1}).sort("_id", -1).limit(limit + 1)]
+
+    now = timezone.now()
+    report = {"products": 0, "co_purchase": 0, "updated": 0}
+    ops = []
+
+    def _flush():
+        if ops:
+            report["updated"] += san_pham.bulk_write(ops, ordered=False).modified_count
+            ops.clear()
+            if progress:
+                progress(report)
+
+    for sp in san_pham.find({}, {"danh_muc_id": 1}):
+        report["products"] += 1
+        if sp["_id"] in co:
+            report["co_purchase"] += 1
+        ids = pick_related(sp["_id"], sp.get("danh_muc_id"), co, by_cat, newest, limit=limit)
+        ops.append(UpdateOne({"_id": sp["_id"]}, {"$set": {FIELD: ids, "lien_quan_cap_nhat": now}}))
+        if len(ops) >= batch_size:
+            _flush()
+    _flush()
+    return report
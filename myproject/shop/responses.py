@@ -0,0 +1,77 @@
+# shop/responses.py
+"""
+FastJsonResponse: JsonResponse dùng orjson (nếu cài) và hiểu sẵn kiểu của Mongo,
+nên serializer có thể trả thẳng ObjectId / datetime thay vì str() / isoformat() từng field.
+
+- ObjectId            -> "65b0..."
+- datetime            -> ISO theo TIME_ZONE (Asia/Ho_Chi_Minh); naive coi là UTC (pymongo trả naive UTC)
+- date                -> "YYYY-MM-DD"
+- Decimal128, Decimal -> int nếu là số nguyên (tiền VND), không thì chuỗi (giữ đúng độ chính xác)
+Output giống hệt JsonResponse + str()/_to_local_iso cũ.
+"""
+import datetime as dt
+import json
+from decimal import Decimal
+
+from bson import Decimal128, ObjectId
+from django.http import HttpResponse
+from django.utils import timezone
+
+try:
+    import orjson
+except ImportError:  # orjson là tuỳ chọn
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+
+
+def _localize(value: dt.datetime) -> str:
+    if timezone.is_naive(value):
+        value = value.replace(tzinfo=dt.timezone.utc)
+    return timezone.localtime(value).isoformat()
+
+
+def _decimal(value: Decimal):
+    return int(value) if value == value.to_integral_value() else str(value)
+
+
+def default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, dt.datetime):
+        return _localize(value)
+    if isinstance(value, dt.date):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return _decimal(value.to_decimal())
+    if isinstance(value, Decimal):
+        return _decimal(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if HAS_ORJSON:
+    # PASSTHROUGH_DATETIME: để default() đổi sang giờ VN thay vì giữ nguyên tzinfo
+    _ORJSON_OPTS = orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(data) -> bytes:
+        return orjson.dumps(data, default=default, option=_ORJSON_OPTS)
+else:
+    def dumps(data) -> bytes:
+        return json.dumps(data, default=default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_stdlib(data) -> bytes:
+    """Bản json stdlib (luôn có) — dùng cho benchmark so sánh."""
+    return json.dumps(data, default=default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJsonResponse(HttpResponse):
+    """Thay thế JsonResponse: cùng tham số data / safe / status."""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError("In order to allow non-dict objects to be serialized set the safe parameter to False.")
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,154 @@
+# shop/sales.py
+"""
+Bộ đếm bán hàng lưu trên sản phẩm (sort "bán chạy" / "xu hướng" không phải aggregate don_hang):
+
+    san_pham.da_ban         tổng số lượng đã bán (không tính đơn huỷ)
+    san_pham.da_ban_7d      số lượng bán trong WINDOW_DAYS ngày gần nhất (tính cả hôm nay)
+    san_pham.ban_theo_ngay  {"20261019": 5, ...} bucket theo ngày (giờ địa phương) để trượt cửa sổ
+
+- cộng / trừ trong cùng lệnh $inc với so_luong_ton (donhang_view._try_decrease_stock /
+  _rollback_increase_stock) -> checkout, huỷ đơn không tốn thêm lệnh nào
+- huỷ đơn trừ vào bucket của ngày đặt đơn; đơn đã trôi khỏi cửa sổ chỉ trừ da_ban
+- `python manage.py refresh_sales` (cron hằng đêm, sau 0h): bỏ bucket quá hạn, tính lại da_ban_7d,
+  tạo index; `--rebuild` tính lại toàn bộ từ don_hang (lần đầu triển khai / lệch số)
+- index (da_ban, _id) / (da_ban_7d, _id), kèm bản có danh_muc_id -> sort rẻ như sort theo giá
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from .database import don_hang, san_pham
+
+SOLD = "da_ban"
+SOLD_WINDOW = "da_ban_7d"
+DAILY = "ban_theo_ngay"
+WINDOW_DAYS = 7
+BATCH_SIZE = 1000
+
+INDEXES = [
+    [(SOLD, -1), ("_id", -1)],
+    [(SOLD_WINDOW, -1), ("_id", -1)],
+    [("danh_muc_id", 1), (SOLD, -1), ("_id", -1)],
+    [("danh_muc_id", 1), (SOLD_WINDOW, -1), ("_id", -1)],
+]
+
+
+def _local_day(dt=None):
+    """Ngày địa phương của ngay_tao; None nếu không đọc được."""
+    if dt is None:
+        return timezone.localdate()
+    if isinstance(dt, str):
+        # dữ liệu cũ lưu string ISO (giờ địa phương) -> lấy đúng ngày ghi trong string
+        try:
+            return datetime.fromisoformat(dt.strip()[:19]).date()
+        except ValueError:
+            return None
+    if not isinstance(dt, datetime):
+        return None
+    if timezone.is_naive(dt):
+        dt = dt.replace(tzinfo=dt_timezone.utc)  # pymongo trả datetime naive (UTC)
+    return timezone.localdate(dt)
+
+
+def window_start():
+    """Ngày đầu tiên còn nằm trong cửa sổ WINDOW_DAYS ngày."""
+    return timezone.localdate() - timedelta(days=WINDOW_DAYS - 1)
+
+
+def sale_inc(qty: int, sold_at=None) -> dict:
+    """
+    Các field cần $inc khi bán qty (âm = hoàn lại) cho đơn đặt lúc sold_at (mặc định: bây giờ).
+    Ghép chung với so_luong_ton: {"$inc": {"so_luong_ton": -qty, **sale_inc(qty)}}
+    Không đọc được ngày đặt (string hỏng) -> chỉ cộng / trừ da_ban.
+    """
+    day = _local_day(sold_at)
+    inc = {SOLD: qty}
+    if day is not None and day >= window_start():
+        inc[SOLD_WINDOW] = qty
+        inc[f"{DAILY}.{day:%Y%m%d}"] = qty
+    return inc
+
+
+def ensure_indexes():
+    for keys in INDEXES:
+        san_pham.create_index(keys)
+
+
+def refresh_window() -> int:
+    """Bỏ bucket ngoài cửa sổ và tính lại da_ban_7d (1 update_many, nguyên tử trên từng sản phẩm)."""
+    start = f"{window_start():%Y%m%d}"
+    res = san_pham.update_many({DAILY: {"$exists": True}}, [
+        {"$set": {DAILY: {"$arrayToObject": {"$filter": {
+            "input": {"$objectToArray": "$" + DAILY},
+            "cond": {"$gte": ["$$this.k", start]},
+        }}}}},
+        {"$set": {SOLD_WINDOW: {"$sum": {"$map": {"input": {"$objectToArray": "$" + DAILY}, "in": "$$this.v"}}}}},
+    ])
+    return res.modified_count
+
+
+# ngay_tao -> date; dữ liệu cũ lưu string ISO giờ địa phương (như _local_day), không đọc được -> null
+# (vẫn tính vào da_ban, không vào bucket ngày) thay vì làm hỏng cả aggregation
+_DATE_EXPR = {"$cond": [
+    {"$eq": [{"$type": "$ngay_tao"}, "string"]},
+    {"$dateFromString": {"dateString": {"$substrCP": ["$ngay_tao", 0, 19]}, "timezone": settings.TIME_ZONE,
+                         "onError": None, "onNull": None}},
+    {"$convert": {"input": "$ngay_tao", "to": "date", "onError": None, "onNull": None}},
+]}
+
+
+def sales_by_day(since=None) -> dict:
+    """{san_pham_id: {"YYYYMMDD": số lượng}} từ don_hang (bỏ đơn huỷ, gồm cả đơn legacy 1 sản phẩm)."""
+    match = {"trang_thai": {"$ne": "da_huy"}}
+    if since is not None:
+        match["ngay_tao"] = {"$gte": since}
+    pipeline = [
+        {"$match": match},
+        {"$project": {"ngay_tao": _DATE_EXPR, "items": {"$ifNull": [
+            "$items", [{"san_pham_id": "$san_pham_id", "so_luong": "$so_luong"}],
+        ]}}},
+        {"$unwind": "$items"},
+        {"$match": {"items.san_pham_id": {"$type": "objectId"}}},
+        {"$group": {
+            "_id": {
+                "sp": "$items.san_pham_id",
+                "day": {"$dateToString": {"format": "%Y%m%d", "date": "$ngay_tao", "timezone": settings.TIME_ZONE}},
+            },
+            "n": {"$sum": {"$toInt": {"$ifNull": ["$items.so_luong", 0]}}},
+        }},
+    ]
+    out = {}
+    for row in don_hang.aggregate(pipeline, allowDiskUse=True):
+        out.setdefault(row["_id"]["sp"], {})[row["_id"]["day"] or ""] = row["n"]
+    return out
+
+
+def rebuild(batch_size=BATCH_SIZE, progress=None) -> dict:
+    """Tính lại da_ban / da_ban_7d / ban_theo_ngay của mọi sản phẩm từ don_hang."""
+    start = f"{window_start():%Y%m%d}"
+    by_product = sales_by_day()
+    report = {"products": 0, "sold": 0, "updated": 0}
+    ops = []
+
+    def _flush():
+        if ops:
+            report["updated"] += san_pham.bulk_write(ops, ordered=False).modified_count
+            ops.clear()
+            if progress:
+                progress(report)
+
+    for sp in san_pham.find({}, {"_id": 1}):
+        report["products"] += 1
+        days = by_product.get(sp["_id"], {})
+        recent = {k: v for k, v in days.items() if k >= start}
+        if days:
+            report["sold"] += 1
+        ops.append(UpdateOne({"_id": sp["_id"]}, {"$set": {
+            SOLD: sum(days.values()), SOLD_WINDOW: sum(recent.values()), DAILY: recent,
+        }}))
+        if len(ops) >= batch_size:
+            _flush()
+    _flush()
+    return report
@@ -0,0 +1,108 @@
+# shop/sessions.py
+"""
+Session engine lưu trong MongoDB (SESSION_ENGINE = "shop.sessions"), thay cho bảng
+django_session trên db.sqlite3: nhiều worker đọc / ghi song song không tranh khoá file.
+
+- collection "django_session": {_id: session_key, session_data, expire_date}
+- TTL index trên expire_date -> Mongo tự xoá session hết hạn (không cần cron clearsessions)
+- SESSION_MONGO_CACHE: đọc qua cache local (kiểu cached_db), ghi xuyên xuống Mongo.
+  Cache là của từng worker nên chỉ giữ SESSION_MONGO_CACHE_TTL giây (logout / đổi quyền
+  ở worker khác có hiệu lực chậm nhất sau chừng đó).
+"""
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError, SessionBase, UpdateError
+from django.core.cache import caches
+from django.utils import timezone
+from pymongo.errors import DuplicateKeyError
+
+from .database import sessions
+
+KEY_PREFIX = "shop.sessions.mongo"
+
+_indexed = False
+
+
+def _ensure_indexes():
+    global _indexed
+    if not _indexed:
+        # expireAfterSeconds=0: xoá ngay khi qua expire_date (TTL monitor chạy mỗi ~60s)
+        sessions.create_index("expire_date", expireAfterSeconds=0)
+        _indexed = True
+
+
+class SessionStore(SessionBase):
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._cache = caches[settings.SESSION_CACHE_ALIAS] if getattr(settings, "SESSION_MONGO_CACHE", False) else None
+
+    @property
+    def cache_key(self):
+        return KEY_PREFIX + self._get_or_create_session_key()
+
+    def _cache_timeout(self):
+        return min(self.get_expiry_age(), getattr(settings, "SESSION_MONGO_CACHE_TTL", 30))
+
+    def load(self):
+        if self._cache is not None and self.session_key:
+            data = self._cache.get(KEY_PREFIX + self.session_key)
+            if data is not None:
+                return data
+        doc = None
+        if self.session_key:
+            doc = sessions.find_one({"_id": self.session_key, "expire_date": {"$gt": timezone.now()}},
+                                    {"session_data": 1})
+        if doc is None:
+            self._session_key = None
+            return {}
+        data = self.decode(doc["session_data"])
+        if self._cache is not None:
+            self._cache.set(KEY_PREFIX + self.session_key, data, self._cache_timeout())
+        return data
+
+    def exists(self, session_key):
+        if self._cache is not None and (KEY_PREFIX + session_key) in self._cache:
+            return True
+        return sessions.count_documents({"_id": session_key}, limit=1) > 0
+
+    def create(self):
+        while True:
+            self._session_key = self._get_new_session_key()
+            try:
+                self.save(must_create=True)
+            except CreateError:
+                continue  # trùng key (rất hiếm) -> sinh key khác
+            self.modified = True
+            return
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        _ensure_indexes()
+        data = self._get_session(no_load=must_create)
+        fields = {"session_data": self.encode(data), "expire_date": self.get_expiry_date()}
+        if must_create:
+            try:
+                sessions.insert_one({"_id": self._get_or_create_session_key(), **fields})
+            except DuplicateKeyError:
+                raise CreateError
+        else:
+            res = sessions.update_one({"_id": self.session_key}, {"$set": fields})
+            if res.matched_count == 0:
+                # bị xoá / hết hạn giữa chừng (giống backend db của Django)
+                raise UpdateError
+        if self._cache is not None:
+            self._cache.set(self.cache_key, data, self._cache_timeout())
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        sessions.delete_one({"_id": session_key})
+        if self._cache is not None:
+            self._cache.delete(KEY_PREFIX + session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        # TTL index đã lo; giữ để `manage.py clearsessions` vẫn chạy đúng
+        sessions.delete_many({"expire_date": {"$lt": timezone.now()}})
@@ -0,0 +1,216 @@
+# shop/slowlog.py
+"""
+Slow query log: find / aggregate / count chạy trong request lâu hơn MONGO_SLOW_QUERY_MS
+được chạy lại bằng explain("executionStats") ở thread nền, tóm tắt plan
+(COLLSCAN / IXSCAN, docs examined / returned, sort trong bộ nhớ) rồi ghi vào
+capped collection `slow_queries`. Trang admin: /admin-panel/slow-queries/.
+
+Cùng 1 query shape chỉ explain tối đa 1 lần mỗi MONGO_SLOW_QUERY_EXPLAIN_INTERVAL giây;
+hàng đợi đầy thì bỏ qua (không bao giờ làm chậm request).
+
+Số lần chậm thì đếm MỌI lần, không phụ thuộc giới hạn explain: cộng trong RAM theo
+(shape, giờ), thread nền ghi gộp mỗi STATS_FLUSH_INTERVAL giây ($inc / $max, upsert) vào
+`slow_query_stats` (TTL STATS_TTL_DAYS ngày).
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import UpdateOne
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+logger = logging.getLogger("shop.mongo")
+
+EXPLAINABLE = {"find", "aggregate", "count"}
+COLLECTION = "slow_queries"
+STATS_COLLECTION = "slow_query_stats"
+STATS_FLUSH_INTERVAL = 5  # giây
+STATS_TTL_DAYS = 30
+QUEUE_MAX = 100
+# Các field driver tự gắn vào lệnh, không được gửi lại trong explain
+_DRIVER_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "$db", "$clusterTime",
+                  "$readPreference", "readConcern", "writeConcern", "apiVersion", "apiStrict", "apiDeprecationErrors"}
+# Nhánh không thuộc plan được chọn
+_SKIP_KEYS = {"rejectedPlans", "allPlansExecution", "command", "serverInfo", "serverParameters"}
+
+
+def threshold_ms():
+    return getattr(settings, "MONGO_SLOW_QUERY_MS", None)
+
+
+# =================== PLAN SUMMARY ===================
+def _walk(node, out):
+    if isinstance(node, list):
+        for x in node:
+            _walk(x, out)
+        return
+    if not isinstance(node, dict):
+        return
+    stage = node.get("stage")
+    if isinstance(stage, str):
+        out["stages"].append(stage)
+        if node.get("indexName"):
+            out["indexes"].append(node["indexName"])
+    for key in ("totalDocsExamined", "totalKeysExamined", "nReturned", "executionTimeMillis"):
+        if key in node and "executionSuccess" in node:  # chỉ lấy ở cấp executionStats
+            out[key] = out.get(key, 0) + int(node[key] or 0)
+    for key, value in node.items():
+        if key not in _SKIP_KEYS and isinstance(value, (dict, list)):
+            _walk(value, out)
+
+
+def summarize_plan(explain: dict) -> dict:
+    """Rút gọn output explain (find, aggregate kiểu cũ $cursor lẫn SBE) thành vài chỉ số."""
+    out = {"stages": [], "indexes": []}
+    _walk(explain, out)
+    stages = list(dict.fromkeys(out["stages"]))
+    return {
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages,
+        "ixscan": any(s in ("IXSCAN", "EXPRESS_IXSCAN", "IDHACK", "EXPRESS_IDHACK") for s in stages),
+        "indexes": list(dict.fromkeys(out["indexes"])),
+        "sort_in_memory": "SORT" in stages,
+        "docs_examined": out.get("totalDocsExamined"),
+        "keys_examined": out.get("totalKeysExamined"),
+        "n_returned": out.get("nReturned"),
+        "explain_ms": out.get("executionTimeMillis"),
+    }
+
+
+def explainable_command(command: dict) -> dict:
+    return {k: v for k, v in command.items() if k not in _DRIVER_FIELDS}
+
+
+# =================== BACKGROUND WORKER ===================
+class SlowQueryLog:
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=QUEUE_MAX)
+        self._last = {}  # shape -> monotonic của lần explain gần nhất
+        self._hits = {}  # (db, shape, giờ) -> số lần / thời gian chưa ghi
+        self._lock = threading.Lock()
+        self._thread = None
+        self._collection_ready = False
+        self._stats_ready = set()
+
+    def submit(self, db_name, command_name, command, shape, duration_ms, url_name=None, path=None):
+        interval = getattr(settings, "MONGO_SLOW_QUERY_EXPLAIN_INTERVAL", 60)
+        now = time.monotonic()
+        ts = timezone.now()
+        coll = command.get(command_name)
+        with self._lock:
+            self._count_hit(db_name, shape, ts, duration_ms, url_name, command_name,
+                            coll if isinstance(coll, str) else "")
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="slow-query-explain", daemon=True)
+                self._thread.start()
+            if now - self._last.get(shape, -interval) < interval:
+                return
+            self._last[shape] = now
+        try:
+            self._queue.put_nowait({
+                "db": db_name, "command_name": command_name, "command": explainable_command(command),
+                "shape": shape, "duration_ms": round(duration_ms, 2), "url_name": url_name, "path": path,
+                "ts": ts,
+            })
+        except queue.Full:
+            pass
+
+    # ----- đếm mọi lần chậm -----
+    def _count_hit(self, db_name, shape, ts, duration_ms, url_name, command_name, collection):
+        """Gọi khi đang giữ self._lock."""
+        key = (db_name, shape, ts.replace(minute=0, second=0, microsecond=0))
+        hit = self._hits.get(key)
+        if hit is None:
+            hit = self._hits[key] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ts": ts, "url_names": set(),
+                                     "command": command_name, "collection": collection}
+        hit["count"] += 1
+        hit["total_ms"] += duration_ms
+        hit["max_ms"] = max(hit["max_ms"], duration_ms)
+        hit["last_ts"] = max(hit["last_ts"], ts)
+        if url_name:
+            hit["url_names"].add(url_name)
+
+    def pending_hits(self):
+        with self._lock:
+            return {k: dict(v) for k, v in self._hits.items()}
+
+    def flush_hits(self) -> int:
+        """Ghi số lần chậm đang gom: 1 bulk_write / DB. Return: số (shape, giờ) đã ghi."""
+        from .database import client  # tránh import vòng (database -> instrumentation -> slowlog)
+
+        with self._lock:
+            hits, self._hits = self._hits, {}
+        by_db = {}
+        for (db_name, shape, hour), hit in hits.items():
+            by_db.setdefault(db_name, []).append(UpdateOne({"shape": shape, "gio": hour}, {
+                "$inc": {"count": hit["count"], "total_ms": round(hit["total_ms"], 2)},
+                "$max": {"max_ms": round(hit["max_ms"], 2), "last_ts": hit["last_ts"]},
+                "$set": {"command": hit["command"], "collection": hit["collection"]},
+                "$addToSet": {"url_names": {"$each": sorted(hit["url_names"])}},
+            }, upsert=True))
+        for db_name, ops in by_db.items():
+            self._stats_collection(client[db_name]).bulk_write(ops, ordered=False)
+        return len(hits)
+
+    def _stats_collection(self, db):
+        coll = db[STATS_COLLECTION]
+        if db.name not in self._stats_ready:
+            coll.create_index([("shape", 1), ("gio", 1)], unique=True)
+            coll.create_index("gio", expireAfterSeconds=STATS_TTL_DAYS * 86400)
+            self._stats_ready.add(db.name)
+        return coll
+
+    def _run(self):
+        next_flush = time.monotonic() + STATS_FLUSH_INTERVAL
+        while True:
+            try:
+                job = self._queue.get(timeout=max(0.0, next_flush - time.monotonic()))
+            except queue.Empty:
+                job = None
+            if job is not None:
+                try:
+                    self._process(job)
+                except PyMongoError as e:
+                    logger.warning("slow query explain failed: %s (%s)", e, job["shape"])
+                except Exception:
+                    logger.exception("slow query explain failed (%s)", job["shape"])
+            if time.monotonic() >= next_flush:
+                try:
+                    self.flush_hits()
+                except Exception:
+                    logger.exception("slow query stats flush failed")  # số liệu chẩn đoán: bỏ lượt này
+                next_flush = time.monotonic() + STATS_FLUSH_INTERVAL
+
+    def _collection(self, db):
+        if not self._collection_ready:
+            try:
+                db.create_collection(COLLECTION, capped=True,
+                                     size=getattr(settings, "MONGO_SLOW_QUERY_LOG_BYTES", 16 * 1024 * 1024),
+                                     max=getattr(settings, "MONGO_SLOW_QUERY_LOG_MAX", 5000))
+            except CollectionInvalid:
+                pass  # đã có
+            self._collection_ready = True
+        return db[COLLECTION]
+
+    def _process(self, job):
+        from .database import client  # tránh import vòng (database -> instrumentation -> slowlog)
+
+        db = client[job["db"]]
+        explain = db.command({"explain": job["command"], "verbosity": "executionStats"})
+        coll = job["command"].get(job["command_name"])
+        self._collection(db).insert_one({
+            "ts": job["ts"],
+            "shape": job["shape"],
+            "command": job["command_name"],
+            "collection": coll if isinstance(coll, str) else "",
+            "duration_ms": job["duration_ms"],
+            "url_name": job["url_name"],
+            "path": job["path"],
+            "plan": summarize_plan(explain),
+        })
+
+
+slow_query_log = SlowQueryLog()
@@ -1,3 +1,1225 @@
-from django.test import TestCase
+"""
+Ngân sách truy vấn Mongo cho từng endpoint trong shop/urls.py.
 
-# Create your tests here.
+Mỗi URL name khai báo trong QUERY_BUDGETS: số lệnh Mongo tối đa và số document
+tối đa Mongo phải đọc (docsExamined, lấy từ database profiler) cho 1 request.
+Thêm biến thể cho cùng URL bằng hậu tố "#": "shop:sanpham_list#cat_best_seller".
+Vượt ngân sách -> test fail kèm danh sách query shape gây ra.
+
+AsyncParityTests: các view trong shop/views/async_api.py (chỉ dùng khi ASYNC_API) phải trả
+đúng status + JSON như bản đồng bộ cho cùng dữ liệu.
+
+Các lớp *UNIT* cuối file (Range / ETag, import, query shape, histogram giá, bộ đếm bán hàng,
+fan-out, bộ đếm ghi trễ, slow query log, ảnh upload) không cần mongod.
+
+Ngân sách / parity / batch cần mongod chạy tại settings.MONGO_URI (DB riêng "TraiCay_test", bị xoá & seed lại
+trước mỗi test). Không có mongod thì các lớp test này bị skip.
+
+    python manage.py test shop
+"""
+import contextvars
+import hashlib
+import hmac
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from bson import ObjectId
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import clear_url_caches, get_resolver, reverse
+from django.utils import timezone
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError, DuplicateKeyError, PyMongoError
+
+from .instrumentation import query_shape, track_queries
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+
+# =================== DỮ LIỆU SEED (id cố định) ===================
+CAT_IDS = [ObjectId("65a000000000000000000001"), ObjectId("65a000000000000000000002"),
+           ObjectId("65a000000000000000000003")]
+PRODUCT_IDS = [ObjectId("65b0000000000000000000%02x" % i) for i in range(1, 21)]
+ADMIN_ID = ObjectId("65c000000000000000000001")
+CUSTOMER_ID = ObjectId("65c000000000000000000002")
+CART_IDS = [ObjectId("65d000000000000000000001"), ObjectId("65d000000000000000000002"),
+            ObjectId("65d000000000000000000003")]
+ORDER_IDS = [ObjectId("65e0000000000000000000%02x" % i) for i in range(1, 7)]
+
+
+def _seed(db):
+    for name in ("danh_muc", "san_pham", "tai_khoan", "gio_hang", "don_hang"):
+        db[name].delete_many({})
+    now = timezone.now()
+    db.danh_muc.insert_many([
+        {"_id": CAT_IDS[0], "ten_danh_muc": "Trái cây nội địa"},
+        {"_id": CAT_IDS[1], "ten_danh_muc": "Trái cây nhập khẩu"},
+        {"_id": CAT_IDS[2], "ten_danh_muc": "Trái cây sấy"},
+    ])
+    db.san_pham.insert_many([
+        {"_id": pid, "ten_san_pham": f"Sản phẩm {i:02d}", "mo_ta": "Tươi ngon",
+         "gia": 10000 * (i + 1), "so_luong_ton": 100, "hinh_anh": [f"sanpham/sp{i}.jpg"],
+         "danh_muc_id": CAT_IDS[i % 2]}
+        for i, pid in enumerate(PRODUCT_IDS)
+    ])
+    db.tai_khoan.insert_many([
+        {"_id": ADMIN_ID, "ho_ten": "Quản trị", "email": "admin@traicaysach.vn", "sdt": "0909000001",
+         "mat_khau": "123456", "vai_tro": "admin"},
+        {"_id": CUSTOMER_ID, "ho_ten": "Nguyễn Văn An", "email": "an@example.com", "sdt": "0909000002",
+         "mat_khau": "123456", "vai_tro": "customer"},
+    ])
+    db.gio_hang.insert_many([
+        {"_id": cid, "tai_khoan_id": CUSTOMER_ID, "san_pham_id": PRODUCT_IDS[i], "ngay_tao": now,
+         "so_luong": 2, "don_gia": 10000 * (i + 1), "tong_tien": 20000 * (i + 1)}
+        for i, cid in enumerate(CART_IDS)
+    ])
+    orders = []
+    for i, oid in enumerate(ORDER_IDS):
+        items = [
+            {"san_pham_id": PRODUCT_IDS[i], "so_luong": 1, "don_gia": 10000, "tong_tien": 10000},
+            {"san_pham_id": PRODUCT_IDS[i + 1], "so_luong": 2, "don_gia": 20000, "tong_tien": 40000},
+        ]
+        orders.append({
+            "_id": oid, "tai_khoan_id": CUSTOMER_ID, "items": items, "tong_tien": 50000,
+            "phuong_thuc_thanh_toan": "cod" if i % 2 else "vnpay",
+            "trang_thai": "cho_xu_ly" if i < 3 else "hoan_thanh",
+            "ngay_tao": now - timedelta(days=i),
+            "nguoi_nhan": {"ten": "Nguyễn Văn An", "sdt": "0909000002", "dia_chi": "Gò Vấp, TP.HCM"},
+            "san_pham_id": PRODUCT_IDS[i], "so_luong": 1, "don_gia": 10000,
+        })
+    db.don_hang.insert_many(orders)
+
+
+def _vnpay_params(order_id, code="00"):
+    params = {
+        "vnp_Amount": "5000000", "vnp_ResponseCode": code, "vnp_TxnRef": str(order_id),
+        "vnp_TmnCode": settings.VNPAY_TMNCODE, "vnp_TransactionNo": "14000000",
+    }
+    raw = "&".join(f"{k}={urllib.parse.quote_plus(str(v))}" for k, v in sorted(params.items()))
+    params["vnp_SecureHash"] = hmac.new(settings.VNPAY_HASHSECRET.encode(), raw.encode(), hashlib.sha512).hexdigest()
+    return params
+
+
+# =================== NGÂN SÁCH ===================
+@dataclass
+class Budget:
+    commands: int                 # số lệnh Mongo tối đa / request
+    docs: int                     # tổng docsExamined tối đa / request
+    method: str = "get"
+    kwargs: dict = field(default_factory=dict)
+    query: dict = field(default_factory=dict)
+    json: object = None           # body JSON
+    files: dict = None            # body multipart
+    login: str = "customer"       # None | "customer" | "admin"
+    skip: str = ""                # lý do bỏ qua (endpoint đang hỏng / chưa dùng)
+    warm: bool = False            # gọi 1 lần trước khi đo (đo đường đã có cache)
+    status: int = 200             # status code mong đợi (request lỗi rẻ hơn -> ngân sách vô nghĩa)
+
+
+P0, C0, O0 = str(PRODUCT_IDS[0]), str(CART_IDS[0]), str(ORDER_IDS[0])
+IMPORT_CSV = "ten_san_pham,gia,danh_muc,so_luong_ton\nXoài cát Hoà Lộc,85000,Trái cây nội địa,10\n"
+
+QUERY_BUDGETS = {
+    # ----- Site (HTML) -----
+    "shop:home": Budget(2, 40),
+    # lần đầu: danh mục + trang + count + $facet đếm; cùng bộ lọc lần sau chỉ còn danh mục + trang
+    "shop:sanpham_list": Budget(4, 60),
+    # trang phải đi index (danh_muc_id, da_ban, _id): 3 danh mục + 10 sản phẩm, không quét cả collection
+    "shop:sanpham_list#cat_best_seller": Budget(2, 13, warm=True,
+                                                query={"cat": str(CAT_IDS[0]), "sort": "best_seller"}),
+    "shop:product_detail": Budget(2, 40, kwargs={"id": P0}),  # 1 khi đã chạy compute_related
+    "shop:product_by_category": Budget(1, 30, kwargs={"cat_id": str(CAT_IDS[0])},
+                                       skip="template shop/category.html chưa tồn tại"),
+    "shop:add_to_cart": Budget(3, 30, kwargs={"sp_id": P0}, status=302),
+    "shop:shop_login": Budget(0, 0, login=None),
+    "shop:shop_register": Budget(0, 0, login=None),
+    "shop:shop_logout": Budget(0, 0, status=302),
+    "shop:cart_page": Budget(0, 0),
+    "shop:checkout": Budget(0, 0),
+    "shop:my_orders_page": Budget(2, 40),
+    "shop:order_detail": Budget(3, 10, kwargs={"id": O0}),
+
+    # ----- Danh mục / sản phẩm API -----
+    "shop:api_categories_list": Budget(2, 10),
+    "shop:api_categories_create": Budget(3, 10, method="post", json={"ten_danh_muc": "Rau củ"}, login="admin",
+                                         status=201),
+    "shop:api_category_detail": Budget(1, 1, kwargs={"id": str(CAT_IDS[0])}),
+    "shop:api_products_list": Budget(2, 50),
+    # + bump version catalog (shop/catalog.py) + cộng bucket histogram giá (shop/pricing.py)
+    "shop:api_products_create": Budget(5, 5, method="post", login="admin",
+                                       json={"ten_san_pham": "Bưởi da xanh", "gia": 60000}, status=201),
+    "shop:api_products_import": Budget(5, 10, method="post", login="admin",
+                                       files={"file": ("sp.csv", IMPORT_CSV.encode())}),
+    "shop:api_product_detail": Budget(1, 1, kwargs={"id": P0}),
+    # lần đầu: đọc version + đọc bảng + tính lại ($setWindowFields) + lưu; sau đó 0-1 lệnh (cache)
+    "shop:api_products_price_range": Budget(4, 50, login=None),
+
+    # ----- Giỏ hàng -----
+    # giỏ + 1 $in sản phẩm
+    "shop:cart_get": Budget(2, 10, query={"include_product": "1"}),
+    "shop:cart_add_item": Budget(4, 30, method="post", json={"san_pham_id": str(PRODUCT_IDS[5]), "so_luong": 1},
+                                 status=201),
+    "shop:cart_update_item": Budget(4, 10, method="patch", kwargs={"id": C0}, json={"so_luong": 3}),
+    "shop:cart_delete_item": Budget(1, 1, method="delete", kwargs={"id": C0}, status=204),
+    "shop:cart_clear": Budget(1, 10, method="delete"),
+    # đọc giỏ + $in giá + 1 bulk_write + đọc lại giỏ, bất kể số op
+    "shop:cart_batch": Budget(4, 40, method="post", json={"ops": [
+        {"op": "set", "id": C0, "so_luong": 5},
+        {"op": "remove", "id": str(CART_IDS[1])},
+        {"op": "add", "san_pham_id": str(PRODUCT_IDS[7]), "so_luong": 2},
+        {"op": "add", "san_pham_id": str(PRODUCT_IDS[7]), "so_luong": 1}]}),
+
+    # ----- Đơn hàng API -----
+    "shop:api_orders_list": Budget(2, 200),
+    "shop:api_orders_create": Budget(6, 20, method="post", json={"items": [
+        {"san_pham_id": str(PRODUCT_IDS[3]), "so_luong": 1}, {"san_pham_id": str(PRODUCT_IDS[4]), "so_luong": 2}]},
+        status=201),
+    "shop:api_orders_checkout": Budget(9, 30, method="post", json={"use_cart": True, "phuong_thuc_thanh_toan": "cod"},
+                                     status=201),
+    "shop:api_order_detail": Budget(3, 5, kwargs={"id": O0}),
+
+    # ----- Đơn hàng của tôi -----
+    "shop:api_my_orders": Budget(2, 40),
+    "shop:api_my_orders_count": Budget(1, 20, query={"paid": "0"}),
+    "shop:api_cancel_my_order": Budget(4, 10, method="post", kwargs={"id": O0}),
+    "shop:api_me_summary": Budget(3, 30),
+
+    # ----- Tài khoản / auth -----
+    "shop:api_accounts_list": Budget(2, 10, login="admin"),
+    "shop:api_accounts_create": Budget(3, 10, method="post", login="admin", json={
+        "ho_ten": "Trần Thị Bình", "email": "binh@example.com", "mat_khau": "123456"}, status=201),
+    "shop:api_account_detail": Budget(1, 1, kwargs={"id": str(CUSTOMER_ID)}, login="admin"),
+    "shop:api_auth_register": Budget(3, 10, method="post", login=None, json={
+        "ho_ten": "Lê Văn Cường", "email": "cuong@example.com", "mat_khau": "123456"}, status=201),
+    "shop:api_auth_login": Budget(1, 5, method="post", login=None,
+                                  json={"email": "an@example.com", "mat_khau": "123456"}),
+    "shop:api_auth_logout": Budget(0, 0, method="post", status=204),
+    "shop:api_auth_me": Budget(1, 1),
+
+    # ----- Export -----
+    "shop:api_export_products": Budget(2, 30, login="admin"),
+    "shop:api_export_orders": Budget(3, 40, login="admin"),
+    "shop:api_export_accounts": Budget(1, 10, login="admin"),
+
+    # ----- Admin panel -----
+    "shop:admin_dashboard": Budget(6, 120, login="admin"),
+    "shop:admin_categories": Budget(2, 10, login="admin"),
+    "shop:admin_category_create": Budget(0, 0, login="admin"),
+    "shop:admin_category_edit": Budget(0, 0, kwargs={"id": str(CAT_IDS[0])}, login="admin"),
+    "shop:admin_category_delete": Budget(0, 0, kwargs={"id": str(CAT_IDS[0])}, login="admin"),
+    # 1 find_one danh mục / dòng (N+1)
+    "shop:admin_products": Budget(8, 40, login="admin"),
+    "shop:admin_product_create": Budget(1, 5, login="admin"),
+    "shop:admin_product_edit": Budget(1, 5, kwargs={"id": P0}, login="admin"),
+    "shop:admin_product_delete": Budget(0, 0, kwargs={"id": P0}, login="admin"),
+    "shop:admin_accounts": Budget(0, 0, login="admin"),
+    "shop:admin_account_create": Budget(0, 0, login="admin"),
+    "shop:admin_account_edit": Budget(0, 0, kwargs={"id": str(CUSTOMER_ID)}, login="admin"),
+    "shop:admin_account_delete": Budget(0, 0, kwargs={"id": str(CUSTOMER_ID)}, login="admin"),
+    "shop:admin_orders": Budget(4, 40, login="admin"),
+    "shop:admin_order_create": Budget(2, 30, login="admin"),
+    "shop:admin_order_edit": Budget(0, 0, kwargs={"id": O0}, login="admin"),
+    "shop:admin_order_delete": Budget(0, 0, kwargs={"id": O0}, login="admin"),
+    "shop:admin_order_detail": Budget(0, 0, kwargs={"id": O0}, login="admin"),
+    "shop:admin_slow_queries": Budget(1, 0, login="admin"),
+    "shop:admin_profiles": Budget(0, 0, login="admin"),
+    "shop:admin_profile_download": Budget(0, 0, kwargs={"id": "0" * 32}, login="admin", status=404),
+
+    # ----- VNPay -----
+    "shop:vnpay_create": Budget(2, 2, kwargs={"order_id": O0}),
+    "shop:vnpay_return": Budget(1, 1, login=None, query=_vnpay_params(ORDER_IDS[0]), status=302),
+    "shop:vnpay_ipn": Budget(1, 1, login=None, query=_vnpay_params(ORDER_IDS[0])),
+}
+
+
+# =================== HARNESS ===================
+def _shop_url_names():
+    names = set()
+    for pattern in get_resolver().url_patterns:
+        for sub in getattr(pattern, "url_patterns", []):
+            if getattr(pattern, "namespace", None) == "shop" and getattr(sub, "name", None):
+                names.add(f"shop:{sub.name}")
+    return names
+
+
+def _profile_shape(entry):
+    cmd = entry.get("command") or {}
+    name = next(iter(cmd), "")
+    if isinstance(cmd.get(name), str):
+        return query_shape(name, cmd)
+    return f"{entry.get('op')} {entry.get('ns', '').split('.', 1)[-1]}"
+
+
+class MongoTestCase(TestCase):
+    """Seed lại DB test trước mỗi test; không có mongod thì skip cả lớp."""
+
+    @classmethod
+    def setUpClass(cls):
+        from .database import db
+        # _seed() xoá sạch các collection -> tuyệt đối không chạy trên DB thật
+        if not db.name.endswith("_test"):
+            raise RuntimeError(f"Từ chối chạy test Mongo trên DB '{db.name}' (tên DB test phải kết thúc bằng _test)")
+        probe = MongoClient(settings.MONGO_URI, serverSelectionTimeoutMS=1000)
+        try:
+            probe.admin.command("ping")
+        except PyMongoError as e:
+            raise unittest.SkipTest(f"Không kết nối được mongod ({settings.MONGO_URI}): {e}")
+        finally:
+            probe.close()
+        super().setUpClass()
+        from .sales import ensure_indexes
+        cls.db = db
+        ensure_indexes()
+
+    def setUp(self):
+        self.db.command("profile", 0)
+        _seed(self.db)
+        cache.clear()  # số đếm catalog / histogram cache từ dữ liệu của test trước
+
+    def _login(self, role):
+        if not role:
+            return
+        user = ADMIN_ID if role == "admin" else CUSTOMER_ID
+        session = self.client.session
+        session.update({"user_id": str(user), "user_role": role, "user_name": role,
+                        "is_admin": role == "admin"})
+        session.save()
+
+
+class QueryBudgetTests(MongoTestCase):
+    """1 test / URL name, sinh tự động từ QUERY_BUDGETS (xem cuối file)."""
+
+    def _request(self, name, budget):
+        url = reverse(name.partition("#")[0], kwargs=budget.kwargs)
+        if budget.query:
+            url += "?" + urllib.parse.urlencode(budget.query)
+        call = getattr(self.client, budget.method)
+        if budget.files:
+            return call(url, data={k: SimpleUploadedFile(fname, content) for k, (fname, content) in budget.files.items()})
+        if budget.json is not None:
+            return call(url, data=json.dumps(budget.json), content_type="application/json")
+        return call(url)
+
+    def check_budget(self, name, budget):
+        self._login(budget.login)
+        if budget.warm:
+            self._request(name, budget)
+
+        # profiler bật riêng cho request này (level 2 = ghi mọi lệnh)
+        self.db.command("profile", 0)
+        self.db.system.profile.drop()
+        self.db.command("profile", 2)
+        try:
+            response = self._request(name, budget)
+            with track_queries() as streamed:
+                if getattr(response, "streaming", False):
+                    b"".join(response.streaming_content)
+        finally:
+            self.db.command("profile", 0)
+
+        body = b"" if getattr(response, "streaming", False) else response.content[:300]
+        self.assertEqual(response.status_code, budget.status, f"{name} trả về {response.status_code}: {body!r}")
+        stats = response.wsgi_request.mongo_stats
+        entries = list(self.db.system.profile.find({"ns": {"$not": {"$regex": r"\.system\."}}}))
+        commands = stats.count + streamed.count
+        docs = sum(int(e.get("docsExamined", 0)) for e in entries)
+
+        if commands > budget.commands or docs > budget.docs:
+            shapes = {}
+            for e in entries:
+                key = _profile_shape(e)
+                n, d, plans = shapes.get(key, (0, 0, set()))
+                plans.add(e.get("planSummary", "-"))
+                shapes[key] = (n + 1, d + int(e.get("docsExamined", 0)), plans)
+            lines = [f"  {n}× docs={d:<5} {', '.join(sorted(plans))}  {shape}"
+                     for shape, (n, d, plans) in sorted(shapes.items(), key=lambda kv: (-kv[1][0], -kv[1][1]))]
+            self.fail(
+                f"{name}: {commands} lệnh (ngân sách {budget.commands}), "
+                f"docsExamined {docs} (ngân sách {budget.docs})\n" + "\n".join(lines)
+            )
+
+    def test_every_url_has_budget(self):
+        missing = sorted(_shop_url_names() - {name.partition("#")[0] for name in QUERY_BUDGETS})
+        self.assertFalse(missing, f"Chưa khai báo QUERY_BUDGETS cho: {', '.join(missing)}")
+
+
+def _make_test(name, budget):
+    def test(self):
+        if budget.skip:
+            self.skipTest(budget.skip)
+        self.check_budget(name, budget)
+    test.__doc__ = f"{name}: <= {budget.commands} lệnh, <= {budget.docs} docs"
+    return test
+
+
+for _name, _budget in QUERY_BUDGETS.items():
+    setattr(QueryBudgetTests, "test_budget_" + _name.replace(":", "_").replace("#", "__"),
+            _make_test(_name, _budget))
+
+
+# =================== ASYNC == SYNC ===================
+# (URL name, method, kwargs, query, json) — mỗi route có bản async trong shop/views/async_api.py
+PARITY_CALLS = [
+    ("shop:cart_get", "get", {}, {}, None),
+    ("shop:cart_get", "get", {}, {"include_product": "1"}, None),
+    ("shop:cart_add_item", "post", {}, {}, {"san_pham_id": P0, "so_luong": 2}),
+    ("shop:cart_add_item", "post", {}, {}, {"san_pham_id": str(PRODUCT_IDS[9]), "so_luong": 1}),
+    ("shop:cart_add_item", "post", {}, {}, {"san_pham_id": "x"}),
+    ("shop:cart_update_item", "patch", {"id": C0}, {}, {"so_luong": 7}),
+    ("shop:cart_update_item", "patch", {"id": C0}, {}, {"so_luong": 0}),
+    ("shop:cart_update_item", "patch", {"id": str(ORDER_IDS[0])}, {}, {"so_luong": 1}),
+    ("shop:cart_delete_item", "delete", {"id": C0}, {}, None),
+    ("shop:cart_delete_item", "delete", {"id": str(ORDER_IDS[0])}, {}, None),
+    ("shop:cart_clear", "delete", {}, {}, None),
+    ("shop:api_products_list", "get", {}, {}, None),
+    ("shop:api_products_list", "get", {}, {"q": "0", "page": "2", "page_size": "3"}, None),
+    ("shop:api_products_list", "get", {}, {"ids": f"{PRODUCT_IDS[3]},{P0},{ORDER_IDS[0]}",
+                                           "fields": "ten_san_pham,gia"}, None),
+    ("shop:api_products_list", "get", {}, {"fields": "mat_khau"}, None),
+    ("shop:api_product_detail", "get", {"id": P0}, {}, None),
+    ("shop:api_product_detail", "get", {"id": P0}, {"fields": "gia,hinh_anh"}, None),
+    ("shop:api_product_detail", "get", {"id": str(ORDER_IDS[0])}, {}, None),
+    ("shop:api_product_detail", "get", {"id": "x"}, {}, None),
+    ("shop:api_categories_list", "get", {}, {}, None),
+    ("shop:api_categories_list", "get", {}, {"q": "nhập", "page_size": "1"}, None),
+    ("shop:api_category_detail", "get", {"id": str(CAT_IDS[1])}, {}, None),
+    ("shop:api_category_detail", "get", {"id": "x"}, {}, None),
+    ("shop:api_my_orders", "get", {}, {}, None),
+    ("shop:api_my_orders", "get", {}, {"paid": "0", "limit": "3"}, None),
+    ("shop:api_my_orders_count", "get", {}, {}, None),
+    ("shop:api_my_orders_count", "get", {}, {"paid": "0"}, None),
+]
+# giá trị sinh mới mỗi lần (dòng giỏ vừa tạo)
+VOLATILE_KEYS = ("id", "ngay_tao")
+
+
+@contextmanager
+def _async_urls():
+    """Nạp lại urls với settings.ASYNC_API = True (urls._api chọn view lúc import)."""
+    from . import urls as shop_urls
+    root = importlib.import_module(settings.ROOT_URLCONF)
+
+    def _reload():
+        importlib.reload(shop_urls)
+        importlib.reload(root)
+        clear_url_caches()
+
+    with override_settings(ASYNC_API=True):
+        _reload()
+    try:
+        yield
+    finally:
+        _reload()
+
+
+class AsyncParityTests(MongoTestCase):
+    """View async (ASGI) và view đồng bộ phải trả cùng status + JSON cho cùng dữ liệu."""
+
+    def _url(self, name, kwargs, query):
+        url = reverse(name, kwargs=kwargs)
+        return url + "?" + urllib.parse.urlencode(query) if query else url
+
+    @staticmethod
+    def _result(method, response):
+        if not response.content:
+            return response.status_code, None
+        body = json.loads(response.content)
+        if method == "post" and isinstance(body, dict):
+            body = {k: v for k, v in body.items() if k not in VOLATILE_KEYS}
+        return response.status_code, body
+
+    def _sync_call(self, name, method, kwargs, query, body):
+        call = getattr(self.client, method)
+        url = self._url(name, kwargs, query)
+        response = call(url) if body is None else call(url, data=json.dumps(body), content_type="application/json")
+        return self._result(method, response)
+
+    async def _async_calls(self):
+        results = []
+        for name, method, kwargs, query, body in PARITY_CALLS:
+            _seed(self.db)
+            call = getattr(self.async_client, method)
+            url = self._url(name, kwargs, query)
+            response = await (call(url) if body is None
+                              else call(url, data=json.dumps(body), content_type="application/json"))
+            results.append(self._result(method, response))
+        return results
+
+    def test_async_views_match_sync(self):
+        try:
+            from . import database_async  # noqa: F401
+        except ImportError as e:
+            self.skipTest(f"Không có driver Mongo async: {e}")
+        self._login("customer")
+        self.async_client.cookies = self.client.cookies
+
+        expected = []
+        for call in PARITY_CALLS:
+            _seed(self.db)
+            expected.append(self._sync_call(*call))
+        with _async_urls():
+            got = async_to_sync(self._async_calls)()
+
+        for call, want, have in zip(PARITY_CALLS, expected, got):
+            with self.subTest(name=call[0], method=call[1], kwargs=call[2], query=call[3]):
+                self.assertEqual(have, want)
+
+    def test_unauthenticated_match_sync(self):
+        try:
+            from . import database_async  # noqa: F401
+        except ImportError as e:
+            self.skipTest(f"Không có driver Mongo async: {e}")
+        calls = [c for c in PARITY_CALLS if c[0] in ("shop:cart_get", "shop:api_my_orders", "shop:api_my_orders_count")]
+        expected = [self._sync_call(*c) for c in calls]
+
+        async def _run():
+            out = []
+            for name, method, kwargs, query, body in calls:
+                out.append(self._result(method, await getattr(self.async_client, method)(self._url(name, kwargs, query))))
+            return out
+
+        with _async_urls():
+            got = async_to_sync(_run)()
+        self.assertEqual(got, expected)
+
+
+# =================== GIỎ HÀNG: BATCH ===================
+class CartBatchTests(MongoTestCase):
+    """POST /api/cart/batch: giỏ trả về sau khi áp các op theo thứ tự."""
+
+    def setUp(self):
+        super().setUp()
+        self._login("customer")
+
+    def _batch(self, body):
+        return self.client.post(reverse("shop:cart_batch"), data=json.dumps(body), content_type="application/json")
+
+    def _lines(self):
+        return {d["san_pham_id"]: d for d in self.db.gio_hang.find({"tai_khoan_id": CUSTOMER_ID})}
+
+    def test_set_remove_add(self):
+        response = self._batch({"ops": [
+            {"op": "set", "id": C0, "so_luong": 5},
+            {"op": "remove", "id": str(CART_IDS[1])},
+            {"op": "add", "san_pham_id": str(PRODUCT_IDS[7]), "so_luong": 2},
+            {"op": "add", "san_pham_id": str(PRODUCT_IDS[7]), "so_luong": 1},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        by_product = {i["san_pham_id"]: i for i in data["items"]}
+        self.assertEqual(set(by_product), {P0, str(PRODUCT_IDS[2]), str(PRODUCT_IDS[7])})
+        self.assertEqual((by_product[P0]["so_luong"], by_product[P0]["tong_tien"]), (5, 50000))
+        self.assertEqual(by_product[str(PRODUCT_IDS[2])]["so_luong"], 2)
+        # dòng mới tạo bằng san_pham_id, 2 lần add cộng dồn, giá lấy từ sản phẩm
+        new = by_product[str(PRODUCT_IDS[7])]
+        self.assertEqual((new["so_luong"], new["don_gia"], new["tong_tien"]), (3, 80000, 240000))
+        self.assertEqual(new["san_pham"]["id"], str(PRODUCT_IDS[7]))
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(data["tong_tien"], 50000 + 60000 + 240000)
+        self.assertEqual(data["applied"], {"updated": 2, "created": 1, "deleted": 1})
+        self.assertEqual(len(self._lines()), 3)
+
+    def test_add_by_product_updates_existing_line(self):
+        response = self._batch({"ops": [{"op": "add", "san_pham_id": P0, "so_luong": 3}]})
+        self.assertEqual(response.status_code, 200)
+        lines = self._lines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual((lines[PRODUCT_IDS[0]]["so_luong"], lines[PRODUCT_IDS[0]]["tong_tien"]), (5, 50000))
+        self.assertEqual(lines[PRODUCT_IDS[0]]["_id"], CART_IDS[0])
+
+    def test_set_zero_removes_line(self):
+        response = self._batch({"ops": [{"op": "set", "san_pham_id": P0, "so_luong": 0}], "include_product": False})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(PRODUCT_IDS[0], self._lines())
+        self.assertTrue(all("san_pham" not in i for i in response.json()["items"]))
+
+    def test_invalid_op_rejected_before_any_write(self):
+        cases = [
+            ([{"op": "set", "id": C0, "so_luong": 9}, {"op": "move", "id": C0}], "ops[1]", 400),
+            ([{"op": "set", "id": C0, "so_luong": 9}, {"op": "set", "id": C0}], "ops[1]", 400),
+            ([{"op": "add", "id": C0, "so_luong": 0}], "ops[0]", 400),
+            ([{"op": "remove", "id": str(ORDER_IDS[0])}], "ops[0]", 400),
+            ([{"op": "set", "id": C0, "so_luong": 9}, {"op": "add", "san_pham_id": str(ORDER_IDS[0])}], "ops[1]", 404),
+        ]
+        for ops, where, status in cases:
+            with self.subTest(ops=ops):
+                response = self._batch({"ops": ops})
+                self.assertEqual(response.status_code, status)
+                self.assertIn(where, response.json()["error"])
+                self.assertEqual(self._lines()[PRODUCT_IDS[0]]["so_luong"], 2)
+
+    def test_bad_body(self):
+        for body in ([], "x", 1, {}, {"ops": []}, {"ops": "set"},
+                     {"ops": [{"op": "remove", "id": C0}] * 101}):
+            with self.subTest(body=body):
+                self.assertEqual(self._batch(body).status_code, 400)
+        self.assertEqual(len(self._lines()), 3)
+
+
+# =================== UNIT (không cần mongod) ===================
+class MediaRangeTests(SimpleTestCase):
+    def test_parse_range(self):
+        from .views.media_view import _parse_range
+        cases = {
+            "bytes=0-99": (0, 99),
+            "bytes=500-": (500, 999),
+            "bytes=-100": (900, 999),
+            "bytes=-5000": (0, 999),
+            "bytes=0-5000": (0, 999),
+            "bytes=999-999": (999, 999),
+            "bytes=-0": "unsatisfiable",
+            "bytes=1000-": "unsatisfiable",
+            "bytes=5-2": None,       # sai cú pháp -> bỏ qua Range, trả cả file
+            "bytes=-": None,
+            "bytes=0-1,5-6": None,   # nhiều khoảng: không hỗ trợ
+            "items=0-1": None,
+            "": None,
+        }
+        for header, want in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(_parse_range(header, 1000), want)
+        self.assertIsNone(_parse_range("bytes=0-1", 0))
+
+    def test_etag_matches(self):
+        from .views.media_view import _etag_matches
+        self.assertTrue(_etag_matches('"abc"', '"abc"'))
+        self.assertTrue(_etag_matches('W/"abc"', '"abc"'))
+        self.assertTrue(_etag_matches('"x", W/"abc" ', '"abc"'))
+        self.assertTrue(_etag_matches("*", '"abc"'))
+        self.assertFalse(_etag_matches('"abcd"', '"abc"'))
+        self.assertFalse(_etag_matches("", '"abc"'))
+
+    def test_hashed_name_is_immutable_without_reading_file(self):
+        from .views.media_view import _cache_control, _strong_etag
+        st = SimpleNamespace(st_size=2048, st_mtime_ns=1)
+        self.assertEqual(_strong_etag("sanpham/xoai.0123456789ab.jpg", "/khong/ton/tai", st), '"0123456789ab-2048"')
+        self.assertIn("immutable", _cache_control("sanpham/xoai.0123456789ab.jpg"))
+        self.assertNotIn("immutable", _cache_control("sanpham/xoai.jpg"))
+
+    @override_settings(MEDIA_SENDFILE="x-accel-redirect", MEDIA_ACCEL_PREFIX="/_media_internal/")
+    def test_accel_redirect_quoted(self):
+        from .views.media_view import _sendfile_response
+        resp = _sendfile_response("sanpham/Screenshot (110) xoài.png", "/khong/dung")
+        self.assertEqual(resp["X-Accel-Redirect"], "/_media_internal/sanpham/Screenshot%20%28110%29%20xo%C3%A0i.png")
+
+
+class BenchPercentileTests(SimpleTestCase):
+    def test_nearest_rank(self):
+        from .management.commands.bench import _percentile
+        values = list(range(1, 11))
+        self.assertEqual([_percentile(values, p) for p in (0, 10, 50, 90, 95, 99, 100)], [1, 1, 5, 9, 10, 10, 10])
+        self.assertEqual(_percentile([7], 50), 7)
+        self.assertIsNone(_percentile([], 50))
+
+
+class ImporterRowTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("shop.importer.danh_muc")
+        self.danh_muc = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.danh_muc.find.return_value = [{"_id": CAT_IDS[0], "ten_danh_muc": "Trái cây nội địa"}]
+
+    def test_valid_row(self):
+        from .importer import CategoryMap, row_to_operation
+        op = row_to_operation({
+            "ten_san_pham": " Xoài cát ", "gia": "85,000", "danh_muc": "TRÁI CÂY nội địa ",
+            "so_luong_ton": "-3", "hinh_anh": "a.jpg| b.jpg |",
+        }, CategoryMap())
+        self.assertEqual(op, UpdateOne({"ten_san_pham": "Xoài cát"}, {"$set": {
+            "ten_san_pham": "Xoài cát", "gia": 85000, "so_luong_ton": 0,
+            "danh_muc_id": CAT_IDS[0], "hinh_anh": ["a.jpg", "b.jpg"],
+        }}, upsert=True))
+
+    def test_row_by_id_sets_defaults_on_insert(self):
+        from .importer import CategoryMap, row_to_operation
+        op = row_to_operation({"id": P0, "gia": 1, "danh_muc_id": str(CAT_IDS[2])}, CategoryMap())
+        self.assertEqual(op, UpdateOne({"_id": PRODUCT_IDS[0]}, {
+            "$set": {"gia": 1, "danh_muc_id": CAT_IDS[2]},
+            "$setOnInsert": {"hinh_anh": [], "so_luong_ton": 0},
+        }, upsert=True))
+
+    def test_invalid_rows(self):
+        from .importer import CategoryMap, row_to_operation
+        categories = CategoryMap()
+        cases = [
+            ("x", "object"),
+            ({}, "Thiếu ten_san_pham"),
+            ({"id": "zz"}, "id không hợp lệ"),
+            ({"ten": "a", "gia": "abc"}, "gia phải là số"),
+            ({"ten": "a", "gia": -1}, "gia phải >= 0"),
+            ({"ten": "a", "so_luong_ton": "1.5"}, "so_luong_ton phải là số"),
+            ({"ten": "a", "danh_muc": "Rau củ"}, "Danh mục không tồn tại"),
+            ({"ten": "a", "hinh_anh": 5}, "hinh_anh phải là"),
+        ]
+        for row, message in cases:
+            with self.subTest(row=row):
+                with self.assertRaisesMessage(ValueError, message):
+                    row_to_operation(row, categories)
+
+    def test_non_string_json_values(self):
+        from .importer import CategoryMap, row_to_operation
+        op = row_to_operation({"ten_san_pham": 123, "mo_ta": None, "gia": 5, "hinh_anh": ["a.jpg", None]},
+                              CategoryMap())
+        self.assertEqual(op, UpdateOne({"ten_san_pham": "123"}, {
+            "$set": {"ten_san_pham": "123", "mo_ta": "", "gia": 5, "hinh_anh": ["a.jpg"]},
+            "$setOnInsert": {"so_luong_ton": 0},
+        }, upsert=True))
+
+    def test_create_missing_category_once(self):
+        from .importer import CategoryMap
+        self.danh_muc.insert_one.return_value = SimpleNamespace(inserted_id=CAT_IDS[1])
+        categories = CategoryMap(create_missing=True)
+        self.assertEqual(categories.resolve("Rau củ"), CAT_IDS[1])
+        self.assertEqual(categories.resolve("rau CỦ"), CAT_IDS[1])
+        self.danh_muc.insert_one.assert_called_once_with({"ten_danh_muc": "Rau củ"})
+
+    def test_iter_rows(self):
+        from .importer import guess_format, iter_rows
+        self.assertEqual(guess_format("SP.NDJSON"), "jsonl")
+        self.assertEqual(guess_format("sp.txt", default="csv"), "csv")
+        csv_rows = list(iter_rows(io.BytesIO("﻿ten_san_pham,gia\nXoài,1\nCam,2\n".encode()), "csv"))
+        self.assertEqual(csv_rows, [(2, {"ten_san_pham": "Xoài", "gia": "1"}), (3, {"ten_san_pham": "Cam", "gia": "2"})])
+        rows = list(iter_rows(io.BytesIO(b'{"ten": "a"}\n\nkhong phai json\n'), "jsonl"))
+        self.assertEqual(rows[0], (1, {"ten": "a"}))
+        self.assertEqual(rows[1][0], 3)
+        self.assertIsInstance(rows[1][1], ValueError)
+
+
+class QueryShapeTests(SimpleTestCase):
+    def test_find_values_replaced(self):
+        a = query_shape("find", {"find": "san_pham", "filter": {"danh_muc_id": CAT_IDS[0], "gia": {"$gte": 1}},
+                                 "sort": {"_id": -1}, "limit": 12})
+        b = query_shape("find", {"find": "san_pham", "filter": {"gia": {"$gte": 99}, "danh_muc_id": CAT_IDS[1]},
+                                 "sort": {"_id": 1}})
+        self.assertEqual(a, 'find san_pham {"danh_muc_id": "?", "gia": {"$gte": "?"}} sort={"_id": "?"}')
+        self.assertEqual(a, b)
+
+    def test_lists(self):
+        self.assertEqual(query_shape("find", {"find": "san_pham", "filter": {"_id": {"$in": PRODUCT_IDS}}}),
+                         'find san_pham {"_id": {"$in": "?"}}')
+        self.assertEqual(query_shape("find", {"find": "san_pham", "filter": {"$or": [{"ten": "a"}, {"ten_san_pham": "a"}]}}),
+                         'find san_pham {"$or": [{"ten": "?"}]}')
+
+    def test_other_commands(self):
+        self.assertEqual(query_shape("aggregate", {"aggregate": "san_pham", "pipeline": [
+            {"$match": {"_id": PRODUCT_IDS[0]}}, {"$lookup": {"from": "danh_muc"}}, {"$limit": 1}]}),
+            'aggregate san_pham [$match{"_id": "?"}, $lookup(danh_muc), $limit]')
+        self.assertEqual(query_shape("update", {"update": "gio_hang", "updates": [{"q": {"_id": C0}, "u": {}}]}),
+                         'update gio_hang {"_id": "?"}')
+        self.assertEqual(query_shape("delete", {"delete": "gio_hang", "deletes": [{"q": {"_id": C0}}]}),
+                         'delete gio_hang [{"_id": "?"}]')
+        self.assertEqual(query_shape("insert", {"insert": "gio_hang", "documents": [{}]}), "insert gio_hang")
+
+
+class PriceHistogramTests(SimpleTestCase):
+    """pricing.apply_change: bảng 0..199, step 10 -> 20 bucket."""
+
+    CAT = str(CAT_IDS[0])
+
+    def setUp(self):
+        entry = {"min": 0, "max": 199, "step": 10, "count": 40, "buckets": [2] * 20}
+        patcher = mock.patch("shop.pricing.cau_hinh")
+        self.cau_hinh = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cau_hinh.find_one.return_value = {"keys": {"all": entry, self.CAT: entry, "none": entry}}
+        self.cau_hinh.update_one.return_value = SimpleNamespace(matched_count=1)
+        patcher = mock.patch("shop.pricing.rebuild")
+        self.rebuild = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _inc(self):
+        self.rebuild.assert_not_called()
+        self.cau_hinh.update_one.assert_called_once()
+        filter_, update = self.cau_hinh.update_one.call_args[0]
+        for key in ("all", self.CAT):
+            self.assertEqual((filter_[f"keys.{key}.min"], filter_[f"keys.{key}.max"], filter_[f"keys.{key}.step"]),
+                             (0, 199, 10))
+        return update["$inc"]
+
+    def test_add_product(self):
+        from .pricing import apply_change
+        apply_change(new=(CAT_IDS[0], 55))
+        self.assertEqual(self._inc(), {"keys.all.buckets.5": 1, "keys.all.count": 1,
+                                       f"keys.{self.CAT}.buckets.5": 1, f"keys.{self.CAT}.count": 1})
+
+    def test_move_between_buckets(self):
+        from .pricing import apply_change
+        apply_change(old=(CAT_IDS[0], 55), new=(CAT_IDS[0], 199))  # max -> bucket cuối
+        self.assertEqual(self._inc(), {"keys.all.buckets.5": -1, "keys.all.buckets.19": 1,
+                                       f"keys.{self.CAT}.buckets.5": -1, f"keys.{self.CAT}.buckets.19": 1})
+
+    def test_same_bucket_writes_nothing(self):
+        from .pricing import apply_change
+        apply_change(old=(CAT_IDS[0], 51), new=(CAT_IDS[0], 59))
+        apply_change(old=(CAT_IDS[0], 51), new=(CAT_IDS[0], 51))
+        self.cau_hinh.update_one.assert_not_called()
+        self.rebuild.assert_not_called()
+
+    def test_no_category(self):
+        from .pricing import apply_change
+        apply_change(old=(None, 10))
+        self.assertEqual(self._inc_keys(), {"keys.all.buckets.1", "keys.all.count", "keys.none.buckets.1", "keys.none.count"})
+
+    def _inc_keys(self):
+        return set(self.cau_hinh.update_one.call_args[0][1]["$inc"])
+
+    def test_range_change_rebuilds(self):
+        from .pricing import apply_change
+        for old, new in [(None, (CAT_IDS[0], 200)), ((CAT_IDS[0], 0), None), ((CAT_IDS[0], 199), (CAT_IDS[0], 50)),
+                         (None, (CAT_IDS[2], 50))]:  # danh mục chưa có trong bảng
+            with self.subTest(old=old, new=new):
+                self.rebuild.reset_mock()
+                self.cau_hinh.update_one.reset_mock()
+                apply_change(old=old, new=new)
+                self.rebuild.assert_called_once()
+                self.cau_hinh.update_one.assert_not_called()
+
+    def test_concurrent_rebuild_or_missing_table(self):
+        from .pricing import apply_change
+        self.cau_hinh.update_one.return_value = SimpleNamespace(matched_count=0)
+        apply_change(new=(CAT_IDS[0], 55))
+        self.rebuild.assert_called_once()
+
+        self.rebuild.reset_mock()
+        self.cau_hinh.find_one.return_value = None
+        apply_change(new=(CAT_IDS[0], 55))
+        self.rebuild.assert_not_called()
+
+
+@override_settings(TIME_ZONE="Asia/Ho_Chi_Minh")
+class SaleIncTests(SimpleTestCase):
+    TODAY = date(2026, 10, 19)
+
+    def setUp(self):
+        real = timezone.localdate
+        patcher = mock.patch("django.utils.timezone.localdate",
+                             side_effect=lambda value=None, tz=None: real(value, tz) if value else self.TODAY)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_window(self):
+        from .sales import sale_inc, window_start
+        self.assertEqual(window_start(), date(2026, 10, 13))
+        self.assertEqual(sale_inc(3), {"da_ban": 3, "da_ban_7d": 3, "ban_theo_ngay.20261019": 3})
+        day6 = datetime(2026, 10, 13, 9, tzinfo=dt_timezone.utc)
+        self.assertEqual(sale_inc(-2, day6), {"da_ban": -2, "da_ban_7d": -2, "ban_theo_ngay.20261013": -2})
+        day7 = datetime(2026, 10, 12, 9, tzinfo=dt_timezone.utc)
+        self.assertEqual(sale_inc(-2, day7), {"da_ban": -2})
+
+    def test_naive_datetime_is_utc(self):
+        from .sales import sale_inc
+        # pymongo trả naive UTC: 12/10 18:00 UTC = 13/10 01:00 giờ VN -> vẫn trong cửa sổ
+        self.assertEqual(sale_inc(1, datetime(2026, 10, 12, 18, 0)),
+                         {"da_ban": 1, "da_ban_7d": 1, "ban_theo_ngay.20261013": 1})
+        self.assertEqual(sale_inc(1, datetime(2026, 10, 12, 16, 59)), {"da_ban": 1})
+
+    def test_legacy_string_date(self):
+        from .sales import sale_inc
+        self.assertEqual(sale_inc(-1, "2026-10-15T10:00:00.123+07:00"),
+                         {"da_ban": -1, "da_ban_7d": -1, "ban_theo_ngay.20261015": -1})
+        self.assertEqual(sale_inc(-1, "2025-10-01T10:00:00"), {"da_ban": -1})
+        self.assertEqual(sale_inc(-1, "hôm qua"), {"da_ban": -1})
+        self.assertEqual(sale_inc(-1, 12345), {"da_ban": -1})
+
+
+class ProductParamTests(SimpleTestCase):
+    def _get(self, **query):
+        return RequestFactory().get("/api/products/", query)
+
+    def test_parse_ids(self):
+        from .views.sanpham_view import IDS_MAX, _parse_ids
+        self.assertEqual(_parse_ids(self._get()), (None, None))
+        ids, err = _parse_ids(self._get(ids=f" {PRODUCT_IDS[2]},{P0},,{PRODUCT_IDS[2]} "))
+        self.assertIsNone(err)
+        self.assertEqual(ids, [PRODUCT_IDS[2], PRODUCT_IDS[0]])
+        ids, err = _parse_ids(self._get(ids=f"{P0},xyz"))
+        self.assertEqual((ids, err.status_code), (None, 400))
+        self.assertIn("xyz", json.loads(err.content)["error"])
+        many = ",".join(str(ObjectId()) for _ in range(IDS_MAX + 1))
+        self.assertEqual(_parse_ids(self._get(ids=many))[1].status_code, 400)
+
+    def test_parse_fields(self):
+        from .views.sanpham_view import _parse_fields, _projection
+        self.assertEqual(_parse_fields(self._get()), (None, None))
+        fields, err = _parse_fields(self._get(fields="gia, id,gia,ten_san_pham"))
+        self.assertEqual((fields, err), (("gia", "ten_san_pham"), None))
+        self.assertEqual(_projection(fields), {"gia": 1, "ten_san_pham": 1})
+        self.assertEqual(_projection(()), {"_id": 1})
+        self.assertEqual(_projection(None, {"gia": 1}), {"gia": 1})
+        fields, err = _parse_fields(self._get(fields="gia,mat_khau"))
+        self.assertIsNone(fields)
+        self.assertEqual(err.status_code, 400)
+        self.assertIn("mat_khau", json.loads(err.content)["error"])
+
+    def test_products_by_ids_keeps_order(self):
+        from .views.sanpham_view import _products_by_ids
+        docs = [{"_id": PRODUCT_IDS[1], "gia": 2}, {"_id": PRODUCT_IDS[0], "gia": 1}]
+        out = _products_by_ids(docs, [PRODUCT_IDS[0], PRODUCT_IDS[5], PRODUCT_IDS[1]], ("gia",))
+        self.assertEqual(out, {"items": [{"id": PRODUCT_IDS[0], "gia": 1}, {"id": PRODUCT_IDS[1], "gia": 2}],
+                               "missing": [PRODUCT_IDS[5]]})
+
+
+class MetricsAccessTests(SimpleTestCase):
+    def _allowed(self, addr="127.0.0.1", auth=None):
+        from .views.metrics_view import _allowed
+        extra = {"HTTP_AUTHORIZATION": auth} if auth else {}
+        return _allowed(RequestFactory().get("/metrics", REMOTE_ADDR=addr, **extra))
+
+    @override_settings(METRICS_TOKEN="", METRICS_ALLOWED_IPS=("127.0.0.1",))
+    def test_no_token(self):
+        with self.settings(DEBUG=False):
+            self.assertFalse(self._allowed())  # sau nginx ai cũng là 127.0.0.1
+        with self.settings(DEBUG=True):
+            self.assertTrue(self._allowed())
+            self.assertFalse(self._allowed("10.0.0.5"))
+
+    @override_settings(METRICS_TOKEN="bi-mat", DEBUG=False)
+    def test_token(self):
+        self.assertTrue(self._allowed("10.0.0.5", "Bearer bi-mat"))
+        self.assertFalse(self._allowed(auth="Bearer sai"))
+        self.assertFalse(self._allowed())
+
+
+class ProductUpdateSpoolTests(SimpleTestCase):
+    """Multipart PUT lỗi (400 / 404) không để lại file trong thư mục spool."""
+
+    def setUp(self):
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.spool = spool.name
+        patcher = override_settings(UPLOAD_SPOOL_DIR=self.spool)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        patcher = mock.patch("shop.views.sanpham_view.san_pham")
+        self.san_pham = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.san_pham.find_one.return_value = {"_id": PRODUCT_IDS[0], "gia": 10000}
+
+    def _put(self, **data):
+        from .views.sanpham_view import product_detail
+        data.update({"_method": "PUT", "hinh_anh": SimpleUploadedFile("a.png", b"\x89PNG\r\n\x1a\n")})
+        request = RequestFactory().post(f"/api/products/{P0}/", data)
+        return product_detail(request, P0)
+
+    def test_invalid_category_spools_nothing(self):
+        self.assertEqual(self._put(danh_muc_id="xyz").status_code, 400)
+        self.assertEqual(os.listdir(self.spool), [])
+        self.san_pham.update_one.assert_not_called()
+
+    def test_deleted_product_discards_spool(self):
+        self.san_pham.update_one.return_value = SimpleNamespace(matched_count=0)
+        self.assertEqual(self._put(gia="5").status_code, 404)
+        self.assertEqual(os.listdir(self.spool), [])
+
+
+class _FakeSessions:
+    """Thay collection django_session trong test, đủ cho những gì shop/sessions.py dùng."""
+
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+        self.fail_inserts = 0
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def find_one(self, filter_, projection=None):
+        self.reads += 1
+        doc = self.docs.get(filter_["_id"])
+        if doc and doc["expire_date"] > filter_["expire_date"]["$gt"]:
+            return dict(doc)
+        return None
+
+    def count_documents(self, filter_, limit=0):
+        self.reads += 1
+        return int(filter_["_id"] in self.docs)
+
+    def insert_one(self, doc):
+        if self.fail_inserts or doc["_id"] in self.docs:
+            self.fail_inserts = max(self.fail_inserts - 1, 0)
+            raise DuplicateKeyError("E11000 trùng _id")
+        self.docs[doc["_id"]] = dict(doc)
+
+    def update_one(self, filter_, update):
+        doc = self.docs.get(filter_["_id"])
+        if doc:
+            doc.update(update["$set"])
+        return SimpleNamespace(matched_count=int(doc is not None))
+
+    def delete_one(self, filter_):
+        self.docs.pop(filter_["_id"], None)
+
+
+@override_settings(SESSION_MONGO_CACHE=False, SESSION_COOKIE_AGE=3600)
+class MongoSessionTests(SimpleTestCase):
+    """shop.sessions (engine mặc định khi chạy thật; test ngân sách dùng "db") không cần mongod."""
+
+    def setUp(self):
+        self.coll = _FakeSessions()
+        for patcher in (mock.patch("shop.sessions.sessions", self.coll), mock.patch("shop.sessions._indexed", True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.clear()
+
+    def _store(self, key=None):
+        from .sessions import SessionStore
+        return SessionStore(key)
+
+    def _saved(self, **data):
+        s = self._store()
+        s.update(data)
+        s.save()
+        return s.session_key
+
+    def test_save_load_exists_delete(self):
+        key = self._saved(user_id="u1")
+        self.assertIn(key, self.coll.docs)
+        s = self._store(key)
+        self.assertEqual(s.load(), {"user_id": "u1"})
+        self.assertTrue(s.exists(key))
+        s["user_role"] = "admin"
+        s.save()
+        self.assertEqual(self._store(key).load(), {"user_id": "u1", "user_role": "admin"})
+        s.delete()
+        self.assertFalse(s.exists(key))
+        self.assertEqual(self._store(key).load(), {})
+
+    def test_expired_or_unknown_key_starts_new_session(self):
+        key = self._saved(user_id="u1")
+        self.coll.docs[key]["expire_date"] = timezone.now() - timedelta(seconds=1)
+        s = self._store(key)
+        self.assertEqual(s.load(), {})
+        self.assertIsNone(s.session_key)
+        self.assertEqual(self._store("khong-ton-tai").load(), {})
+
+    def test_create_retries_on_duplicate_key(self):
+        self.coll.fail_inserts = 1
+        s = self._store()
+        s.create()
+        self.assertEqual(list(self.coll.docs), [s.session_key])
+
+    def test_save_after_delete_elsewhere(self):
+        from django.contrib.sessions.backends.base import UpdateError
+        key = self._saved(user_id="u1")
+        s = self._store(key)
+        s["gio"] = 1
+        del self.coll.docs[key]  # logout ở tab / worker khác
+        with self.assertRaises(UpdateError):
+            s.save()
+
+    @override_settings(SESSION_MONGO_CACHE=True, SESSION_MONGO_CACHE_TTL=30)
+    def test_cached_reads(self):
+        from django.core.cache import caches
+        local = caches[settings.SESSION_CACHE_ALIAS]
+        with mock.patch.object(local, "set", wraps=local.set) as cache_set:
+            key = self._saved(user_id="u1")
+        self.assertEqual(cache_set.call_args[0][2], 30)  # tối đa 30s mỗi worker
+
+        reads = self.coll.reads
+        s = self._store(key)
+        self.assertEqual(s.load(), {"user_id": "u1"})
+        self.assertTrue(s.exists(key))
+        self.assertEqual(self.coll.reads, reads)  # không chạm Mongo
+
+        s.delete()
+        self.assertEqual(self._store(key).load(), {})
+        self.assertGreater(self.coll.reads, reads)
+
+    @override_settings(SESSION_MONGO_CACHE=True, SESSION_MONGO_CACHE_TTL=30)
+    def test_cache_timeout_capped_by_expiry(self):
+        from django.core.cache import caches
+        local = caches[settings.SESSION_CACHE_ALIAS]
+        s = self._store()
+        s["user_id"] = "u1"
+        s.set_expiry(10)
+        with mock.patch.object(local, "set", wraps=local.set) as cache_set:
+            s.save()
+        self.assertEqual(cache_set.call_args[0][2], 10)
+
+
+class GatherTests(SimpleTestCase):
+    def test_results_in_order_and_context(self):
+        from .concurrency import gather
+        var = contextvars.ContextVar("gather_test")
+        var.set("request-1")
+        self.assertEqual(gather(lambda: 1, lambda: var.get(), lambda: 3), [1, "request-1", 3])
+        self.assertEqual(gather(lambda: 1), [1])
+
+    def test_error_raised(self):
+        from .concurrency import gather
+        with self.assertRaisesMessage(ValueError, "hỏng"):
+            gather(lambda: 1, lambda: (_ for _ in ()).throw(ValueError("hỏng")))
+
+    def test_nested_runs_inline(self):
+        from .concurrency import gather
+        names = gather(lambda: None, lambda: gather(lambda: threading.current_thread().name,
+                                                     lambda: threading.current_thread().name))[1]
+        self.assertEqual(names[0], names[1])
+
+    def test_deadline_cancels_pending(self):
+        from . import concurrency
+        release, ran = threading.Event(), threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        self.addCleanup(release.set)
+        with mock.patch.object(concurrency, "_executor", executor):
+            with self.assertRaises(concurrency.DeadlineExceeded):
+                concurrency.gather(lambda: None, lambda: release.wait(2), ran.set, timeout=0.05)
+        release.set()
+        executor.shutdown(wait=True)
+        self.assertFalse(ran.is_set())  # chưa chạy tới -> bị huỷ
+
+    def test_optional_dropped_required_awaited(self):
+        from . import concurrency
+        release = threading.Event()
+        self.addCleanup(release.set)
+        executor = ThreadPoolExecutor(max_workers=3)
+        self.addCleanup(executor.shutdown)
+        with mock.patch.object(concurrency, "_executor", executor):
+            out = concurrency.gather(
+                lambda: "danh_muc",
+                lambda: time.sleep(0.2) or "trang",  # bắt buộc, chậm hơn deadline -> vẫn chờ
+                lambda: release.wait(2),             # số đếm chậm -> bỏ
+                lambda: 7,                           # số đếm đã xong -> giữ
+                timeout=0.05, optional=(2, 3),
+            )
+        self.assertEqual(out, ["danh_muc", "trang", concurrency.MISSING, 7])
+
+    def test_request_deadline_shared(self):
+        from .concurrency import DeadlineExceeded, gather
+        request = SimpleNamespace(_fanout_deadline=time.monotonic() - 1)
+        with self.assertRaises(DeadlineExceeded):
+            gather(lambda: None, lambda: time.sleep(0.2), request=request)
+
+
+@override_settings(VIEW_COUNTER_FLUSH_INTERVAL=0, VIEW_COUNTER_MAX_KEYS=1000)
+class BufferedCounterTests(SimpleTestCase):
+    def setUp(self):
+        from .counters import BufferedCounter
+        self.collection = mock.MagicMock()
+        self.counter = BufferedCounter(self.collection, "luot_xem", indexes=[[("luot_xem", -1)]])
+        self.a, self.b = PRODUCT_IDS[0], PRODUCT_IDS[1]
+
+    def test_add_and_flush(self):
+        self.counter.add(self.a)
+        self.counter.add(self.a, 2)
+        self.counter.add(self.b)
+        self.assertEqual(self.counter.pending(), {self.a: 3, self.b: 1})
+        self.assertEqual(self.counter.flush(), 2)
+        self.collection.bulk_write.assert_called_once_with([
+            UpdateOne({"_id": self.a}, {"$inc": {"luot_xem": 3}}),
+            UpdateOne({"_id": self.b}, {"$inc": {"luot_xem": 1}}),
+        ], ordered=False)
+        self.assertEqual(self.counter.pending(), {})
+        self.assertEqual(self.counter.flush(), 0)
+        self.counter.add(self.a)
+        self.counter.flush()
+        self.collection.create_index.assert_called_once_with([("luot_xem", -1)])
+
+    def test_bulk_write_error_requeues_failed_only(self):
+        self.collection.bulk_write.side_effect = BulkWriteError(
+            {"writeErrors": [{"index": 1, "code": 11000, "errmsg": "lỗi"}], "nInserted": 0})
+        self.counter.add(self.a, 3)
+        self.counter.add(self.b, 1)
+        self.assertEqual(self.counter.flush(), 1)
+        self.assertEqual(self.counter.pending(), {self.b: 1})
+
+    def test_connection_error_requeues_all(self):
+        self.collection.bulk_write.side_effect = AutoReconnect("mất kết nối")
+        self.counter.add(self.a, 3)
+        self.assertEqual(self.counter.flush(), 0)
+        self.counter.add(self.a)
+        self.assertEqual(self.counter.pending(), {self.a: 4})
+
+    def test_fork_drops_parent_buffer(self):
+        self.counter.add(self.a, 5)
+        self.counter.pid = os.getpid() + 1  # buffer kế thừa từ process cha
+        self.counter.add(self.b)
+        self.assertEqual(self.counter.pending(), {self.b: 1})
+
+    @override_settings(VIEW_COUNTER_MAX_KEYS=2)
+    def test_full_buffer_flushes(self):
+        self.counter.add(self.a)
+        self.collection.bulk_write.assert_not_called()
+        self.counter.add(self.b)
+        self.collection.bulk_write.assert_called_once()
+        self.assertEqual(self.counter.pending(), {})
+
+
+class SlowQueryCountTests(SimpleTestCase):
+    @override_settings(MONGO_SLOW_QUERY_EXPLAIN_INTERVAL=60)
+    def test_every_slow_query_counted_explain_sampled(self):
+        from .slowlog import SlowQueryLog
+        log = SlowQueryLog()
+        log._thread = mock.Mock(is_alive=lambda: True)  # không chạy thread nền
+        command = {"find": "san_pham", "filter": {"gia": 1}}
+        for ms in (120.0, 300.0, 180.0):
+            log.submit("TraiCay_test", "find", command, "find san_pham", ms, url_name="sanpham_list")
+        self.assertEqual(log._queue.qsize(), 1)
+        (key, hit), = log.pending_hits().items()
+        self.assertEqual(key[:2], ("TraiCay_test", "find san_pham"))
+        self.assertEqual((hit["count"], hit["total_ms"], hit["max_ms"]), (3, 600.0, 300.0))
+        self.assertEqual((hit["collection"], hit["url_names"]), ("san_pham", {"sanpham_list"}))
+
+
+@unittest.skipIf(Image is None, "Pillow chưa cài")
+class UploadReencodeTests(SimpleTestCase):
+    @staticmethod
+    def _image(fmt, mode="RGB", frames=1, colors=("red", "blue", "green"), **save):
+        imgs = [Image.new(mode, (800, 600), color) for color in colors[:frames]]
+        out = io.BytesIO()
+        if frames > 1:
+            save.update(save_all=True, append_images=imgs[1:])
+        imgs[0].save(out, fmt, **save)
+        return out.getvalue()
+
+    def test_jpeg_reencoded_with_thumbnail(self):
+        from .uploads import _reencode
+        data, ext, thumb = _reencode(self._image("JPEG", quality=100), "jpg")
+        self.assertEqual(ext, "jpg")
+        self.assertEqual(thumb[1], "jpg")
+        with Image.open(io.BytesIO(thumb[0])) as t:
+            self.assertLessEqual(max(t.size), 400)
+
+    def test_animated_gif_kept(self):
+        from .uploads import _reencode
+        raw = self._image("GIF", frames=3)
+        data, ext, thumb = _reencode(raw, "gif")
+        self.assertEqual((data, ext), (raw, "gif"))
+        self.assertIsNotNone(thumb)
+
+    def test_webp_alpha_kept(self):
+        from PIL import features
+        from .uploads import _reencode
+        if not features.check("webp"):
+            self.skipTest("Pillow không có WebP")
+        raw = self._image("WEBP", "RGBA", colors=[(255, 0, 0, 128)])  # trong suốt 1 phần, alpha phải còn
+        data, ext, thumb = _reencode(raw, "webp")
+        self.assertEqual((data, ext), (raw, "webp"))
+        self.assertEqual(thumb[1], "png")  # giữ alpha
+
+    def test_unreadable_avif_stored_as_is(self):
+        from .uploads import _reencode
+        raw = b"\x00\x00\x00\x1cftypavif" + b"\x00" * 64
+        self.assertEqual(_reencode(raw, "avif"), (raw, "avif", None))
+        with self.assertRaises(Exception):
+            _reencode(b"\x89PNG\r\n\x1a\n" + b"\x00" * 64, "png")  # png hỏng vẫn bị từ chối
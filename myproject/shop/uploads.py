@@ -0,0 +1,234 @@
+# shop/uploads.py
+"""
+Xử lý ảnh upload ngoài request:
+  1) view chỉ "spool" file vào thư mục tạm rồi lưu sản phẩm ngay (xu_ly_anh.trang_thai = processing)
+  2) thread pool giới hạn kiểm tra / nén lại / tạo thumbnail, chuyển vào media/sanpham
+  3) xong thì $set hinh_anh + xu_ly_anh.trang_thai = ready (API sản phẩm trả về tiến độ)
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.utils import timezone
+
+from .database import san_pham
+
+try:  # Pillow là tuỳ chọn: không có thì chỉ kiểm tra magic bytes, không nén/không thumbnail
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_KEYS = ("hinh_anh", "hinh_anh[]")
+THUMB_SIZE = (400, 400)
+JPEG_QUALITY = 85
+# nén lại được mà không mất gì; avif / webp / gif động giữ nguyên file gốc (nén lại sẽ mất
+# alpha / frame, hoặc Pillow không có codec) và chỉ tạo thumbnail khi Pillow đọc được
+REENCODE_EXTS = ("jpg", "png", "gif")
+
+# magic bytes -> đuôi file
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(getattr(settings, "UPLOAD_WORKERS", 2)),
+    thread_name_prefix="upload",
+)
+# Giới hạn số job đang chờ: đầy thì xử lý ngay trong request (không để hàng đợi phình vô hạn)
+_slots = threading.BoundedSemaphore(int(getattr(settings, "UPLOAD_QUEUE_MAX", 32)))
+
+
+def _spool_dir():
+    path = getattr(settings, "UPLOAD_SPOOL_DIR", os.path.join(settings.BASE_DIR, "upload_spool"))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _sniff_ext(head: bytes):
+    for sig, ext in _SIGNATURES:
+        if head.startswith(sig):
+            return ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "avif"
+    return None
+
+
+# =================== SPOOL (trong request) ===================
+def has_uploads(request_files) -> bool:
+    return any(key in request_files for key in UPLOAD_KEYS)
+
+
+def spool_uploaded_images(request_files) -> list[dict]:
+    """
+    Chuyển file upload vào thư mục spool, không xử lý gì thêm.
+    File lớn (TemporaryUploadedFile) chỉ là 1 lần move, file nhỏ ghi thẳng từ bộ nhớ.
+    """
+    spooled = []
+    spool = _spool_dir()
+    for key in UPLOAD_KEYS:
+        for f in request_files.getlist(key):
+            dest = os.path.join(spool, uuid.uuid4().hex)
+            if hasattr(f, "temporary_file_path"):
+                file_move_safe(f.temporary_file_path(), dest, allow_overwrite=True)
+            else:
+                with open(dest, "wb") as out:
+                    for chunk in f.chunks():
+                        out.write(chunk)
+            spooled.append({"path": dest, "name": os.path.basename(f.name or "anh")})
+    return spooled
+
+
+def discard_spooled(spooled: list[dict]):
+    """Xoá file đã spool khi request không lưu được sản phẩm (job sẽ không bao giờ chạy)."""
+    for item in spooled:
+        try:
+            os.remove(item["path"])
+        except OSError:
+            pass
+
+
+def processing_state(total: int) -> dict:
+    return {
+        "trang_thai": "processing",
+        "xong": 0,
+        "tong": total,
+        "loi": [],
+        "job": uuid.uuid4().hex,
+        "bat_dau": timezone.now(),
+    }
+
+
+# =================== FINALIZE (trong worker) ===================
+def _store(data: bytes, stem: str, ext: str, subdir: str = "") -> str:
+    """Ghi file với hash nội dung trong tên -> media_view trả Cache-Control immutable."""
+    digest = hashlib.sha1(data).hexdigest()[:12]
+    rel = "/".join(p for p in ("sanpham", subdir, f"{stem}.{digest}.{ext}") if p)
+    full = os.path.join(settings.MEDIA_ROOT, *rel.split("/"))
+    if not os.path.exists(full):
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        tmp = f"{full}.{uuid.uuid4().hex}.part"
+        with open(tmp, "wb") as out:
+            out.write(data)
+        os.replace(tmp, full)
+    return rel
+
+
+def _encode(img, fmt: str) -> bytes:
+    out = io.BytesIO()
+    img.save(out, fmt, optimize=True, **({"quality": JPEG_QUALITY} if fmt == "JPEG" else {}))
+    return out.getvalue()
+
+
+def _thumbnail(img):
+    """(bytes, ext) từ frame đầu: có alpha / palette -> PNG, còn lại JPEG."""
+    thumb = img.copy()
+    thumb.thumbnail(THUMB_SIZE)
+    if thumb.mode in ("RGBA", "LA", "P", "PA"):
+        return _encode(thumb, "PNG"), "png"
+    return _encode(thumb if thumb.mode == "RGB" else thumb.convert("RGB"), "JPEG"), "jpg"
+
+
+def _reencode(raw: bytes, ext: str):
+    """Return (bytes ảnh chính, ext, (bytes, ext) thumbnail | None)."""
+    if Image is None:
+        return raw, ext, None
+    try:
+        with Image.open(io.BytesIO(raw)) as probe:
+            probe.verify()  # ảnh hỏng -> exception
+        img = Image.open(io.BytesIO(raw))
+        img.load()
+    except Exception:
+        if ext in REENCODE_EXTS:
+            raise
+        return raw, ext, None  # vd. Pillow không có AVIF: lưu gốc (magic bytes đã đúng), không thumbnail
+    if ext not in REENCODE_EXTS or getattr(img, "is_animated", False):
+        return raw, ext, _thumbnail(img)
+
+    fmt = "PNG" if ext in ("png", "gif") and img.mode in ("RGBA", "LA", "P") else "JPEG"
+    if fmt == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+    out_ext = "png" if fmt == "PNG" else "jpg"
+
+    main_bytes = _encode(img, fmt)
+    if len(main_bytes) >= len(raw) and ext == out_ext:
+        main_bytes = raw  # ảnh gốc đã tối ưu hơn -> giữ nguyên
+    return main_bytes, out_ext, _thumbnail(img)
+
+
+def _finalize_one(item: dict) -> str:
+    with open(item["path"], "rb") as f:
+        raw = f.read()
+    ext = _sniff_ext(raw[:16])
+    if not ext:
+        raise ValueError(f"{item['name']}: không phải file ảnh hợp lệ")
+
+    data, ext, thumb = _reencode(raw, ext)
+    stem = os.path.splitext(item["name"])[0].replace("/", "_").strip() or "anh"
+    rel = _store(data, stem, ext)
+    if thumb:
+        _store(thumb[0], stem, thumb[1], subdir="thumb")
+    return rel
+
+
+def _run_job(product_oid, job: str, spooled: list[dict], extra: list[str]):
+    urls, errors = [], []
+    for item in spooled:
+        try:
+            urls.append(_finalize_one(item))
+        except Exception as e:
+            logger.warning("upload %s failed: %s", item.get("name"), e)
+            errors.append(str(e))
+        finally:
+            try:
+                os.remove(item["path"])
+            except OSError:
+                pass
+        san_pham.update_one(
+            {"_id": product_oid, "xu_ly_anh.job": job},
+            {"$inc": {"xu_ly_anh.xong": 1}, "$set": {"xu_ly_anh.loi": errors}},
+        )
+
+    final = urls + list(extra or [])
+    update = {
+        "xu_ly_anh.trang_thai": "ready" if urls or not errors else "error",
+        "xu_ly_anh.loi": errors,
+        "xu_ly_anh.ket_thuc": timezone.now(),
+    }
+    if final:
+        update["hinh_anh"] = final
+    # filter theo job: lần sửa sau (job mới) không bị job cũ ghi đè
+    san_pham.update_one({"_id": product_oid, "xu_ly_anh.job": job}, {"$set": update})
+
+
+def schedule_finalize(product_oid, state: dict, spooled: list[dict], extra: list[str] | None = None):
+    """Đưa job vào pool; pool đầy thì chạy luôn (đồng bộ) để không mất ảnh."""
+    if not _slots.acquire(blocking=False):
+        _run_job(product_oid, state["job"], spooled, extra or [])
+        return
+
+    def _task():
+        try:
+            _run_job(product_oid, state["job"], spooled, extra or [])
+        except Exception:
+            logger.exception("upload job %s crashed", state["job"])
+            san_pham.update_one(
+                {"_id": product_oid, "xu_ly_anh.job": state["job"]},
+                {"$set": {"xu_ly_anh.trang_thai": "error"}},
+            )
+        finally:
+            _slots.release()
+
+    _executor.submit(_task)
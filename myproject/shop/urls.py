@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views.vnpay_view import vnpay_create_url, vnpay_return, vnpay_ipn
 # ====== SITE (HTML) ======
@@ -11,6 +12,7 @@ from .views import danhmuc_view as dm_api
 from .views import donhang_view as dhv
 
 from .views import donhang_site as dsite
+from .views import me_view
 
 # ====== Admin Panel views (Đơn hàng – HTML) ======
 from .views import donhang as dh
@@ -18,15 +20,25 @@ from .views import donhang as dh
 # ====== API views (Sản phẩm – JSON) ======
 from .views import sanpham_view as spv
 from .views.cart_api import (
-    cart_get, cart_add_item, cart_update_item, cart_delete_item, cart_clear
+    cart_get, cart_add_item, cart_update_item, cart_delete_item, cart_clear, cart_batch
 )
 from .views import checkout_page
 # ====== Admin Panel views (HTML) ======
 from .views import admin_views as av
 from .views import tai_khoan_view
+from .views import export_view
 
 app_name = "shop"
 
+
+def _api(view):
+    """Chạy qua ASGI (settings.ASYNC_API): dùng bản async cùng tên trong views/async_api.py."""
+    if settings.ASYNC_API:
+        from .views import async_api
+        return getattr(async_api, view.__name__)
+    return view
+
+
 urlpatterns = [
     # ====== SITE (HTML) ======
     path("", home.home, name="home"),
@@ -40,22 +52,25 @@ urlpatterns = [
     path("auth/logout/", auth_pages.logout_page, name="shop_logout"),
 
     # ====== API (JSON) – DANH MỤC ======
-    path("api/categories/", dm_api.categories_list, name="api_categories_list"),            # GET
+    path("api/categories/", _api(dm_api.categories_list), name="api_categories_list"),            # GET
     path("api/categories/create/", dm_api.categories_create, name="api_categories_create"), # POST
-    path("api/categories/<str:id>/", dm_api.category_detail, name="api_category_detail"),   # GET/PUT/DELETE
+    path("api/categories/<str:id>/", _api(dm_api.category_detail), name="api_category_detail"),   # GET/PUT/DELETE
 
     # ====== API (JSON) – SẢN PHẨM ======
-    path("api/products/", spv.products_list, name="api_products_list"),
+    path("api/products/", _api(spv.products_list), name="api_products_list"),
     path("api/products/create/", spv.products_create, name="api_products_create"),
-    path("api/products/<str:id>/", spv.product_detail, name="api_product_detail"),
+    path("api/products/import/", spv.products_import, name="api_products_import"),
+    path("api/products/price-range/", spv.products_price_range, name="api_products_price_range"),  # GET
+    path("api/products/<str:id>/", _api(spv.product_detail), name="api_product_detail"),
 
     # ====== CART (HTML + API) ======
     path("cart/", cart_page, name="cart_page"),
-    path("api/cart/", cart_get, name="cart_get"),
-    path("api/cart/items/", cart_add_item, name="cart_add_item"),
-    path("api/cart/items/<str:id>/", cart_update_item, name="cart_update_item"),
-    path("api/cart/items/<str:id>/delete/", cart_delete_item, name="cart_delete_item"),
-    path("api/cart/clear/", cart_clear, name="cart_clear"),
+    path("api/cart/", _api(cart_get), name="cart_get"),
+    path("api/cart/items/", _api(cart_add_item), name="cart_add_item"),
+    path("api/cart/items/<str:id>/", _api(cart_update_item), name="cart_update_item"),
+    path("api/cart/items/<str:id>/delete/", _api(cart_delete_item), name="cart_delete_item"),
+    path("api/cart/clear/", _api(cart_clear), name="cart_clear"),
+    path("api/cart/batch", cart_batch, name="cart_batch"),  # POST: nhiều set/add/remove, 1 bulk_write
     
    # ====== API (JSON) – ĐƠN HÀNG ======
 path("api/orders/", dhv.orders_list, name="api_orders_list"),                 # GET
@@ -74,9 +89,10 @@ path("api/orders/<str:id>/", dhv.order_detail, name="api_order_detail"),      #
     # Trang + API Đơn hàng của chính user (customer)
     path("don-hang-cua-toi/", dsite.my_orders_page, name="my_orders_page"),
     path("don-hang/<str:id>/", dsite.my_order_detail, name="order_detail"), 
-    path("api/my-orders/", dsite.api_my_orders, name="api_my_orders"),
-    path("api/my-orders/count/", dsite.api_my_orders_count, name="api_my_orders_count"),
+    path("api/my-orders/", _api(dsite.api_my_orders), name="api_my_orders"),
+    path("api/my-orders/count/", _api(dsite.api_my_orders_count), name="api_my_orders_count"),
     path("api/my-orders/<str:id>/cancel/", dsite.api_cancel_my_order, name="api_cancel_my_order"),
+    path("api/me/summary", me_view.me_summary, name="api_me_summary"),  # base.html: 1 request / trang
     
     
 
@@ -85,6 +101,11 @@ path("api/orders/<str:id>/", dhv.order_detail, name="api_order_detail"),      #
     path("api/accounts/create/", tai_khoan_view.accounts_create, name="api_accounts_create"),
     path("api/accounts/<str:id>/", tai_khoan_view.account_detail, name="api_account_detail"),
 
+    # ====== Export (CSV / NDJSON stream) ======
+    path("api/export/products/", export_view.export_products, name="api_export_products"),
+    path("api/export/orders/", export_view.export_orders, name="api_export_orders"),
+    path("api/export/accounts/", export_view.export_accounts, name="api_export_accounts"),
+
     # (auth API nếu còn dùng)
     path("api/auth/register", tai_khoan_view.auth_register, name="api_auth_register"),
     path("api/auth/login", tai_khoan_view.auth_login, name="api_auth_login"),
@@ -107,6 +128,9 @@ path("api/orders/<str:id>/", dhv.order_detail, name="api_order_detail"),      #
     path("admin-panel/accounts/create/", av.account_create, name="admin_account_create"),
     path("admin-panel/accounts/<str:id>/edit/", av.account_edit, name="admin_account_edit"),
     path("admin-panel/accounts/<str:id>/delete/", av.account_delete, name="admin_account_delete"),
+    path("admin-panel/slow-queries/", av.slow_queries_page, name="admin_slow_queries"),
+    path("admin-panel/profiles/", av.profiles_page, name="admin_profiles"),
+    path("admin-panel/profiles/<str:id>/download/", av.profile_download, name="admin_profile_download"),
     path("checkout/", checkout_page.checkout_page, name="checkout"),
 
     path("api/pay/vnpay/create/<str:order_id>/", vnpay_create_url, name="vnpay_create"),
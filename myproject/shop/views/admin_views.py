@@ -1,65 +1,83 @@
+import json
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
-from ..database import san_pham, danh_muc, don_hang, tai_khoan
+from ..concurrency import DeadlineExceeded, gather
+from ..counters import VIEWS
+from ..database import san_pham, danh_muc, don_hang, tai_khoan, slow_queries, slow_query_stats
 from math import ceil
 from bson import ObjectId
 from django.contrib import messages
 from .admin_required import admin_required
+from .. import profiling
+from ..sales import SOLD, SOLD_WINDOW
 from django.utils import timezone
-from datetime import datetime  # <-- THÊM
+from datetime import timedelta, timezone as dt_timezone
 
 PAGE_SIZE = 6
+TOP_PRODUCTS = 10  # dashboard: sản phẩm xem nhiều nhất
 
 # =================== DASHBOARD =================== #
-@admin_required
-def dashboard(request):
-    # Số liệu tổng
-    total_products   = san_pham.count_documents({})
-    total_categories = danh_muc.count_documents({})
-    total_orders     = don_hang.count_documents({})
-    total_accounts   = tai_khoan.count_documents({})
-
-    # --- Báo cáo doanh thu ---
-    filter_revenue = {
-        "trang_thai": {"$nin": ["da_huy"]}  # lấy tất cả trừ hủy
-    }
-
-    orders = don_hang.find(filter_revenue, {"tong_tien": 1, "ngay_tao": 1}) 
-
-    revenue_by_day, revenue_by_month = {}, {}
-    total_revenue = 0
-
-    for o in orders:
-        ngay = o.get("ngay_tao")
-        if not ngay:
-            continue
-
-        # Nếu ngay là string thì convert
-        if isinstance(ngay, str):
-            try:
-                ngay = datetime.fromisoformat(ngay[:19])
-            except:
-                continue
+def _revenue_by_day():
+    """[(YYYY-MM-DD, tổng)] của đơn không huỷ, gom trên Mongo (không kéo từng đơn về)."""
+    return [(r["_id"], int(r["total"])) for r in don_hang.aggregate([
+        {"$match": {"trang_thai": {"$nin": ["da_huy"]}}},  # lấy tất cả trừ hủy
+        # ngay_tao có thể là string ở dữ liệu cũ
+        {"$project": {
+            "tong_tien": 1,
+            "ngay": {"$convert": {"input": "$ngay_tao", "to": "date", "onError": None, "onNull": None}},
+        }},
+        {"$match": {"ngay": {"$ne": None}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$ngay"}},
+            "total": {"$sum": {"$convert": {"input": "$tong_tien", "to": "long", "onError": 0, "onNull": 0}}},
+        }},
+        {"$sort": {"_id": 1}},
+    ], allowDiskUse=True)]
 
-        total = int(o.get("tong_tien", 0))
-        total_revenue += total
 
-        day_key = ngay.strftime("%Y-%m-%d")
-        month_key = ngay.strftime("%Y-%m")
-
-        revenue_by_day[day_key] = revenue_by_day.get(day_key, 0) + total
-        revenue_by_month[month_key] = revenue_by_month.get(month_key, 0) + total
+@admin_required
+def dashboard(request):
+    # Số liệu tổng + doanh thu theo ngày + top xem nhiều: độc lập nhau -> chạy song song
+    try:
+        by_day, total_products, total_categories, total_orders, total_accounts, top_viewed = gather(
+            _revenue_by_day,
+            lambda: san_pham.count_documents({}),
+            lambda: danh_muc.count_documents({}),
+            lambda: don_hang.count_documents({}),
+            lambda: tai_khoan.count_documents({}),
+            lambda: list(san_pham.find({VIEWS: {"$gt": 0}}, {"ten": 1, "ten_san_pham": 1, VIEWS: 1, SOLD: 1, SOLD_WINDOW: 1})
+                         .sort([(VIEWS, -1), ("_id", -1)]).limit(TOP_PRODUCTS)),
+            request=request,
+        )
+    except DeadlineExceeded:
+        # vẫn mở được trang quản trị, chỉ thiếu số liệu
+        messages.warning(request, "Số liệu tổng quan tải quá lâu, tạm thời không hiển thị. Vui lòng tải lại sau.")
+        by_day, top_viewed = [], []
+        total_products = total_categories = total_orders = total_accounts = "—"
 
-    days = sorted(revenue_by_day.keys())
-    months = sorted(revenue_by_month.keys())
+    revenue_by_month = {}
+    for day, total in by_day:
+        revenue_by_month[day[:7]] = revenue_by_month.get(day[:7], 0) + total
+    total_revenue = sum(total for _, total in by_day)
 
     ctx = {
-        "total_products": san_pham.count_documents({}),
-        "total_categories": danh_muc.count_documents({}),
-        "total_orders": don_hang.count_documents({}),
-        "total_accounts": tai_khoan.count_documents({}),
+        "total_products": total_products,
+        "total_categories": total_categories,
+        "total_orders": total_orders,
+        "total_accounts": total_accounts,
         "total_revenue": total_revenue,
-        "revenue_days":   [{"date": d, "total": revenue_by_day[d]} for d in days],
-        "revenue_months": [{"month": m, "total": revenue_by_month[m]} for m in months],
+        "revenue_days":   [{"date": d, "total": t} for d, t in by_day],
+        "revenue_months": [{"month": m, "total": revenue_by_month[m]} for m in sorted(revenue_by_month)],
+        # luot_xem ghi trễ (shop/counters.py) -> chậm tối đa VIEW_COUNTER_FLUSH_INTERVAL giây
+        "top_viewed": [{
+            "id": str(sp["_id"]),
+            "ten": sp.get("ten") or sp.get("ten_san_pham") or "",
+            "luot_xem": int(sp.get(VIEWS) or 0),
+            "da_ban": int(sp.get(SOLD) or 0),
+            "da_ban_7d": int(sp.get(SOLD_WINDOW) or 0),
+        } for sp in top_viewed],
     }
 
     return render(request, "shop/admin/dashboard.html", ctx)
@@ -155,7 +173,7 @@ def products_list(request):
     cursor = (
         san_pham.find(
             filter_,
-            {"ten_san_pham": 1, "mo_ta": 1, "gia": 1, "danh_muc_id": 1, "hinh_anh": 1, "so_luong_ton": 1}
+            {"ten_san_pham": 1, "mo_ta": 1, "gia": 1, "danh_muc_id": 1, "hinh_anh": 1, "so_luong_ton": 1, "xu_ly_anh": 1}
         )
         .sort([("_id", -1)])  # <- MỚI
         .skip(skip)
@@ -181,6 +199,7 @@ def products_list(request):
             "hinh_anh": sp["hinh_anh"][0] if sp.get("hinh_anh") else None,
             "danh_muc": cat_name,
             "so_luong_ton": int(sp.get("so_luong_ton", 0)),
+            "xu_ly_anh": (sp.get("xu_ly_anh") or {}).get("trang_thai"),
         })
 
     placeholders = max(0, PAGE_SIZE - len(items))
@@ -246,3 +265,117 @@ def account_edit(request, id: str):
 @admin_required
 def account_delete(request, id: str):
     return render(request, "shop/admin/account_delete.html", {"account_id": id})
+
+
+# =================== SLOW QUERIES =================== #
+SLOW_QUERY_SORTS = {"total": "total_ms", "count": "count", "max": "max_ms", "last": "last_ts"}
+
+
+@admin_required
+def slow_queries_page(request):
+    """Slow query log (shop/slowlog.py) gom theo query shape."""
+    try:
+        hours = max(int(request.GET.get("hours", 24)), 0)
+    except ValueError:
+        hours = 24
+    sort = request.GET.get("sort") if request.GET.get("sort") in SLOW_QUERY_SORTS else "total"
+
+    # số lần / thời gian: mọi lần chậm (slow_query_stats, theo giờ); plan: lần explain mới nhất
+    pipeline = []
+    if hours:
+        since = (timezone.now() - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
+        pipeline.append({"$match": {"gio": {"$gte": since}}})
+    pipeline += [
+        {"$group": {
+            "_id": "$shape",
+            "count": {"$sum": "$count"},
+            "total_ms": {"$sum": "$total_ms"},
+            "max_ms": {"$max": "$max_ms"},
+            "last_ts": {"$max": "$last_ts"},
+            "collection": {"$last": "$collection"},
+            "command": {"$last": "$command"},
+            "url_names": {"$push": "$url_names"},
+        }},
+        {"$set": {"avg_ms": {"$divide": ["$total_ms", {"$max": ["$count", 1]}]}}},
+        {"$sort": {SLOW_QUERY_SORTS[sort]: -1}},
+        {"$limit": 200},
+    ]
+    rows = list(slow_query_stats.aggregate(pipeline))
+    plans = {}
+    if rows:
+        # capped collection trả theo thứ tự ghi -> $last là lần explain mới nhất
+        plans = {p["_id"]: p["plan"] for p in slow_queries.aggregate([
+            {"$match": {"shape": {"$in": [r["_id"] for r in rows]}}},
+            {"$group": {"_id": "$shape", "plan": {"$last": "$plan"}}},
+        ])}
+    groups = []
+    for g in rows:
+        g["shape"] = g.pop("_id")
+        plan = plans.get(g["shape"]) or {}
+        g["url_names"] = sorted({u for names in g.get("url_names") or [] for u in names or [] if u})
+        examined, returned = plan.get("docs_examined"), plan.get("n_returned")
+        g["scan_ratio"] = round(examined / returned, 1) if examined and returned else None
+        g["plan"] = plan
+        if g.get("last_ts") and timezone.is_naive(g["last_ts"]):
+            g["last_ts"] = timezone.make_aware(g["last_ts"], dt_timezone.utc)
+        groups.append(g)
+
+    ctx = {
+        "groups": groups,
+        "hours": hours,
+        "sort": sort,
+        "hour_options": [1, 24, 168, 0],
+        "threshold_ms": getattr(settings, "MONGO_SLOW_QUERY_MS", None),
+    }
+    return render(request, "shop/admin/slow_queries.html", ctx)
+
+
+# =================== PROFILES (shop/profiling.py) =================== #
+@admin_required
+def profiles_page(request):
+    """Profile đã lưu, chậm nhất trước; ?view= lọc theo URL name, ?id= xem chi tiết."""
+    view = (request.GET.get("view") or "").strip()
+    profiles = profiling.list_profiles()
+    views = sorted({p.get("url_name") or "" for p in profiles})
+    if view:
+        profiles = [p for p in profiles if p.get("url_name") == view]
+    profiles.sort(key=lambda p: -(p.get("elapsed_ms") or 0))
+
+    selected, top = None, []
+    loaded = profiling.load_profile((request.GET.get("id") or "").strip())
+    if loaded:
+        selected, data = loaded
+        top = profiling.top_functions(data, limit=15)
+
+    ctx = {
+        "profiles": profiles[:100],
+        "views": views,
+        "view": view,
+        "selected": selected,
+        "selected_params": json.dumps(selected["params"], ensure_ascii=False, indent=2) if selected else "",
+        "top_functions": top,
+        "enabled": getattr(settings, "PROFILING_ENABLED", False),
+        "sample_rate": getattr(settings, "PROFILING_SAMPLE_RATE", 0),
+        "header": profiling.HEADER,
+        "token": profiling.make_token(),
+        "token_max_age": getattr(settings, "PROFILING_TOKEN_MAX_AGE", 3600),
+    }
+    return render(request, "shop/admin/profiles.html", ctx)
+
+
+@admin_required
+def profile_download(request, id: str):
+    """?format=pstats (mặc định) | speedscope"""
+    loaded = profiling.load_profile(id)
+    if not loaded:
+        raise Http404("Profile không tồn tại")
+    meta, data = loaded
+    if request.GET.get("format") == "speedscope":
+        body = json.dumps(profiling.to_speedscope(meta, data))
+        resp = HttpResponse(body, content_type="application/json")
+        filename = f"{id}.speedscope.json"
+    else:
+        resp = HttpResponse(profiling.to_pstats(data), content_type="application/octet-stream")
+        filename = f"{id}.prof"
+    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return resp
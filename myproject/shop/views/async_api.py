@@ -0,0 +1,296 @@
+# shop/views/async_api.py
+"""
+Bản `async def` của các API JSON mà JS storefront gọi nhiều nhất (giỏ hàng, sản phẩm,
+danh mục, đơn hàng của tôi). Cùng URL / name / JSON với bản đồng bộ; shop/urls.py chọn
+bản này khi settings.ASYNC_API (chạy qua myproject/asgi.py).
+
+Request chờ Mongo không giữ thread nào: dữ liệu đọc / ghi qua shop/database_async.py,
+session đọc bằng aget(). Phần serialize dùng lại helper của view đồng bộ; các nhánh ghi
+ít dùng (PUT/DELETE sản phẩm, danh mục) chuyển sang view đồng bộ qua sync_to_async.
+"""
+import json
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from ..database_async import danh_muc, don_hang, gio_hang, san_pham
+from ..responses import FastJsonResponse
+from . import cart_api, danhmuc_view, donhang_site, sanpham_view
+
+
+async def _session_user_oid(request):
+    uid = await request.session.aget("user_id")
+    try:
+        return ObjectId(uid) if uid else None
+    except Exception:
+        return None
+
+
+async def _cart_user_oid(request):
+    # giống cart_api._get_user_oid
+    raw = (
+        await request.session.aget("user_id")
+        or request.headers.get("X-User-Id")
+        or request.GET.get("tai_khoan_id")
+        or request.POST.get("tai_khoan_id")
+    )
+    try:
+        return ObjectId(raw) if raw else None
+    except Exception:
+        return None
+
+
+# =================== GIỎ HÀNG ===================
+@require_http_methods(["GET"])
+async def cart_get(request):
+    user_oid = await _cart_user_oid(request)
+    if not user_oid:
+        return JsonResponse({"error": "Missing or invalid tai_khoan_id"}, status=400)
+    include_product = request.GET.get("include_product") in ("1", "true", "True")
+
+    docs = await gio_hang.find({"tai_khoan_id": user_oid}).sort("ngay_tao", -1).to_list(None)
+    products = None
+    if include_product:
+        # giống cart_api._cart_products: 1 lệnh $in thay vì find_one từng dòng
+        products = {}
+        sp_ids = list({d["san_pham_id"] for d in docs})
+        if sp_ids:
+            async for sp in san_pham.find({"_id": {"$in": sp_ids}}, cart_api.PRODUCT_BRIEF_FIELDS):
+                products[sp["_id"]] = sp
+
+    items = [cart_api._serialize_item(doc, include_product, products) for doc in docs]
+    total_amount = sum(i["tong_tien"] for i in items)
+    return JsonResponse({"items": items, "tong_tien": total_amount, "count": len(items)})
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def cart_add_item(request):
+    err = cart_api._json_required(request)
+    if err: return err
+    user_oid = await _cart_user_oid(request)
+    if not user_oid: return JsonResponse({"error": "Missing or invalid tai_khoan_id"}, status=400)
+
+    try:
+        body = json.loads(request.body.decode("utf-8"))
+        sp_oid = ObjectId(body.get("san_pham_id"))
+        so_luong = int(body.get("so_luong", 1))
+    except Exception:
+        return JsonResponse({"error": "Invalid input"}, status=400)
+    if so_luong <= 0: return JsonResponse({"error": "so_luong phải > 0"}, status=400)
+
+    sp = await san_pham.find_one({"_id": sp_oid}, {"gia": 1})
+    if not sp: return JsonResponse({"error": "Sản phẩm không tồn tại"}, status=404)
+
+    don_gia = cart_api._price_of_product(sp)
+    existing = await gio_hang.find_one({"tai_khoan_id": user_oid, "san_pham_id": sp_oid})
+    if existing:
+        new_qty = int(existing.get("so_luong", 0)) + so_luong
+        await gio_hang.update_one({"_id": existing["_id"]}, {"$set": {
+            "so_luong": new_qty,
+            "don_gia": don_gia,
+            "tong_tien": new_qty * don_gia,
+        }})
+        doc = await gio_hang.find_one({"_id": existing["_id"]})
+    else:
+        doc = {
+            "tai_khoan_id": user_oid,
+            "san_pham_id": sp_oid,
+            "ngay_tao": datetime.now(timezone.utc),
+            "so_luong": so_luong,
+            "don_gia": don_gia,
+            "tong_tien": so_luong * don_gia,
+        }
+        res = await gio_hang.insert_one(doc); doc["_id"] = res.inserted_id
+    return JsonResponse(cart_api._serialize_item(doc), status=201)
+
+
+@csrf_exempt
+async def cart_update_item(request, id):
+    if request.method != "PATCH":
+        return HttpResponseNotAllowed(["PATCH"])
+    err = cart_api._json_required(request)
+    if err: return err
+    user_oid = await _cart_user_oid(request)
+    if not user_oid: return JsonResponse({"error": "Missing or invalid tai_khoan_id"}, status=400)
+
+    try:
+        item_oid = ObjectId(id)
+        body = json.loads(request.body.decode("utf-8"))
+        so_luong = int(body["so_luong"])
+    except Exception:
+        return JsonResponse({"error": "Invalid input"}, status=400)
+
+    item = await gio_hang.find_one({"_id": item_oid, "tai_khoan_id": user_oid})
+    if not item: return JsonResponse({"error": "Not found"}, status=404)
+
+    if so_luong <= 0:
+        await gio_hang.delete_one({"_id": item_oid})
+        return HttpResponse(status=204)
+
+    sp = await san_pham.find_one({"_id": item["san_pham_id"]}, {"gia": 1}) or {}
+    don_gia = cart_api._price_of_product(sp) or int(item.get("don_gia", 0))
+    await gio_hang.update_one({"_id": item_oid}, {"$set": {
+        "so_luong": so_luong,
+        "don_gia": don_gia,
+        "tong_tien": so_luong * don_gia,
+    }})
+    doc = await gio_hang.find_one({"_id": item_oid})
+    return JsonResponse(cart_api._serialize_item(doc))
+
+
+@csrf_exempt
+@require_http_methods(["DELETE"])
+async def cart_delete_item(request, id):
+    user_oid = await _cart_user_oid(request)
+    if not user_oid: return JsonResponse({"error": "Missing or invalid tai_khoan_id"}, status=400)
+    try: item_oid = ObjectId(id)
+    except Exception: return JsonResponse({"error": "Invalid id"}, status=400)
+    deleted = await gio_hang.delete_one({"_id": item_oid, "tai_khoan_id": user_oid})
+    if deleted.deleted_count == 0: return JsonResponse({"error": "Not found"}, status=404)
+    return HttpResponse(status=204)
+
+
+@csrf_exempt
+@require_http_methods(["DELETE"])
+async def cart_clear(request):
+    user_oid = await _cart_user_oid(request)
+    if not user_oid: return JsonResponse({"error": "Missing or invalid tai_khoan_id"}, status=400)
+    await gio_hang.delete_many({"tai_khoan_id": user_oid})
+    return JsonResponse({"detail": "Đã xóa toàn bộ giỏ hàng"})
+
+
+# =================== SẢN PHẨM ===================
+@require_http_methods(["GET"])
+async def products_list(request):
+    fields, err = sanpham_view._parse_fields(request)
+    if err:
+        return err
+    ids, err = sanpham_view._parse_ids(request)
+    if err:
+        return err
+    if ids is not None:
+        docs = await san_pham.find({"_id": {"$in": ids}},
+                                   sanpham_view._projection(fields, sanpham_view.LIST_FIELDS)).to_list(None)
+        return FastJsonResponse(sanpham_view._products_by_ids(docs, ids, fields))
+
+    q = (request.GET.get("q") or "").strip()
+    page = max(sanpham_view._to_int(request.GET.get("page", 1), 1), 1)
+    page_size = sanpham_view._to_int(request.GET.get("page_size", sanpham_view.PAGE_SIZE_DEFAULT),
+                                     sanpham_view.PAGE_SIZE_DEFAULT)
+    page_size = min(max(page_size, 1), sanpham_view.PAGE_SIZE_MAX)
+
+    filter_ = {}
+    if q:
+        filter_["ten_san_pham"] = {"$regex": q, "$options": "i"}
+
+    total = await san_pham.count_documents(filter_)
+    skip = (page - 1) * page_size
+    docs = await (
+        san_pham.find(filter_, sanpham_view._projection(fields, sanpham_view.LIST_FIELDS))
+        .sort("ten_san_pham", 1)
+        .skip(skip)
+        .limit(page_size)
+        .to_list(None)
+    )
+    return FastJsonResponse({
+        "items": [sanpham_view._serialize_product(sp, fields) for sp in docs],
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+    })
+
+
+@csrf_exempt
+async def product_detail(request, id):
+    if request.method != "GET":
+        return await sync_to_async(sanpham_view.product_detail)(request, id)
+    oid = sanpham_view._safe_objectid(id)
+    if not oid:
+        return JsonResponse({"error": "Invalid id"}, status=400)
+    fields, err = sanpham_view._parse_fields(request)
+    if err:
+        return err
+    sp = await san_pham.find_one({"_id": oid}, sanpham_view._projection(fields))
+    if not sp:
+        return JsonResponse({"error": "Not found"}, status=404)
+    return FastJsonResponse(sanpham_view._serialize_product(sp, fields))
+
+
+# =================== DANH MỤC ===================
+@require_http_methods(["GET"])
+async def categories_list(request):
+    q = (request.GET.get("q") or "").strip()
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    try:
+        page_size = min(max(int(request.GET.get("page_size", danhmuc_view.PAGE_SIZE_DEFAULT)), 1),
+                        danhmuc_view.PAGE_SIZE_MAX)
+    except ValueError:
+        page_size = danhmuc_view.PAGE_SIZE_DEFAULT
+
+    filter_ = {}
+    if q:
+        filter_["ten_danh_muc"] = {"$regex": q, "$options": "i"}
+
+    total = await danh_muc.count_documents(filter_)
+    skip = (page - 1) * page_size
+    docs = await danh_muc.find(filter_, {"ten_danh_muc": 1}).sort("_id", -1).skip(skip).limit(page_size).to_list(None)
+    items = [{"id": str(dm["_id"]), "ten_danh_muc": dm.get("ten_danh_muc", "")} for dm in docs]
+    return JsonResponse({"items": items, "total": total, "page": page, "page_size": page_size})
+
+
+@csrf_exempt
+async def category_detail(request, id):
+    if request.method != "GET":
+        return await sync_to_async(danhmuc_view.category_detail)(request, id)
+    try:
+        oid = ObjectId(id)
+    except Exception:
+        return JsonResponse({"error": "Invalid id"}, status=400)
+    dm = await danh_muc.find_one({"_id": oid})
+    if not dm:
+        return JsonResponse({"error": "Not found"}, status=404)
+    return JsonResponse({"id": str(dm["_id"]), "ten_danh_muc": dm.get("ten_danh_muc", "")})
+
+
+# =================== ĐƠN HÀNG CỦA TÔI ===================
+async def api_my_orders(request):
+    user = await _session_user_oid(request)
+    if not user: return JsonResponse({"error": "Unauthorized"}, status=401)
+
+    paid_only = (request.GET.get("paid") or "1") not in ("0", "false", "False")
+    limit = min(max(int((request.GET.get("limit") or 5)), 1), 50)
+
+    filter_ = {"tai_khoan_id": user}
+    if paid_only: filter_.update(donhang_site._is_paid_filter())
+
+    rows = await (
+        don_hang.find(
+            filter_,
+            {"san_pham_id":1,"so_luong":1,"don_gia":1,"tong_tien":1,"phuong_thuc_thanh_toan":1,"trang_thai":1,"ngay_tao":1,"items":1},
+        ).sort([("ngay_tao", -1), ("_id", -1)]).limit(limit).to_list(None)
+    )
+    sp_ids = donhang_site._product_ids(rows)
+    sp_map = {}
+    if sp_ids:
+        async for sp in san_pham.find({"_id": {"$in": sp_ids}}, {"ten": 1, "ten_san_pham": 1}):
+            sp_map[sp["_id"]] = sp
+    items = [donhang_site._serialize(d, sp=sp_map.get(d.get("san_pham_id")), sp_map=sp_map) for d in rows]
+    return JsonResponse({"items": items, "total": len(items)})
+
+
+async def api_my_orders_count(request):
+    user = await _session_user_oid(request)
+    if not user: return JsonResponse({"count": 0})
+    paid_only = (request.GET.get("paid") or "1") not in ("0", "false", "False")
+    filter_ = {"tai_khoan_id": user}
+    if paid_only: filter_.update(donhang_site._is_paid_filter())
+    n = await don_hang.count_documents(filter_)
+    return JsonResponse({"count": int(n)})
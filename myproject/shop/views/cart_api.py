@@ -4,6 +4,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from bson import ObjectId
 from datetime import datetime, timezone
+from pymongo import DeleteMany, DeleteOne, UpdateOne
 import json
 
 from ..database import san_pham, gio_hang
@@ -29,6 +30,10 @@ def _get_user_oid(request):
     except Exception:
         return None
 
+PRODUCT_BRIEF_FIELDS = {"ten_san_pham": 1, "ten": 1, "gia": 1, "hinh_anh": 1}
+BATCH_MAX_OPS = 100
+BATCH_OPS = ("set", "add", "remove")
+
 def _price_of_product(sp_doc) -> int:
     try:
         return int((sp_doc or {}).get("gia", 0))
@@ -46,23 +51,30 @@ def _serialize_item(doc, include_product=False, product_cache=None):
         "tong_tien": int(doc.get("tong_tien", 0)),
     }
     if include_product:
-        sp = product_cache.get(doc["san_pham_id"]) if product_cache else None
-        if sp is None:
-            sp = san_pham.find_one(
-                {"_id": doc["san_pham_id"]},
-                {"ten_san_pham": 1, "ten": 1, "gia": 1, "hinh_anh": 1}
-            )
-            if product_cache is not None and sp:
-                product_cache[doc["san_pham_id"]] = sp
+        # product_cache: sản phẩm đã lấy sẵn bằng _cart_products (không có = đã bị xoá)
+        if product_cache is not None:
+            sp = product_cache.get(doc["san_pham_id"])
+        else:
+            sp = san_pham.find_one({"_id": doc["san_pham_id"]}, PRODUCT_BRIEF_FIELDS)
         if sp:
-            data["san_pham"] = {
-                "id": str(sp["_id"]),
-                "ten_san_pham": sp.get("ten") or sp.get("ten_san_pham") or "",
-                "gia": _price_of_product(sp),
-                "hinh_anh": sp.get("hinh_anh", []),
-            }
+            data["san_pham"] = _product_brief(sp)
     return data
 
+def _cart_products(docs):
+    """{san_pham_id: sản phẩm} cho các dòng giỏ: 1 lệnh $in thay vì find_one từng dòng."""
+    sp_ids = list({d["san_pham_id"] for d in docs})
+    if not sp_ids:
+        return {}
+    return {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": sp_ids}}, PRODUCT_BRIEF_FIELDS)}
+
+def _product_brief(sp):
+    return {
+        "id": str(sp["_id"]),
+        "ten_san_pham": sp.get("ten") or sp.get("ten_san_pham") or "",
+        "gia": _price_of_product(sp),
+        "hinh_anh": sp.get("hinh_anh", []),
+    }
+
 # =========================
 # GET /api/cart
 # =========================
@@ -73,9 +85,9 @@ def cart_get(request):
         return JsonResponse({"error": "Missing or invalid tai_khoan_id"}, status=400)
     include_product = request.GET.get("include_product") in ("1", "true", "True")
 
-    cursor = gio_hang.find({"tai_khoan_id": user_oid}).sort("ngay_tao", -1)
-    product_cache = {} if include_product else None
-    items = [_serialize_item(doc, include_product, product_cache) for doc in cursor]
+    docs = list(gio_hang.find({"tai_khoan_id": user_oid}).sort("ngay_tao", -1))
+    products = _cart_products(docs) if include_product else None
+    items = [_serialize_item(doc, include_product, products) for doc in docs]
     total_amount = sum(i["tong_tien"] for i in items)
     return JsonResponse({"items": items, "tong_tien": total_amount, "count": len(items)})
 
@@ -183,3 +195,111 @@ def cart_clear(request):
     if not user_oid: return JsonResponse({"error": "Missing or invalid tai_khoan_id"}, status=400)
     gio_hang.delete_many({"tai_khoan_id": user_oid})
     return JsonResponse({"detail": "Đã xóa toàn bộ giỏ hàng"})
+
+# =========================
+# POST /api/cart/batch
+# =========================
+def _batch_target(op, lines):
+    """
+    Dòng giỏ mà op nhắm tới: {"id": <id dòng>} hoặc {"san_pham_id": ...}.
+    Return: (filter bổ sung, san_pham_id) | raise ValueError
+    """
+    if op.get("id"):
+        try:
+            line = lines[ObjectId(op["id"])]
+        except Exception:
+            raise ValueError("id không có trong giỏ")
+        return {"_id": line["_id"]}, line["san_pham_id"]
+    try:
+        sp_oid = ObjectId(op.get("san_pham_id"))
+    except Exception:
+        raise ValueError("thiếu id hoặc san_pham_id hợp lệ")
+    return {"san_pham_id": sp_oid}, sp_oid
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def cart_batch(request):
+    """
+    POST /api/cart/batch   {"ops": [...], "include_product": true}
+      {"op": "set",    "id" | "san_pham_id", "so_luong": n}    # n <= 0 -> xoá dòng
+      {"op": "add",    "id" | "san_pham_id", "so_luong": n}    # cộng dồn, chưa có thì tạo dòng
+      {"op": "remove", "id" | "san_pham_id"}
+    4 lệnh Mongo bất kể số op: đọc giỏ, 1 $in giá sản phẩm, 1 bulk_write (ordered, đúng thứ tự op),
+    đọc lại giỏ. Op sai -> 400 kèm vị trí, chưa ghi gì. Trả về giỏ mới như GET /api/cart/.
+    """
+    err = _json_required(request)
+    if err: return err
+    user_oid = _get_user_oid(request)
+    if not user_oid: return JsonResponse({"error": "Missing or invalid tai_khoan_id"}, status=400)
+    try:
+        body = json.loads(request.body.decode("utf-8"))
+    except Exception:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse({"error": "Body phải là JSON object"}, status=400)
+    ops = body.get("ops")
+    if not isinstance(ops, list) or not ops:
+        return JsonResponse({"error": "ops phải là list và không rỗng"}, status=400)
+    if len(ops) > BATCH_MAX_OPS:
+        return JsonResponse({"error": f"Tối đa {BATCH_MAX_OPS} ops / request"}, status=400)
+    include_product = body.get("include_product", True) not in (False, 0, "0", "false")
+
+    lines = {d["_id"]: d for d in gio_hang.find({"tai_khoan_id": user_oid})}
+
+    # ----- kiểm tra op + gom sản phẩm cần giá -----
+    parsed = []
+    for i, op in enumerate(ops):
+        kind = op.get("op") if isinstance(op, dict) else None
+        if kind not in BATCH_OPS:
+            return JsonResponse({"error": f"ops[{i}]: op phải là một trong {', '.join(BATCH_OPS)}"}, status=400)
+        try:
+            target, sp_oid = _batch_target(op, lines)
+        except ValueError as e:
+            return JsonResponse({"error": f"ops[{i}]: {e}"}, status=400)
+        try:
+            qty = 0 if kind == "remove" else int(op.get("so_luong", 1) if kind == "add" else op["so_luong"])
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse({"error": f"ops[{i}]: so_luong không hợp lệ"}, status=400)
+        if kind == "add" and qty <= 0:
+            return JsonResponse({"error": f"ops[{i}]: so_luong phải > 0"}, status=400)
+        parsed.append((kind, target, sp_oid, qty))
+
+    # giá mới cho dòng bị đổi + thông tin mọi sản phẩm trong giỏ (trả về luôn), 1 lệnh $in
+    sp_ids = {sp for _, _, sp, _ in parsed} | {d["san_pham_id"] for d in lines.values()}
+    products = {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": list(sp_ids)}}, PRODUCT_BRIEF_FIELDS)}
+
+    now = datetime.now(timezone.utc)
+    writes = []
+    for i, (kind, target, sp_oid, qty) in enumerate(parsed):
+        filter_ = {"tai_khoan_id": user_oid, **target}
+        by_product = "_id" not in target
+        if kind == "remove" or (kind == "set" and qty <= 0):
+            writes.append(DeleteMany(filter_) if by_product else DeleteOne(filter_))
+            continue
+        sp = products.get(sp_oid)
+        if sp is None and (by_product or kind == "add"):
+            return JsonResponse({"error": f"ops[{i}]: Sản phẩm không tồn tại"}, status=404)
+        if sp is None:
+            # dòng cũ, sản phẩm đã bị xoá: giữ đơn giá cũ (như PATCH)
+            don_gia = {"$ifNull": ["$don_gia", 0]}
+        else:
+            don_gia = {"$literal": _price_of_product(sp)}
+        so_luong = {"$add": [{"$ifNull": ["$so_luong", 0]}, qty]} if kind == "add" else {"$literal": qty}
+        # pipeline update: cộng dồn + tính tong_tien trên server -> đúng cả khi có op trước cùng dòng
+        writes.append(UpdateOne(filter_, [
+            {"$set": {"so_luong": so_luong, "don_gia": don_gia, "ngay_tao": {"$ifNull": ["$ngay_tao", now]}}},
+            {"$set": {"tong_tien": {"$multiply": ["$so_luong", "$don_gia"]}}},
+        ], upsert=by_product))
+
+    res = gio_hang.bulk_write(writes, ordered=True)
+
+    cursor = gio_hang.find({"tai_khoan_id": user_oid}).sort("ngay_tao", -1)
+    # product_cache đã đủ sản phẩm của giỏ -> _serialize_item không phải find_one thêm
+    items = [_serialize_item(doc, include_product, products) for doc in cursor]
+    return JsonResponse({
+        "items": items,
+        "tong_tien": sum(i["tong_tien"] for i in items),
+        "count": len(items),
+        "applied": {"updated": res.modified_count, "created": res.upserted_count, "deleted": res.deleted_count},
+    })
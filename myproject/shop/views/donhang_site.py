@@ -4,7 +4,9 @@ from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from bson import ObjectId
-from ..database import don_hang, san_pham, tai_khoan
+from ..database import don_hang, san_pham
+from ..loaders import loaders_for
+from ..sales import sale_inc
 
 def _cur_user_oid(request):
     uid = request.session.get("user_id")
@@ -21,6 +23,16 @@ def _is_paid_filter():
         ]
     }
 
+def _product_ids(rows):
+    """san_pham_id của đơn legacy + mọi items, theo thứ tự gặp."""
+    sp_ids = []
+    for d in rows:
+        if isinstance(d.get("san_pham_id"), ObjectId): sp_ids.append(d["san_pham_id"])
+        for it in d.get("items", []) or []:
+            sid = it.get("san_pham_id")
+            if isinstance(sid, ObjectId): sp_ids.append(sid)
+    return sp_ids
+
 def _serialize(doc, sp=None, sp_map=None, acc=None):
     dt = doc.get("ngay_tao") or timezone.now()
     if timezone.is_naive(dt):
@@ -108,14 +120,7 @@ def api_my_orders(request):
     )
 
     rows = list(cursor)
-    sp_ids = []
-    for d in rows:
-        if isinstance(d.get("san_pham_id"), ObjectId): sp_ids.append(d["san_pham_id"])
-        for it in d.get("items", []) or []:
-            sid = it.get("san_pham_id")
-            if isinstance(sid, ObjectId): sp_ids.append(sid)
-
-    sp_map = {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": sp_ids}}, {"ten": 1, "ten_san_pham": 1})}
+    sp_map = loaders_for(request).products.load_many(_product_ids(rows))
     items = []
     for d in rows:
         sp_legacy = sp_map.get(d.get("san_pham_id"))
@@ -140,13 +145,7 @@ def my_orders_page(request):
         {"san_pham_id":1,"so_luong":1,"don_gia":1,"tong_tien":1,"phuong_thuc_thanh_toan":1,"trang_thai":1,"ngay_tao":1,"items":1},
     ).sort([("ngay_tao", -1), ("_id", -1)]))
 
-    sp_ids = []
-    for d in rows:
-        if isinstance(d.get("san_pham_id"), ObjectId): sp_ids.append(d["san_pham_id"])
-        for it in d.get("items", []) or []:
-            sid = it.get("san_pham_id")
-            if isinstance(sid, ObjectId): sp_ids.append(sid)
-    sp_map = {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": sp_ids}}, {"ten": 1, "ten_san_pham": 1})}
+    sp_map = loaders_for(request).products.load_many(_product_ids(rows))
 
     items = []
     for d in rows:
@@ -164,14 +163,9 @@ def my_order_detail(request, id):
     doc = don_hang.find_one({"_id": oid, "tai_khoan_id": user})
     if not doc: raise Http404("Không tìm thấy đơn hàng")
 
-    sp_ids = []
-    for it in doc.get("items", []) or []:
-        if isinstance(it.get("san_pham_id"), ObjectId): sp_ids.append(it["san_pham_id"])
-    if isinstance(doc.get("san_pham_id"), ObjectId): sp_ids.append(doc["san_pham_id"])
-
-    sp_map = {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": sp_ids}}, {"ten": 1, "ten_san_pham": 1})}
-    acc = tai_khoan.find_one({"_id": doc.get("tai_khoan_id")},
-        {"ho_ten":1,"ten":1,"email":1,"ten_dang_nhap":1,"username":1,"so_dien_thoai":1,"sdt":1,"phone":1,"dia_chi":1,"address":1})
+    ld = loaders_for(request)
+    sp_map = ld.products.load_many(_product_ids([doc]))
+    acc = ld.accounts.load(doc.get("tai_khoan_id"))
 
     o = _serialize(doc, sp=sp_map.get(doc.get("san_pham_id")), sp_map=sp_map, acc=acc)
     return render(request, "shop/order_detail.html", {"order": o})
@@ -221,11 +215,12 @@ def api_cancel_my_order(request, id: str):
         if isinstance(sp_id, ObjectId):
             stock_req.append({"san_pham_id": sp_id, "so_luong": int(doc.get("so_luong", 0))})
 
-    # ✅ Hoàn tồn kho (nếu có gì để hoàn)
+    # ✅ Hoàn tồn kho + trừ bộ đếm đã bán (nếu có gì để hoàn)
     for it in stock_req:
+        qty = int(it["so_luong"])
         san_pham.update_one(
             {"_id": it["san_pham_id"]},
-            {"$inc": {"so_luong_ton": int(it["so_luong"])}}
+            {"$inc": {"so_luong_ton": qty, **sale_inc(-qty, doc.get("ngay_tao"))}}
         )
 
     # ✅ Cập nhật trạng thái: filter kèm trạng thái để tránh race condition
@@ -12,6 +12,9 @@ import json
 from pymongo.errors import WriteError, DuplicateKeyError
 
 from ..database import don_hang, san_pham, tai_khoan
+from ..loaders import loaders_for
+from ..responses import FastJsonResponse
+from ..sales import sale_inc
 
 # =================== CẤU HÌNH ===================
 PAGE_SIZE_DEFAULT = 10
@@ -212,37 +215,43 @@ def _merge_receiver_from_doc(doc: dict, acc: dict | None):
 
 
 def _serialize_order(doc, acc=None, sp_map=None):
+    # ObjectId / datetime để nguyên, FastJsonResponse tự encode (ngay_tao theo giờ VN)
     items_out = []
     for it in doc.get("items", []):
         sp_id = it.get("san_pham_id")
         sp_doc = sp_map.get(sp_id) if sp_map else None
         name = _product_label(sp_doc) if sp_doc else (it.get("san_pham_ten") if isinstance(it, dict) else None)
         items_out.append({
-            "san_pham_id": str(sp_id) if sp_id else None,
+            "san_pham_id": sp_id or None,
             "san_pham_ten": name,
             "so_luong": int(it.get("so_luong", 0)),
             "don_gia": int(it.get("don_gia", 0)),
             "tong_tien": int(it.get("tong_tien", 0)),
         })
 
-    raw_dt = doc.get("ngay_tao") or timezone.now()
-    ngay_tao_iso = _to_local_iso(raw_dt)
-
     merged_receiver = {k: v for k, v in (_merge_receiver_from_doc(doc, acc) or {}).items() if v}
 
     return {
-        "id": str(doc["_id"]),
-        "tai_khoan_id": str(doc.get("tai_khoan_id")) if doc.get("tai_khoan_id") else None,
+        "id": doc["_id"],
+        "tai_khoan_id": doc.get("tai_khoan_id") or None,
         "tai_khoan_ten": _account_label(acc) if acc else None,
         "items": items_out,
         "tong_tien": int(doc.get("tong_tien", 0)),
         "phuong_thuc_thanh_toan": doc.get("phuong_thuc_thanh_toan") or "cod",
         "trang_thai": doc.get("trang_thai") or "cho_xu_ly",
-        "ngay_tao": ngay_tao_iso,
+        "ngay_tao": doc.get("ngay_tao") or timezone.now(),
         "nguoi_dat": merged_receiver,
     }
 
 
+def _order_response(request, doc, status=200):
+    """Serialize 1 đơn; tên sản phẩm / tài khoản lấy qua identity map của request."""
+    ld = loaders_for(request)
+    sp_map = ld.products.load_many(it.get("san_pham_id") for it in doc.get("items", []))
+    acc = ld.accounts.load(doc.get("tai_khoan_id"))
+    return FastJsonResponse(_serialize_order(doc, acc=acc, sp_map=sp_map), status=status)
+
+
 def _add_legacy_fields(d):
     if d.get("items"):
         first = d["items"][0]
@@ -254,12 +263,15 @@ def _add_legacy_fields(d):
 
 
 # =================== STOCK HELPERS ===================
-def _try_decrease_stock(items: list[dict]) -> tuple[bool, str]:
+def _try_decrease_stock(items: list[dict], sold_at=None) -> tuple[bool, str]:
     """
     items: [{"san_pham_id": ObjectId, "so_luong": int}, ...]
-    Trừ tồn theo thứ tự. Nếu thiếu tồn 1 món -> rollback những món đã trừ trước đó.
+    Trừ tồn theo thứ tự (kèm cộng bộ đếm da_ban, xem shop/sales.py).
+    Nếu thiếu tồn 1 món -> rollback những món đã trừ trước đó.
+    sold_at: ngày đặt đơn (mặc định: bây giờ) -> bucket bán theo ngày
     Return: (ok: bool, message: str_if_fail)
     """
+    sold_at = sold_at or timezone.now()
     decremented = []  # lưu (sp_id, qty) đã trừ để rollback
     for it in items:
         sp_id = it["san_pham_id"]
@@ -268,7 +280,7 @@ def _try_decrease_stock(items: list[dict]) -> tuple[bool, str]:
         # Cố gắng trừ tồn
         r = san_pham.update_one(
             {"_id": sp_id, "so_luong_ton": {"$gte": qty}},
-            {"$inc": {"so_luong_ton": -qty}}
+            {"$inc": {"so_luong_ton": -qty, **sale_inc(qty, sold_at)}}
         )
         if r.matched_count == 0:
             # Lấy tên & tồn hiện tại để đưa vào message
@@ -278,24 +290,36 @@ def _try_decrease_stock(items: list[dict]) -> tuple[bool, str]:
 
             # rollback phần đã trừ
             for sp_rolled, qty_rolled in decremented:
-                san_pham.update_one({"_id": sp_rolled}, {"$inc": {"so_luong_ton": qty_rolled}})
+                san_pham.update_one({"_id": sp_rolled},
+                                    {"$inc": {"so_luong_ton": qty_rolled, **sale_inc(-qty_rolled, sold_at)}})
 
             return (False, f"Sản phẩm \"{ten}\" không đủ tồn kho (còn {ton}, cần {qty}).")
         decremented.append((sp_id, qty))
     return (True, "")
 
 
-def _rollback_increase_stock(items: list[dict]) -> None:
-    """Cộng lại tồn kho cho các items (dùng khi cần rollback)."""
+def _rollback_increase_stock(items: list[dict], sold_at=None) -> None:
+    """Cộng lại tồn kho (và trừ bộ đếm da_ban) cho các items; sold_at = ngày đặt đơn bị huỷ."""
     for it in items:
-        san_pham.update_one({"_id": it["san_pham_id"]}, {"$inc": {"so_luong_ton": int(it["so_luong"])}})
+        qty = int(it["so_luong"])
+        san_pham.update_one({"_id": it["san_pham_id"]}, {"$inc": {"so_luong_ton": qty, **sale_inc(-qty, sold_at)}})
 
 
 # =================== LIST ORDERS ===================
-@csrf_exempt
-@require_login_api
-@require_http_methods(["GET"])
-def orders_list(request):
+ORDER_SORT_MAP = {
+    "newest": [("ngay_tao", -1), ("_id", -1)],
+    "oldest": [("ngay_tao", 1), ("_id", 1)],
+    "total_desc": [("tong_tien", -1), ("ngay_tao", -1), ("_id", -1)],
+    "total_asc": [("tong_tien", 1), ("ngay_tao", -1), ("_id", -1)],
+}
+
+
+def _orders_filter(request):
+    """
+    Dựng điều kiện lọc từ query string (dùng chung cho danh sách & export):
+    ?q=&status=&pay=&account=&product=&from=&to=&sort=
+    Return: (base_match, product_oid | None, sort_spec)
+    """
     q = (request.GET.get("q") or "").strip()
     status = (request.GET.get("status") or "").strip()
     pay = (request.GET.get("pay") or "").strip()
@@ -305,10 +329,6 @@ def orders_list(request):
     date_to = (request.GET.get("to") or "").strip()
     sort = (request.GET.get("sort") or "newest").strip()
 
-    page = max(_to_int(request.GET.get("page", 1), 1), 1)
-    page_size = _to_int(request.GET.get("page_size", PAGE_SIZE_DEFAULT), PAGE_SIZE_DEFAULT)
-    page_size = min(max(page_size, 1), PAGE_SIZE_MAX)
-
     base_match = {}
     if status:
         base_match["trang_thai"] = status
@@ -336,6 +356,19 @@ def orders_list(request):
     if q_id:
         base_match["_id"] = q_id
 
+    return base_match, _safe_oid(product), ORDER_SORT_MAP.get(sort, ORDER_SORT_MAP["newest"])
+
+
+@csrf_exempt
+@require_login_api
+@require_http_methods(["GET"])
+def orders_list(request):
+    page = max(_to_int(request.GET.get("page", 1), 1), 1)
+    page_size = _to_int(request.GET.get("page_size", PAGE_SIZE_DEFAULT), PAGE_SIZE_DEFAULT)
+    page_size = min(max(page_size, 1), PAGE_SIZE_MAX)
+
+    base_match, prod_oid, sort_spec = _orders_filter(request)
+
     pipeline = [
         {"$match": base_match},
         {"$lookup": {
@@ -348,7 +381,6 @@ def orders_list(request):
         {"$unwind": {"path": "$items", "preserveNullAndEmptyArrays": True}},
     ]
 
-    prod_oid = _safe_oid(product)
     if prod_oid:
         pipeline.append({"$match": {"items.san_pham_id": prod_oid}})
 
@@ -388,13 +420,6 @@ def orders_list(request):
         }},
     ]
 
-    sort_map = {
-        "newest": [("ngay_tao", -1), ("_id", -1)],
-        "oldest": [("ngay_tao", 1), ("_id", 1)],
-        "total_desc": [("tong_tien", -1), ("ngay_tao", -1), ("_id", -1)],
-        "total_asc": [("tong_tien", 1), ("ngay_tao", -1), ("_id", -1)],
-    }
-    sort_spec = sort_map.get(sort, sort_map["newest"])
     pipeline.append({"$sort": {k: v for k, v in sort_spec}})
 
     count_pipeline = list(pipeline) + [{"$count": "total"}]
@@ -419,7 +444,7 @@ def orders_list(request):
         }
         acc = gr.get("tk")
         items.append(_serialize_order(doc, acc=acc, sp_map={}))
-    return JsonResponse({"items": items, "total": total, "page": page, "page_size": page_size})
+    return FastJsonResponse({"items": items, "total": total, "page": page, "page_size": page_size})
 
 
 # =================== CREATE (multi-items) ===================
@@ -447,7 +472,8 @@ def orders_create(request):
 
     items = []
     tong_tien = 0
-    sp_ids = []
+    products = loaders_for(request).products
+    products.prime(_safe_oid(it.get("san_pham_id")) for it in items_in if isinstance(it, dict))
 
     for it in items_in:
         sp_oid = _safe_oid(it.get("san_pham_id"))
@@ -457,7 +483,7 @@ def orders_create(request):
         if not sp_oid or not so_luong or so_luong <= 0:
             return JsonResponse({"error": "san_pham_id / so_luong không hợp lệ"}, status=400)
 
-        sp_doc = san_pham.find_one({"_id": sp_oid}, {"gia": 1, "ten": 1, "ten_san_pham": 1, "so_luong_ton": 1})
+        sp_doc = products.load(sp_oid)  # lần đầu: 1 lệnh $in cho mọi món
         if not sp_doc:
             return JsonResponse({"error": f"Sản phẩm {sp_oid} không tồn tại"}, status=400)
 
@@ -466,7 +492,6 @@ def orders_create(request):
 
         tien = int(so_luong) * int(don_gia)
         tong_tien += tien
-        sp_ids.append(sp_oid)
 
         items.append({
             "san_pham_id": sp_oid,
@@ -514,10 +539,7 @@ def orders_create(request):
         return JsonResponse({"error": "unknown", "message": str(e)}, status=500)
 
     created = don_hang.find_one({"_id": res.inserted_id})
-    acc = tai_khoan.find_one({"_id": tk_oid}, {"ho_ten": 1, "ten": 1, "email": 1})
-    sp_map = {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": sp_ids}}, {"ten": 1, "ten_san_pham": 1})}
-
-    return JsonResponse(_serialize_order(created, acc=acc, sp_map=sp_map), status=201)
+    return _order_response(request, created, status=201)
 
 
 # =================== DETAIL (GET/PUT/DELETE + POST _method=PUT) ===================
@@ -535,10 +557,7 @@ def order_detail(request, id: str):
         if not request.is_admin and doc.get("tai_khoan_id") != request.user_oid:
             return JsonResponse({"error": "Forbidden"}, status=403)
 
-        sp_ids = [it.get("san_pham_id") for it in doc.get("items", []) if isinstance(it.get("san_pham_id"), ObjectId)]
-        sp_map = {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": sp_ids}}, {"ten": 1, "ten_san_pham": 1})}
-        acc = tai_khoan.find_one({"_id": doc.get("tai_khoan_id")}, {"ho_ten": 1, "ten": 1, "email": 1})
-        return JsonResponse(_serialize_order(doc, acc=acc, sp_map=sp_map))
+        return _order_response(request, doc)
 
     # ----- multipart override to PUT -----
     if request.method == "POST" and (request.POST.get("_method") or "").upper() == "PUT":
@@ -568,11 +587,11 @@ def order_detail(request, id: str):
 
                 # Nếu chuyển sang "da_huy" => hoàn tồn
                 if new_status == "da_huy":
-                    _rollback_increase_stock(stock_req)
+                    _rollback_increase_stock(stock_req, sold_at=doc.get("ngay_tao"))
 
                 # Nếu chuyển từ "da_huy" -> trạng thái khác => trừ lại tồn (nếu đủ)
                 if old_status == "da_huy" and new_status != "da_huy":
-                    ok, msg = _try_decrease_stock(stock_req)
+                    ok, msg = _try_decrease_stock(stock_req, sold_at=doc.get("ngay_tao"))
                     if not ok:
                         return JsonResponse({"error": "out_of_stock", "message": msg}, status=400)
 
@@ -583,10 +602,7 @@ def order_detail(request, id: str):
 
         don_hang.update_one({"_id": oid}, {"$set": update})
         newdoc = don_hang.find_one({"_id": oid})
-        sp_ids = [it.get("san_pham_id") for it in newdoc.get("items", []) if isinstance(it.get("san_pham_id"), ObjectId)]
-        sp_map = {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": sp_ids}}, {"ten": 1, "ten_san_pham": 1})}
-        acc = tai_khoan.find_one({"_id": newdoc.get("tai_khoan_id")}, {"ho_ten": 1, "ten": 1, "email": 1})
-        return JsonResponse(_serialize_order(newdoc, acc=acc, sp_map=sp_map))
+        return _order_response(request, newdoc)
 
     if request.method == "PUT":
         err = _json_required(request)
@@ -622,9 +638,9 @@ def order_detail(request, id: str):
                 stock_req = [{"san_pham_id": it["san_pham_id"], "so_luong": int(it.get("so_luong", 0))} for it in items]
 
                 if new_status == "da_huy":
-                    _rollback_increase_stock(stock_req)
+                    _rollback_increase_stock(stock_req, sold_at=doc.get("ngay_tao"))
                 if old_status == "da_huy" and new_status != "da_huy":
-                    ok, msg = _try_decrease_stock(stock_req)
+                    ok, msg = _try_decrease_stock(stock_req, sold_at=doc.get("ngay_tao"))
                     if not ok:
                         return JsonResponse({"error": "out_of_stock", "message": msg}, status=400)
 
@@ -641,7 +657,6 @@ def order_detail(request, id: str):
         # Cập nhật items: tính lại tổng & KHÔNG tự động can thiệp tồn ở đây
         items_in = body.get("items", None)
         tong_tien = None
-        sp_ids = []
 
         if items_in is not None:
             if not isinstance(items_in, list) or not items_in:
@@ -649,6 +664,8 @@ def order_detail(request, id: str):
 
             new_items = []
             tong_tien_calc = 0
+            products = loaders_for(request).products
+            products.prime(_safe_oid(it.get("san_pham_id")) for it in items_in if isinstance(it, dict))
 
             for it in items_in:
                 sp_oid = _safe_oid(it.get("san_pham_id"))
@@ -658,7 +675,7 @@ def order_detail(request, id: str):
                 if not sp_oid or not so_luong or so_luong <= 0:
                     return JsonResponse({"error": "san_pham_id / so_luong không hợp lệ"}, status=400)
 
-                sp_doc = san_pham.find_one({"_id": sp_oid}, {"gia": 1})
+                sp_doc = products.load(sp_oid)
                 if not sp_doc:
                     return JsonResponse({"error": f"Sản phẩm {sp_oid} không tồn tại"}, status=400)
 
@@ -667,7 +684,6 @@ def order_detail(request, id: str):
 
                 tien = int(so_luong) * int(don_gia)
                 tong_tien_calc += tien
-                sp_ids.append(sp_oid)
 
                 new_items.append({
                     "san_pham_id": sp_oid,
@@ -687,12 +703,7 @@ def order_detail(request, id: str):
 
         don_hang.update_one({"_id": oid}, {"$set": update})
         newdoc = don_hang.find_one({"_id": oid})
-
-        if not sp_ids:
-            sp_ids = [it.get("san_pham_id") for it in newdoc.get("items", []) if isinstance(it.get("san_pham_id"), ObjectId)]
-        sp_map = {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": sp_ids}}, {"ten": 1, "ten_san_pham": 1})}
-        acc = tai_khoan.find_one({"_id": newdoc.get("tai_khoan_id")}, {"ho_ten": 1, "ten": 1, "email": 1})
-        return JsonResponse(_serialize_order(newdoc, acc=acc, sp_map=sp_map))
+        return _order_response(request, newdoc)
 
     if request.method == "DELETE":
         doc = don_hang.find_one({"_id": oid})
@@ -705,7 +716,7 @@ def order_detail(request, id: str):
         if (doc.get("trang_thai") or "cho_xu_ly") != "da_huy":
             items = doc.get("items", [])
             stock_req = [{"san_pham_id": it["san_pham_id"], "so_luong": int(it.get("so_luong", 0))} for it in items]
-            _rollback_increase_stock(stock_req)
+            _rollback_increase_stock(stock_req, sold_at=doc.get("ngay_tao"))
 
         r = don_hang.delete_one({"_id": oid})
         if r.deleted_count == 0:
@@ -737,7 +748,7 @@ def orders_checkout(request):
     pttt = (data.get("phuong_thuc_thanh_toan") or "cod").strip().lower()
 
     # 1) Thu thập danh sách items + tính tổng tiền
-    items, sp_ids, tong_tien = [], [], 0
+    items, tong_tien = [], 0
     stock_requests = []
 
     if use_cart:
@@ -762,7 +773,6 @@ def orders_checkout(request):
 
             tien = so_luong * don_gia
             tong_tien += tien
-            sp_ids.append(sp_oid)
             items.append({
                 "san_pham_id": sp_oid,
                 "so_luong": so_luong,
@@ -777,6 +787,9 @@ def orders_checkout(request):
         if not isinstance(body_items, list) or not body_items:
             return JsonResponse({"error": "Thiếu danh sách items (mua ngay)"}, status=400)
 
+        products = loaders_for(request).products
+        products.prime(_safe_oid(it.get("san_pham_id")) for it in body_items if isinstance(it, dict))
+
         for it in body_items:
             # chấp nhận chuỗi id
             try:
@@ -788,8 +801,8 @@ def orders_checkout(request):
             if so_luong <= 0:
                 return JsonResponse({"error": "so_luong phải > 0"}, status=400)
 
-            # Lấy giá từ DB để đảm bảo đúng giá hiện tại
-            sp_doc = san_pham.find_one({"_id": sp_oid}, {"gia": 1})
+            # Lấy giá từ DB để đảm bảo đúng giá hiện tại (1 lệnh $in cho cả giỏ mua ngay)
+            sp_doc = products.load(sp_oid)
             if not sp_doc:
                 return JsonResponse({"error": "Sản phẩm không tồn tại"}, status=404)
 
@@ -797,7 +810,6 @@ def orders_checkout(request):
             tien = so_luong * don_gia
 
             tong_tien += tien
-            sp_ids.append(sp_oid)
             items.append({
                 "san_pham_id": sp_oid,
                 "so_luong": so_luong,
@@ -848,9 +860,7 @@ def orders_checkout(request):
             pass
 
     # 6) Trả JSON chuẩn
-    acc = tai_khoan.find_one({"_id": user_oid}, {"ho_ten": 1, "ten": 1, "email": 1})
-    sp_map = {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": sp_ids}}, {"ten": 1, "ten_san_pham": 1})}
-    return JsonResponse(_serialize_order(created, acc=acc, sp_map=sp_map), status=201)
+    return _order_response(request, created, status=201)
 
 
 # =================== CANCEL (HỦY ĐƠN + HOÀN TỒN) ===================
@@ -879,10 +889,7 @@ def order_cancel(request, id: str):
 
     # Nếu đã hủy rồi thì trả về như cũ (idempotent)
     if old_status == "da_huy":
-        sp_ids = [it.get("san_pham_id") for it in doc.get("items", []) if isinstance(it.get("san_pham_id"), ObjectId)]
-        sp_map = {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": sp_ids}}, {"ten": 1, "ten_san_pham": 1})}
-        acc = tai_khoan.find_one({"_id": doc.get("tai_khoan_id")}, {"ho_ten": 1, "ten": 1, "email": 1})
-        return JsonResponse(_serialize_order(doc, acc=acc, sp_map=sp_map))
+        return _order_response(request, doc)
 
     # Hoàn lại tồn kho
     items = doc.get("items", [])
@@ -890,7 +897,7 @@ def order_cancel(request, id: str):
         {"san_pham_id": it["san_pham_id"], "so_luong": int(it.get("so_luong", 0))}
         for it in items if it.get("san_pham_id")
     ]
-    _rollback_increase_stock(stock_req)
+    _rollback_increase_stock(stock_req, sold_at=doc.get("ngay_tao"))
 
     # Cập nhật trạng thái
     don_hang.update_one(
@@ -900,7 +907,4 @@ def order_cancel(request, id: str):
 
     # Trả lại JSON đơn đã hủy
     newdoc = don_hang.find_one({"_id": oid})
-    sp_ids = [it.get("san_pham_id") for it in newdoc.get("items", []) if isinstance(it.get("san_pham_id"), ObjectId)]
-    sp_map = {sp["_id"]: sp for sp in san_pham.find({"_id": {"$in": sp_ids}}, {"ten": 1, "ten_san_pham": 1})}
-    acc = tai_khoan.find_one({"_id": newdoc.get("tai_khoan_id")}, {"ho_ten": 1, "ten": 1, "email": 1})
-    return JsonResponse(_serialize_order(newdoc, acc=acc, sp_map=sp_map), status=200)
+    return _order_response(request, newdoc, status=200)
@@ -0,0 +1,270 @@
+# shop/views/export_view.py
+"""
+Export CSV / NDJSON cho admin (sản phẩm, đơn hàng, tài khoản).
+StreamingHttpResponse đọc thẳng từ cursor Mongo -> byte đầu tiên gửi đi ngay,
+bộ nhớ cố định bất kể số dòng.
+"""
+import csv
+import json
+from collections import OrderedDict
+
+from bson import ObjectId
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods
+
+from ..counters import VIEWS
+from ..database import san_pham, danh_muc, don_hang, tai_khoan
+from ..sales import SOLD, SOLD_WINDOW
+from .donhang_view import (
+    _cur_user_oid, _orders_filter, _to_local_iso, _account_label, _product_label,
+    _merge_receiver_from_doc,
+)
+
+BATCH_SIZE_DEFAULT = 1000
+BATCH_SIZE_MIN = 100
+BATCH_SIZE_MAX = 5000
+NAME_CACHE_SIZE = 10000
+
+PRODUCT_COLUMNS = ["id", "ten_san_pham", "gia", "so_luong_ton", "danh_muc_id", "danh_muc", "mo_ta", "hinh_anh",
+                   "da_ban", "da_ban_7d", "luot_xem"]
+ORDER_COLUMNS = [
+    "don_hang_id", "ngay_tao", "trang_thai", "phuong_thuc_thanh_toan", "tong_tien_don",
+    "tai_khoan_id", "tai_khoan_ten", "nguoi_nhan", "sdt", "dia_chi",
+    "san_pham_id", "san_pham_ten", "so_luong", "don_gia", "tong_tien",
+]
+ACCOUNT_COLUMNS = ["id", "ho_ten", "email", "sdt", "vai_tro"]
+
+ACC_PROJ = {"ho_ten": 1, "ten": 1, "email": 1, "ten_dang_nhap": 1, "username": 1,
+            "so_dien_thoai": 1, "sdt": 1, "phone": 1, "dia_chi": 1, "address": 1}
+
+
+# =================== HELPERS ===================
+class _LRU:
+    """Cache tên có giới hạn (id -> doc) để export 10 triệu dòng vẫn không phình bộ nhớ."""
+
+    def __init__(self, maxsize=NAME_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key):
+        if key in self._data:
+            self._data.move_to_end(key)
+            return self._data[key]
+        return None
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def fill(self, collection, ids, projection):
+        """1 query $in cho các id chưa có trong cache (id không tồn tại cũng được nhớ)."""
+        missing = [i for i in set(ids) if isinstance(i, ObjectId) and i not in self]
+        if not missing:
+            return
+        found = {d["_id"]: d for d in collection.find({"_id": {"$in": missing}}, projection)}
+        for i in missing:
+            self.put(i, found.get(i, {}))
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _is_admin_session(request):
+    return (request.session.get("user_role") or "").lower() == "admin"
+
+
+def _batch_size(request):
+    try:
+        n = int(request.GET.get("batch_size", BATCH_SIZE_DEFAULT))
+    except ValueError:
+        n = BATCH_SIZE_DEFAULT
+    return min(max(n, BATCH_SIZE_MIN), BATCH_SIZE_MAX)
+
+
+def _export_response(request, name, columns, rows):
+    """rows: generator dict -> stream CSV (mặc định) hoặc NDJSON (?format=ndjson)."""
+    fmt = (request.GET.get("format") or "csv").lower()
+    stamp = timezone.localtime().strftime("%Y%m%d-%H%M")
+
+    if fmt in ("ndjson", "jsonl"):
+        def _ndjson():
+            for row in rows:
+                yield json.dumps(row, ensure_ascii=False, default=str) + "\n"
+        resp = StreamingHttpResponse(_ndjson(), content_type="application/x-ndjson; charset=utf-8")
+        ext = "ndjson"
+    else:
+        writer = csv.writer(_Echo())
+
+        def _csv():
+            # BOM để Excel đọc đúng tiếng Việt
+            yield "\ufeff" + writer.writerow(columns)
+            for row in rows:
+                yield writer.writerow([row.get(c, "") for c in columns])
+        resp = StreamingHttpResponse(_csv(), content_type="text/csv; charset=utf-8")
+        ext = "csv"
+
+    resp["Content-Disposition"] = f'attachment; filename="{name}-{stamp}.{ext}"'
+    resp["Cache-Control"] = "no-store"
+    resp["X-Accel-Buffering"] = "no"  # nginx: không gom buffer, đẩy ngay cho client
+    return resp
+
+
+def _chunks(cursor, size):
+    buf = []
+    for doc in cursor:
+        buf.append(doc)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+# =================== PRODUCTS ===================
+@require_http_methods(["GET"])
+def export_products(request):
+    """GET /api/export/products/?q=&cat=&format=csv|ndjson&batch_size="""
+    if not _is_admin_session(request):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+
+    filter_ = {}
+    q = (request.GET.get("q") or "").strip()
+    if q:
+        filter_["ten_san_pham"] = {"$regex": q, "$options": "i"}
+    cat = (request.GET.get("cat") or "").strip()
+    if ObjectId.is_valid(cat):
+        filter_["danh_muc_id"] = ObjectId(cat)
+
+    batch = _batch_size(request)
+    # Danh mục ít -> nạp hết 1 lần
+    cat_map = {c["_id"]: c.get("ten_danh_muc") or c.get("ten") or "" for c in danh_muc.find({}, {"ten": 1, "ten_danh_muc": 1})}
+
+    def _rows():
+        cursor = san_pham.find(
+            filter_,
+            {"ten_san_pham": 1, "ten": 1, "gia": 1, "so_luong_ton": 1, "danh_muc_id": 1, "mo_ta": 1, "hinh_anh": 1,
+             SOLD: 1, SOLD_WINDOW: 1, VIEWS: 1},
+        ).sort("_id", 1).batch_size(batch)
+        for sp in cursor:
+            imgs = sp.get("hinh_anh") or []
+            imgs = imgs if isinstance(imgs, list) else [imgs]
+            cid = sp.get("danh_muc_id")
+            yield {
+                "id": str(sp["_id"]),
+                "ten_san_pham": sp.get("ten_san_pham") or sp.get("ten") or "",
+                "gia": int(sp.get("gia", 0) or 0),
+                "so_luong_ton": int(sp.get("so_luong_ton", 0) or 0),
+                "danh_muc_id": str(cid) if cid else "",
+                "danh_muc": cat_map.get(cid, ""),
+                "mo_ta": sp.get("mo_ta", ""),
+                "hinh_anh": "|".join(str(i) for i in imgs),
+                "da_ban": int(sp.get(SOLD) or 0),
+                "da_ban_7d": int(sp.get(SOLD_WINDOW) or 0),
+                "luot_xem": int(sp.get(VIEWS) or 0),
+            }
+
+    return _export_response(request, "san-pham", PRODUCT_COLUMNS, _rows())
+
+
+# =================== ORDERS (1 dòng / 1 item) ===================
+@require_http_methods(["GET"])
+def export_orders(request):
+    """
+    GET /api/export/orders/?q=&status=&pay=&account=&product=&from=&to=&sort=&format=&batch_size=
+    Bộ lọc giống hệt /api/orders/ (donhang_view.orders_list).
+    """
+    if not _is_admin_session(request):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    request.user_oid = _cur_user_oid(request)
+    request.is_admin = True
+
+    base_match, prod_oid, sort_spec = _orders_filter(request)
+    if prod_oid:
+        base_match["items.san_pham_id"] = prod_oid
+    batch = _batch_size(request)
+    products, accounts = _LRU(), _LRU()
+
+    def _rows():
+        cursor = don_hang.find(base_match).sort(sort_spec).batch_size(batch)
+        for chunk in _chunks(cursor, batch):
+            # Tên SP / tài khoản: mỗi lô tối đa 1 query $in mỗi collection (qua LRU)
+            products.fill(san_pham, [it.get("san_pham_id") for d in chunk for it in (d.get("items") or [])]
+                          + [d.get("san_pham_id") for d in chunk], {"ten": 1, "ten_san_pham": 1})
+            accounts.fill(tai_khoan, [d.get("tai_khoan_id") for d in chunk], ACC_PROJ)
+
+            for d in chunk:
+                acc = accounts.get(d.get("tai_khoan_id")) or None
+                receiver = _merge_receiver_from_doc(d, acc)
+                head = {
+                    "don_hang_id": str(d["_id"]),
+                    "ngay_tao": _to_local_iso(d.get("ngay_tao")),
+                    "trang_thai": d.get("trang_thai") or "cho_xu_ly",
+                    "phuong_thuc_thanh_toan": d.get("phuong_thuc_thanh_toan") or "cod",
+                    "tong_tien_don": int(d.get("tong_tien", 0) or 0),
+                    "tai_khoan_id": str(d["tai_khoan_id"]) if d.get("tai_khoan_id") else "",
+                    "tai_khoan_ten": _account_label(acc) or "",
+                    "nguoi_nhan": receiver.get("ten") or "",
+                    "sdt": receiver.get("sdt") or "",
+                    "dia_chi": receiver.get("dia_chi") or "",
+                }
+                items = d.get("items") or []
+                if not items and d.get("san_pham_id"):
+                    # legacy 1-SP/đơn
+                    items = [{"san_pham_id": d.get("san_pham_id"), "so_luong": d.get("so_luong"),
+                              "don_gia": d.get("don_gia"), "tong_tien": d.get("tong_tien")}]
+                for it in items:
+                    sp_id = it.get("san_pham_id")
+                    if prod_oid and sp_id != prod_oid:
+                        continue
+                    yield {
+                        **head,
+                        "san_pham_id": str(sp_id) if sp_id else "",
+                        "san_pham_ten": _product_label(products.get(sp_id)) or it.get("san_pham_ten") or "",
+                        "so_luong": int(it.get("so_luong", 0) or 0),
+                        "don_gia": int(it.get("don_gia", 0) or 0),
+                        "tong_tien": int(it.get("tong_tien", 0) or 0),
+                    }
+
+    return _export_response(request, "don-hang", ORDER_COLUMNS, _rows())
+
+
+# =================== ACCOUNTS ===================
+@require_http_methods(["GET"])
+def export_accounts(request):
+    """GET /api/export/accounts/?q=&vai_tro=&format=&batch_size=  (không bao giờ xuất mật khẩu)"""
+    if not _is_admin_session(request):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+
+    filter_ = {}
+    q = (request.GET.get("q") or "").strip()
+    if q:
+        filter_["$or"] = [
+            {"ho_ten": {"$regex": q, "$options": "i"}},
+            {"email": {"$regex": q, "$options": "i"}},
+            {"sdt": {"$regex": q, "$options": "i"}},
+        ]
+    role = (request.GET.get("vai_tro") or "").strip()
+    if role:
+        filter_["vai_tro"] = role
+    batch = _batch_size(request)
+
+    def _rows():
+        cursor = tai_khoan.find(filter_, {"ho_ten": 1, "email": 1, "sdt": 1, "vai_tro": 1}).sort("_id", 1).batch_size(batch)
+        for u in cursor:
+            yield {
+                "id": str(u["_id"]),
+                "ho_ten": u.get("ho_ten", ""),
+                "email": u.get("email", ""),
+                "sdt": u.get("sdt", ""),
+                "vai_tro": u.get("vai_tro", ""),
+            }
+
+    return _export_response(request, "tai-khoan", ACCOUNT_COLUMNS, _rows())
@@ -0,0 +1,98 @@
+# shop/views/me_view.py
+"""
+GET /api/me/summary — mọi thứ base.html cần trong 1 request (thay cho /api/cart,
+/api/my-orders/count/, /api/my-orders/?paid=1&limit=5 và /api/auth/me):
+
+    {
+      "user": {"id", "ho_ten", "email", "vai_tro"} | null,   # lấy từ session, không đọc tai_khoan
+      "cart": {"count": 3, "tong_tien": 120000},
+      "orders": {"count": 6, "paid": 4, "recent_paid": [... như /api/my-orders/ ...]}
+    }
+
+Tối đa 3 lệnh Mongo: 1 $group giỏ hàng, 1 $facet đơn hàng, 1 $in tên sản phẩm.
+Cache-Control private, no-cache + ETag: trình duyệt luôn hỏi lại, không đổi thì 304 (không gửi body).
+"""
+import hashlib
+
+from bson import ObjectId
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_http_methods
+
+from ..database import don_hang, gio_hang
+from ..loaders import loaders_for
+from ..responses import FastJsonResponse
+from .donhang_site import _is_paid_filter, _product_ids, _serialize
+from .media_view import _etag_matches
+
+RECENT_PAID_LIMIT = 5
+# cùng projection với donhang_site.api_my_orders -> recent_paid giống hệt /api/my-orders/?paid=1
+ORDER_FIELDS = {"san_pham_id": 1, "so_luong": 1, "don_gia": 1, "tong_tien": 1, "phuong_thuc_thanh_toan": 1,
+                "trang_thai": 1, "ngay_tao": 1, "items": 1}
+
+
+def _session_user(request):
+    uid = request.session.get("user_id")
+    try:
+        oid = ObjectId(uid) if uid else None
+    except Exception:
+        oid = None
+    if not oid:
+        return None, None
+    return oid, {
+        "id": str(oid),
+        "ho_ten": request.session.get("user_name", ""),
+        "email": request.session.get("user_email", ""),
+        "vai_tro": request.session.get("user_role", ""),
+    }
+
+
+def _cart_totals(user_oid):
+    row = next(gio_hang.aggregate([
+        {"$match": {"tai_khoan_id": user_oid}},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "tong_tien": {"$sum": "$tong_tien"}}},
+    ]), None) or {}
+    return {"count": int(row.get("count", 0)), "tong_tien": int(row.get("tong_tien", 0))}
+
+
+def _order_summary(request, user_oid):
+    paid = _is_paid_filter()
+    row = next(don_hang.aggregate([
+        {"$match": {"tai_khoan_id": user_oid}},
+        {"$facet": {
+            "count": [{"$count": "n"}],
+            "paid": [{"$match": paid}, {"$count": "n"}],
+            "recent_paid": [
+                {"$match": paid},
+                {"$sort": {"ngay_tao": -1, "_id": -1}},
+                {"$limit": RECENT_PAID_LIMIT},
+                {"$project": ORDER_FIELDS},
+            ],
+        }},
+    ]), None) or {}
+    rows = row.get("recent_paid") or []
+    sp_map = loaders_for(request).products.load_many(_product_ids(rows))
+    return {
+        "count": (row.get("count") or [{}])[0].get("n", 0),
+        "paid": (row.get("paid") or [{}])[0].get("n", 0),
+        "recent_paid": [_serialize(d, sp=sp_map.get(d.get("san_pham_id")), sp_map=sp_map) for d in rows],
+    }
+
+
+@require_http_methods(["GET"])
+def me_summary(request):
+    user_oid, user = _session_user(request)
+    data = {
+        "user": user,
+        "cart": _cart_totals(user_oid) if user_oid else {"count": 0, "tong_tien": 0},
+        "orders": _order_summary(request, user_oid) if user_oid else {"count": 0, "paid": 0, "recent_paid": []},
+    }
+    response = FastJsonResponse(data)
+    etag = '"%s"' % hashlib.md5(response.content).hexdigest()
+    if _etag_matches(request.headers.get("If-None-Match", ""), etag):
+        response = HttpResponseNotModified()
+    response["ETag"] = etag
+    # giỏ / đơn đổi ở trang khác (xoá dòng, checkout) -> không được dùng bản cũ dù chỉ vài giây
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ("Cookie",))
+    return response
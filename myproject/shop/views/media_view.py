@@ -0,0 +1,200 @@
+# shop/views/media_view.py
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_http_methods
+
+# Tên file có hash nội dung: "ten.<12 hex>.jpg" -> nội dung không bao giờ đổi
+HASHED_NAME_RE = re.compile(r"\.([0-9a-f]{12})\.[A-Za-z0-9]+$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+# =================== HELPERS ===================
+@lru_cache(maxsize=4096)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    # mtime_ns/size nằm trong key cache -> file đổi thì tự tính lại
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()[:20]
+
+
+def _strong_etag(rel_path: str, full_path: str, st) -> str:
+    m = HASHED_NAME_RE.search(rel_path)
+    if m:
+        return f'"{m.group(1)}-{st.st_size}"'
+    return f'"{_file_digest(full_path, st.st_mtime_ns, st.st_size)}"'
+
+
+def _cache_control(rel_path: str) -> str:
+    if HASHED_NAME_RE.search(rel_path):
+        return f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return f"public, max-age={int(getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600))}"
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def _parse_range(header: str, size: int):
+    """
+    Chỉ hỗ trợ 1 khoảng "bytes=a-b" / "bytes=a-" / "bytes=-n".
+    Return: None (bỏ qua Range, trả cả file), (start, end) hoặc "unsatisfiable".
+    """
+    m = RANGE_RE.match((header or "").strip())
+    if not m or size == 0:
+        return None
+    first, last = m.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return (max(size - length, 0), size - 1)
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        return "unsatisfiable"
+    if end < start:
+        return None
+    return (start, min(end, size - 1))
+
+
+def _iter_range(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(rel_path: str, full_path: str) -> HttpResponse | None:
+    """Nhường việc đẩy bytes cho web server phía trước (nginx / Apache)."""
+    mode = (getattr(settings, "MEDIA_SENDFILE", "") or "").lower()
+    if mode == "x-accel-redirect":
+        resp = HttpResponse()
+        prefix = getattr(settings, "MEDIA_ACCEL_PREFIX", "/_media_internal/")
+        # nginx giải mã URI trước khi tìm file: tên có dấu cách / tiếng Việt phải được quote
+        resp["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(rel_path)
+        return resp
+    if mode == "x-sendfile":
+        resp = HttpResponse()
+        resp["X-Sendfile"] = full_path
+        return resp
+    return None
+
+
+# =================== VIEW ===================
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path: str):
+    """
+    GET /media/<path>
+    - Cache-Control immutable cho file có hash trong tên, còn lại max-age ngắn + ETag
+    - ETag mạnh, If-None-Match / If-Modified-Since -> 304
+    - Range (1 khoảng) -> 206 / 416
+    - MEDIA_SENDFILE = "x-accel-redirect" | "x-sendfile" -> web server tự đẩy file
+    """
+    rel_path = posixpath.normpath(path).lstrip("/")
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, rel_path)
+    except Exception:
+        raise Http404("Đường dẫn không hợp lệ")
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        raise Http404("Không tìm thấy file")
+    if not os.path.isfile(full_path):
+        raise Http404("Không tìm thấy file")
+
+    etag = _strong_etag(rel_path, full_path, st)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(st.st_mtime),
+        "Cache-Control": _cache_control(rel_path),
+        "Accept-Ranges": "bytes",
+    }
+
+    # ----- Conditional GET -----
+    inm = request.headers.get("If-None-Match")
+    if inm:
+        not_modified = _etag_matches(inm, etag)
+    else:
+        ims = parse_http_date_safe(request.headers.get("If-Modified-Since") or "")
+        not_modified = ims is not None and int(st.st_mtime) <= ims
+    if not_modified:
+        resp = HttpResponseNotModified()
+        for k, v in headers.items():
+            resp[k] = v
+        return resp
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or "application/octet-stream"
+
+    # ----- Offload cho nginx/Apache (tự xử lý Range) -----
+    resp = _sendfile_response(rel_path, full_path)
+    if resp is not None:
+        resp["Content-Type"] = content_type
+        for k, v in headers.items():
+            resp[k] = v
+        return resp
+
+    # ----- Range -----
+    rng = None
+    range_header = request.headers.get("Range")
+    if range_header:
+        if_range = request.headers.get("If-Range")
+        if not if_range or if_range.strip() == etag:
+            rng = _parse_range(range_header, st.st_size)
+
+    if rng == "unsatisfiable":
+        resp = HttpResponse(status=416)
+        resp["Content-Range"] = f"bytes */{st.st_size}"
+        for k, v in headers.items():
+            resp[k] = v
+        return resp
+
+    if rng:
+        start, end = rng
+        length = end - start + 1
+        if request.method == "HEAD":
+            resp = HttpResponse(status=206, content_type=content_type)
+        else:
+            resp = StreamingHttpResponse(_iter_range(full_path, start, length),
+                                         status=206, content_type=content_type)
+        resp["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+        resp["Content-Length"] = str(length)
+    elif request.method == "HEAD":
+        resp = HttpResponse(content_type=content_type)
+        resp["Content-Length"] = str(st.st_size)
+    else:
+        # FileResponse dùng wsgi.file_wrapper -> server WSGI có thể sendfile()
+        resp = FileResponse(open(full_path, "rb"), content_type=content_type)
+
+    if encoding:
+        resp["Content-Encoding"] = encoding
+    for k, v in headers.items():
+        resp[k] = v
+    return resp
@@ -0,0 +1,27 @@
+# shop/views/metrics_view.py
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+
+from ..metrics import render
+
+
+def _allowed(request):
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token:
+        auth = request.headers.get("Authorization", "")
+        return hmac.compare_digest(auth, f"Bearer {token}")
+    # Sau nginx mọi client đều là 127.0.0.1 -> không token thì chỉ tin IP khi DEBUG
+    return settings.DEBUG and request.META.get("REMOTE_ADDR") in getattr(settings, "METRICS_ALLOWED_IPS", ())
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """GET /metrics — Prometheus text format (METRICS_TOKEN; DEBUG không token: IP trong METRICS_ALLOWED_IPS)."""
+    if not _allowed(request):
+        return HttpResponse("Forbidden\n", status=403, content_type="text/plain")
+    resp = HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+    resp["Cache-Control"] = "no-store"
+    return resp
@@ -1,7 +1,20 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render, redirect
 from django.utils import timezone
 from bson import ObjectId
+from ..catalog import cache_key
+from ..concurrency import MISSING, gather
+from ..counters import VIEWS, product_views
 from ..database import san_pham, danh_muc, gio_hang
+from ..related import FIELD as RELATED_FIELD, RELATED_LIMIT
+from ..sales import SOLD, SOLD_WINDOW
+
+logger = logging.getLogger(__name__)
 
 # ===== Cấu hình phân trang =====
 PAGE_SIZE_DEFAULT = 12
@@ -40,6 +53,37 @@ def _build_page_numbers(cur, total_pages, span=2, edge=1):
         prev = p
     return result
 
+# ===== Dải giá cho bộ lọc (VNĐ): [PRICE_BANDS[i], PRICE_BANDS[i+1]), mốc cuối -> "trên" =====
+PRICE_BANDS = [0, 50000, 100000, 200000, 500000, 1000000]
+PRICE_MAX = 10 ** 12  # chặn trên cho $bucket (boundaries phải đóng)
+
+LIST_PROJECTION = {
+    "ten": 1, "ten_san_pham": 1, "mo_ta": 1, "mo_ta_ngan": 1,
+    "gia": 1, "hinh_anh": 1, "danh_muc_id": 1, SOLD: 1,
+}
+
+
+def _read_facets(agg, total):
+    """Kết quả $facet + tổng -> dict thuần (cache được): total, by_cat {id: n}, by_price {mốc dưới: n}."""
+    return {
+        "total": total,
+        "by_cat": {str(r["_id"]) if r["_id"] else "": r["n"] for r in agg.get("by_cat") or []},
+        "by_price": {r["_id"]: r["n"] for r in agg.get("by_price") or [] if r["_id"] != "khac"},
+    }
+
+
+def _price_bands(by_price, minp, maxp):
+    """by_price None (số đếm chưa có) -> count None, template ẩn số."""
+    bands = []
+    for i, lo in enumerate(PRICE_BANDS):
+        hi = PRICE_BANDS[i + 1] - 1 if i + 1 < len(PRICE_BANDS) else None
+        bands.append({
+            "min": lo, "max": hi, "count": None if by_price is None else by_price.get(lo, 0),
+            "active": minp == lo and maxp == hi,
+        })
+    return bands
+
+
 def sanpham_list(request):
     """
     /sanpham/?q=&cat=&min=&max=&sort=&page=&page_size=
@@ -47,7 +91,14 @@ def sanpham_list(request):
     - cat  : ObjectId danh mục
     - min  : giá tối thiểu (int)
     - max  : giá tối đa (int)
-    - sort : name_asc | name_desc | price_asc | price_desc | newest
+    - sort : name_asc | name_desc | price_asc | price_desc | newest | best_seller | trending | most_viewed
+             (best_seller / trending: bộ đếm da_ban / da_ban_7d có index, xem shop/sales.py;
+              most_viewed: luot_xem ghi trễ, xem shop/counters.py)
+
+    Trang: find có index (lọc đủ q / cat / giá + sort). Tổng + số sản phẩm theo danh mục /
+    dải giá: count_documents + 1 lệnh $facet, cache theo bộ lọc và version catalog
+    (shop/catalog.py) -> lần sau cùng bộ lọc chỉ còn danh mục + trang. Các lệnh chạy song song;
+    quá FANOUT_REQUEST_TIMEOUT -> vẫn trả trang, bỏ số đếm (lần sau tính lại).
     """
     q    = (request.GET.get("q") or "").strip()
     cat  = (request.GET.get("cat") or "").strip()
@@ -58,24 +109,19 @@ def sanpham_list(request):
     page = max(_int(request.GET.get("page"), 1), 1)
     page_size = min(max(_int(request.GET.get("page_size"), PAGE_SIZE_DEFAULT), 1), PAGE_SIZE_MAX)
 
-    # ----- Danh mục -----
-    categories = list(danh_muc.find({}, {"ten": 1, "ten_danh_muc": 1}))
-    cat_map = {}
-    for c in categories:
-        cid = str(c["_id"])
-        c["id"] = cid
-        cat_map[cid] = c.get("ten") or c.get("ten_danh_muc") or "Khác"
-
     # ----- Lọc -----
-    filter_ = {}
+    # base (từ khóa) áp cho mọi facet; đếm theo danh mục bỏ qua lọc danh mục,
+    # đếm theo dải giá bỏ qua lọc giá -> vẫn thấy được các lựa chọn khác
+    base = {}
     if q:
-        filter_["$or"] = [
+        base["$or"] = [
             {"ten": {"$regex": q, "$options": "i"}},
             {"ten_san_pham": {"$regex": q, "$options": "i"}},
         ]
+    cat_filter = {}
     if cat:
         try:
-            filter_["danh_muc_id"] = ObjectId(cat)
+            cat_filter["danh_muc_id"] = ObjectId(cat)
         except Exception:
             pass
 
@@ -84,8 +130,8 @@ def sanpham_list(request):
         price_cond["$gte"] = minp
     if maxp is not None:
         price_cond["$lte"] = maxp
-    if price_cond:
-        filter_["gia"] = price_cond
+    price_filter = {"gia": price_cond} if price_cond else {}
+    filter_ = {**base, **cat_filter, **price_filter}
 
     # ----- Sắp xếp -----
     sort_map = {
@@ -94,31 +140,79 @@ def sanpham_list(request):
         "price_asc": [("gia", 1), ("_id", -1)],
         "price_desc":[("gia", -1), ("_id", -1)],
         "newest":    [("_id", -1)],
+        "best_seller": [(SOLD, -1), ("_id", -1)],
+        "trending":  [(SOLD_WINDOW, -1), ("_id", -1)],
+        "most_viewed": [(VIEWS, -1), ("_id", -1)],
     }
     sort_spec = sort_map.get(sort, sort_map["name_asc"])
 
-    # ----- Đếm & phân trang -----
-    total = san_pham.count_documents(filter_)
-    pages = max((total + page_size - 1) // page_size, 1)
+    # ----- Truy vấn -----
+    def _fetch_page(page):
+        cursor = san_pham.find(filter_, LIST_PROJECTION)
+        # Áp nhiều khóa sort (gọi .sort ngược thứ tự)
+        for field, direction in reversed(sort_spec):
+            cursor = cursor.sort(field, direction)
+        return list(cursor.skip((page - 1) * page_size).limit(page_size))
+
+    def _count():
+        return san_pham.count_documents(filter_) if filter_ else san_pham.estimated_document_count()
+
+    def _facet_counts():
+        """Đếm theo danh mục (bỏ lọc danh mục) + theo dải giá (bỏ lọc giá): 1 aggregation, kết quả được cache."""
+        return next(san_pham.aggregate([
+            {"$match": base},
+            {"$facet": {
+                "by_cat": [{"$match": price_filter}, {"$group": {"_id": "$danh_muc_id", "n": {"$sum": 1}}}],
+                "by_price": [
+                    {"$match": cat_filter},
+                    {"$bucket": {"groupBy": "$gia", "boundaries": PRICE_BANDS + [PRICE_MAX],
+                                 "default": "khac", "output": {"n": {"$sum": 1}}}},
+                ],
+            }},
+        ]), {})
+
+    def _categories():
+        return list(danh_muc.find({}, {"ten": 1, "ten_danh_muc": 1}))
+
+    # Số đếm chỉ phụ thuộc bộ lọc (không phụ thuộc sort / trang) -> cache theo bộ lọc + version catalog
+    filter_id = json.dumps([q, str(cat_filter.get("danh_muc_id", "")), minp, maxp], ensure_ascii=False)
+    key = cache_key("facets:" + hashlib.md5(filter_id.encode()).hexdigest())
+    facets = cache.get(key)
+    if facets is not None:
+        categories, rows = gather(_categories, lambda: _fetch_page(page), request=request)
+    else:
+        # đếm chậm (từ khoá regex trên catalog lớn...) -> hết hạn thì chỉ bỏ số đếm, giữ trang đã đọc
+        categories, rows, total, agg = gather(
+            _categories, lambda: _fetch_page(page), _count, _facet_counts, request=request, optional=(2, 3),
+        )
+        if total is MISSING or agg is MISSING:
+            logger.warning("sanpham_list: hết hạn fan-out, bỏ số đếm (filter=%s)", filter_id)
+        else:
+            facets = _read_facets(agg, total)
+            cache.set(key, facets, getattr(settings, "CATALOG_CACHE_TIMEOUT", 3600))
+    total = facets["total"] if facets else None
+
+    # ----- Phân trang -----
+    if total is None:
+        # không biết tổng: còn trang sau khi trang này đầy
+        pages = page + 1 if len(rows) == page_size else page
+    else:
+        pages = max((total + page_size - 1) // page_size, 1)
     if page > pages:
+        # trang vượt quá (link cũ, đổi bộ lọc) -> lấy lại trang cuối
         page = pages
-    skip = (page - 1) * page_size
+        rows = _fetch_page(page)
 
-    # ----- Truy vấn -----
-    cursor = san_pham.find(
-        filter_,
-        {
-            "ten": 1, "ten_san_pham": 1, "mo_ta": 1, "mo_ta_ngan": 1,
-            "gia": 1, "hinh_anh": 1, "danh_muc_id": 1
-        }
-    )
-    # Áp nhiều khóa sort (gọi .sort ngược thứ tự)
-    for field, direction in reversed(sort_spec):
-        cursor = cursor.sort(field, direction)
-    cursor = cursor.skip(skip).limit(page_size)
+    # ----- Danh mục -----
+    cat_map = {}
+    for c in categories:
+        cid = str(c["_id"])
+        c["id"] = cid
+        c["so_luong"] = facets["by_cat"].get(cid, 0) if facets else None
+        cat_map[cid] = c.get("ten") or c.get("ten_danh_muc") or "Khác"
 
     items = []
-    for sp in cursor:
+    for sp in rows:
         sp_id = str(sp["_id"])
         name = sp.get("ten") or sp.get("ten_san_pham") or "Sản phẩm"
         desc = sp.get("mo_ta") or sp.get("mo_ta_ngan") or ""
@@ -134,6 +228,7 @@ def sanpham_list(request):
             "gia": int(sp.get("gia", 0)),
             "hinh_anh": imgs,
             "danh_muc_ten": cat_map.get(cat_id, "Khác"),
+            "da_ban": int(sp.get(SOLD) or 0),
         })
 
     context = {
@@ -145,6 +240,7 @@ def sanpham_list(request):
         "max": "" if maxp is None else maxp,
         "sort": sort,
         "total": total,
+        "price_bands": _price_bands(facets["by_price"] if facets else None, minp, maxp),
         "page": page,
         "pages": pages,
         "page_numbers": _build_page_numbers(page, pages, span=2, edge=1),
@@ -159,12 +255,27 @@ def product_detail_page(request, id: str):
     except Exception:
         return render(request, "shop/product_detail.html", {"error": "Mã sản phẩm không hợp lệ"})
 
-    sp = san_pham.find_one({"_id": oid}, {
-        "ten": 1, "ten_san_pham": 1, "mo_ta": 1, "mo_ta_ngan": 1,
-        "gia": 1, "hinh_anh": 1, "danh_muc_id": 1
-    })
-    if not sp:
+    # 1 aggregation: sản phẩm + tên danh mục + sản phẩm liên quan tính sẵn (shop/related.py)
+    rows = list(san_pham.aggregate([
+        {"$match": {"_id": oid}},
+        {"$limit": 1},
+        {"$project": {
+            "ten": 1, "ten_san_pham": 1, "mo_ta": 1, "mo_ta_ngan": 1,
+            "gia": 1, "hinh_anh": 1, "danh_muc_id": 1, RELATED_FIELD: 1,
+        }},
+        {"$lookup": {"from": danh_muc.name, "localField": "danh_muc_id", "foreignField": "_id", "as": "dm"}},
+        {"$lookup": {"from": san_pham.name, "localField": RELATED_FIELD, "foreignField": "_id", "as": "lq"}},
+        {"$project": {
+            "ten": 1, "ten_san_pham": 1, "mo_ta": 1, "mo_ta_ngan": 1,
+            "gia": 1, "hinh_anh": 1, "danh_muc_id": 1, RELATED_FIELD: 1,
+            "dm.ten": 1, "dm.ten_danh_muc": 1,
+            "lq._id": 1, "lq.ten": 1, "lq.ten_san_pham": 1, "lq.gia": 1, "lq.hinh_anh": 1,
+        }},
+    ]))
+    if not rows:
         return render(request, "shop/product_detail.html", {"error": "Không tìm thấy sản phẩm"})
+    sp = rows[0]
+    product_views.add(oid)  # chỉ cộng trong RAM, thread nền ghi gộp xuống Mongo
 
     # Chuẩn hoá dữ liệu hiển thị
     name = sp.get("ten") or sp.get("ten_san_pham") or "Sản phẩm"
@@ -173,13 +284,22 @@ def product_detail_page(request, id: str):
     imgs = imgs if isinstance(imgs, list) else [imgs]
     cat_name = "Khác"
     cat_id = sp.get("danh_muc_id")
-    if isinstance(cat_id, ObjectId):
-        cat_obj = danh_muc.find_one({"_id": cat_id}, {"ten": 1, "ten_danh_muc": 1})
-        if cat_obj:
-            cat_name = cat_obj.get("ten") or cat_obj.get("ten_danh_muc") or "Khác"
-        cat_id_str = str(cat_id)
+    cat_id_str = str(cat_id) if isinstance(cat_id, ObjectId) else None
+    cat_obj = (sp.get("dm") or [None])[0]
+    if cat_id_str and cat_obj:
+        cat_name = cat_obj.get("ten") or cat_obj.get("ten_danh_muc") or "Khác"
+
+    related_ids = sp.get(RELATED_FIELD)
+    if related_ids is not None:
+        # $lookup không giữ thứ tự -> xếp lại theo danh sách đã tính
+        by_id = {r["_id"]: r for r in sp.get("lq") or []}
+        rel_docs = [by_id[rid] for rid in related_ids if rid in by_id]
     else:
-        cat_id_str = None
+        # sản phẩm mới, compute_related chưa chạy tới -> mới nhất cùng danh mục
+        rel_filter = {"danh_muc_id": cat_id} if cat_id_str else {}
+        rel_docs = list(san_pham.find(rel_filter, {"ten": 1, "ten_san_pham": 1, "gia": 1, "hinh_anh": 1})
+                        .sort("_id", -1)
+                        .limit(RELATED_LIMIT + 1))
 
     product = {
         "id": str(sp["_id"]),
@@ -191,19 +311,13 @@ def product_detail_page(request, id: str):
         "danh_muc_id": cat_id_str,
     }
 
-    # Sản phẩm liên quan (cùng danh mục), loại trừ chính nó
+    # Sản phẩm liên quan, loại trừ chính nó
     related = []
-    rel_filter = {}
-    if cat_id_str:
-        rel_filter["danh_muc_id"] = ObjectId(cat_id_str)
-    rel_cursor = (san_pham.find(rel_filter, {
-                        "ten": 1, "ten_san_pham": 1, "gia": 1, "hinh_anh": 1
-                    })
-                    .sort("_id", -1)
-                    .limit(8))
-    for r in rel_cursor:
+    for r in rel_docs:
         if r["_id"] == oid:
             continue
+        if len(related) >= RELATED_LIMIT:
+            break
         r_imgs = r.get("hinh_anh") or []
         r_imgs = r_imgs if isinstance(r_imgs, list) else [r_imgs]
         related.append({
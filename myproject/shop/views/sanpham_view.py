@@ -1,11 +1,15 @@
 from django.http import JsonResponse, HttpResponse, HttpResponseNotAllowed
 from django.views.decorators.csrf import csrf_exempt
+from django.utils.cache import patch_cache_control
 from django.views.decorators.http import require_http_methods
 from bson import ObjectId
+from pymongo import ReturnDocument
+from .. import pricing
+from ..catalog import bump_version, touches_facets
 from ..database import san_pham
-from django.core.files.storage import FileSystemStorage
-from django.conf import settings
-import os
+from ..responses import FastJsonResponse
+from ..uploads import discard_spooled, has_uploads, spool_uploaded_images, processing_state, schedule_finalize
+from ..importer import FORMATS, guess_format, import_products
 import json
 
 # ============ Cấu hình phân trang ============
@@ -13,6 +17,26 @@ PAGE_SIZE_DEFAULT = 6
 PAGE_SIZE_MAX = 100
 
 
+IDS_MAX = 100  # ?ids= tối đa / request
+
+PRICE_RANGE_MAX_AGE = 60  # giây, Cache-Control của /api/products/price-range/
+
+# Field trả về ở danh sách (dùng chung với shop/views/async_api.py)
+LIST_FIELDS = {
+    "ten_san_pham": 1,
+    "mo_ta": 1,
+    "gia": 1,
+    "hinh_anh": 1,
+    "danh_muc_id": 1,
+    "so_luong_ton": 1,
+    "xu_ly_anh": 1,
+}
+
+
+# fields= hợp lệ (tên trong JSON = tên field Mongo); "id" luôn có
+PUBLIC_FIELDS = ("ten_san_pham", "mo_ta", "gia", "hinh_anh", "danh_muc_id", "so_luong_ton", "xu_ly_anh")
+
+
 # ============ Helpers ============
 def _json_required(request):
     ctype = request.content_type or ""
@@ -35,31 +59,100 @@ def _safe_objectid(id_str):
         return None
 
 
-def _save_uploaded_images(request_files):
-    urls = []
-    fs = FileSystemStorage(location=os.path.join(settings.MEDIA_ROOT, "sanpham"))
+def _parse_fields(request):
+    """
+    ?fields=gia,ten_san_pham -> (("gia", "ten_san_pham"), None); không có -> (None, None).
+    Field lạ -> (None, JsonResponse 400).
+    """
+    raw = (request.GET.get("fields") or "").strip()
+    if not raw:
+        return None, None
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip() and f.strip() != "id"))
+    unknown = [f for f in fields if f not in PUBLIC_FIELDS]
+    if unknown:
+        return None, JsonResponse({"error": f"fields không hợp lệ: {', '.join(unknown)}",
+                                   "allowed": ["id", *PUBLIC_FIELDS]}, status=400)
+    return fields, None
+
+
+def _projection(fields, default=None):
+    """fields -> projection Mongo (chỉ _id nếu fields rỗng); None -> default."""
+    if fields is None:
+        return default
+    return {f: 1 for f in fields} or {"_id": 1}
+
 
-    keys = []
-    if "hinh_anh" in request_files:
-        keys.append("hinh_anh")
-    if "hinh_anh[]" in request_files:
-        keys.append("hinh_anh[]")
+def _parse_ids(request):
+    """
+    ?ids=a,b,c -> ([ObjectId...], None) giữ thứ tự, bỏ trùng; không có -> (None, None).
+    id sai / quá IDS_MAX -> (None, JsonResponse 400).
+    """
+    raw = (request.GET.get("ids") or "").strip()
+    if not raw:
+        return None, None
+    parts = list(dict.fromkeys(p.strip() for p in raw.split(",") if p.strip()))
+    if len(parts) > IDS_MAX:
+        return None, JsonResponse({"error": f"Tối đa {IDS_MAX} ids / request"}, status=400)
+    oids = [_safe_objectid(p) for p in parts]
+    bad = [p for p, o in zip(parts, oids) if o is None]
+    if bad:
+        return None, JsonResponse({"error": f"ids không hợp lệ: {', '.join(bad)}"}, status=400)
+    return oids, None
+
+
+def _products_by_ids(docs, oids, fields=None):
+    """Kết quả $in -> {"items" theo thứ tự ids, "missing"}."""
+    by_id = {sp["_id"]: sp for sp in docs}
+    return {
+        "items": [_serialize_product(by_id[o], fields) for o in oids if o in by_id],
+        "missing": [o for o in oids if o not in by_id],
+    }
 
-    for key in keys:
-        files = request_files.getlist(key)
-        for f in files:
-            filename = fs.save(f.name, f)
-            urls.append("sanpham/" + filename)
 
-    return urls
+def _serialize_product(sp, fields=None):
+    """fields: chỉ trả các field đó (+ id), khớp với projection đã dùng khi đọc."""
+    # ObjectId để nguyên, FastJsonResponse tự encode
+    data = {
+        "id": sp["_id"],
+        "ten_san_pham": sp.get("ten_san_pham", ""),
+        "mo_ta": sp.get("mo_ta", ""),
+        "gia": sp.get("gia", 0),
+        "hinh_anh": sp.get("hinh_anh", []),
+        "danh_muc_id": sp.get("danh_muc_id") or None,
+        "so_luong_ton": int(sp.get("so_luong_ton", 0)),
+    }
+    # Ảnh đang được xử lý nền (xem shop/uploads.py)
+    xl = sp.get("xu_ly_anh")
+    if xl:
+        data["xu_ly_anh"] = {
+            "trang_thai": xl.get("trang_thai"),
+            "xong": int(xl.get("xong", 0)),
+            "tong": int(xl.get("tong", 0)),
+            "loi": xl.get("loi") or [],
+        }
+    if fields is not None:
+        return {"id": data["id"], **{f: data[f] for f in fields if f in data}}
+    return data
 
 
 # ============ LIST ============
 @require_http_methods(["GET"])
 def products_list(request):
     """
-    GET /api/products/?q=&page=&page_size=
+    GET /api/products/?q=&page=&page_size=&fields=
+    GET /api/products/?ids=a,b,c&fields=     (nhiều sản phẩm, 1 lệnh $in, giữ thứ tự ids)
+    fields=gia,ten_san_pham -> projection Mongo, chỉ trả các field đó (+ id)
     """
+    fields, err = _parse_fields(request)
+    if err:
+        return err
+    ids, err = _parse_ids(request)
+    if err:
+        return err
+    if ids is not None:
+        docs = san_pham.find({"_id": {"$in": ids}}, _projection(fields, LIST_FIELDS))
+        return FastJsonResponse(_products_by_ids(docs, ids, fields))
+
     q = (request.GET.get("q") or "").strip()
     page = max(_to_int(request.GET.get("page", 1), 1), 1)
     page_size = _to_int(request.GET.get("page_size", PAGE_SIZE_DEFAULT), PAGE_SIZE_DEFAULT)
@@ -73,37 +166,15 @@ def products_list(request):
     skip = (page - 1) * page_size
 
     cursor = (
-        san_pham.find(
-            filter_,
-            {
-                "ten_san_pham": 1,
-                "mo_ta": 1,
-                "gia": 1,
-                "hinh_anh": 1,
-                "danh_muc_id": 1,
-                "so_luong_ton": 1,  # <-- THÊM
-            },
-        )
+        san_pham.find(filter_, _projection(fields, LIST_FIELDS))
         .sort("ten_san_pham", 1)
         .skip(skip)
         .limit(page_size)
     )
 
-    items = []
-    for sp in cursor:
-        items.append(
-            {
-                "id": str(sp["_id"]),
-                "ten_san_pham": sp.get("ten_san_pham", ""),
-                "mo_ta": sp.get("mo_ta", ""),
-                "gia": sp.get("gia", 0),
-                "hinh_anh": sp.get("hinh_anh", []),
-                "danh_muc_id": str(sp["danh_muc_id"]) if sp.get("danh_muc_id") else None,
-                "so_luong_ton": int(sp.get("so_luong_ton", 0)),  # <-- THÊM
-            }
-        )
+    items = [_serialize_product(sp, fields) for sp in cursor]
 
-    return JsonResponse(
+    return FastJsonResponse(
         {
             "items": items,
             "total": total,
@@ -113,6 +184,31 @@ def products_list(request):
     )
 
 
+# ============ PRICE RANGE (thanh trượt giá) ============
+@require_http_methods(["GET"])
+def products_price_range(request):
+    """
+    GET /api/products/price-range/?cat=<danh_muc_id>
+    Phân bố giá tính sẵn (shop/pricing.py): min, max, step, count, buckets[BINS].
+    Không có cat -> {"bins", "all", "categories": {id: ...}} để UI đổi danh mục không phải gọi lại.
+    """
+    hist = pricing.load()
+    keys = hist.get("keys") or {}
+    cat = (request.GET.get("cat") or "").strip()
+    if cat:
+        data = {"bins": hist.get("bins", pricing.BINS), "cat": cat, **(keys.get(cat) or pricing.empty_entry())}
+    else:
+        data = {
+            "bins": hist.get("bins", pricing.BINS),
+            "all": keys.get(pricing.ALL) or pricing.empty_entry(),
+            "categories": {k: v for k, v in keys.items() if k != pricing.ALL},
+        }
+    data["cap_nhat"] = hist.get("cap_nhat")
+    response = FastJsonResponse(data)
+    patch_cache_control(response, public=True, max_age=PRICE_RANGE_MAX_AGE)
+    return response
+
+
 # ============ CREATE ============
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -133,13 +229,11 @@ def products_create(request):
         if not ten:
             return JsonResponse({"error": "Thiếu ten_san_pham"}, status=400)
 
-        hinh_anh_urls = _save_uploaded_images(request.FILES)
-
         doc = {
             "ten_san_pham": ten,
             "mo_ta": mo_ta,
             "gia": gia,
-            "hinh_anh": hinh_anh_urls,
+            "hinh_anh": [],
             "so_luong_ton": max(0, so_luong_ton),  # <-- THÊM
         }
 
@@ -149,19 +243,17 @@ def products_create(request):
                 return JsonResponse({"error": "Invalid danh_muc_id"}, status=400)
             doc["danh_muc_id"] = oid
 
+        # Ảnh: chỉ spool rồi trả về ngay, worker nền xử lý & patch hinh_anh sau
+        spooled = spool_uploaded_images(request.FILES)
+        if spooled:
+            doc["xu_ly_anh"] = processing_state(len(spooled))
+
         res = san_pham.insert_one(doc)
-        return JsonResponse(
-            {
-                "id": str(res.inserted_id),
-                "ten_san_pham": ten,
-                "gia": gia,
-                "mo_ta": mo_ta,
-                "hinh_anh": hinh_anh_urls,
-                "danh_muc_id": str(doc.get("danh_muc_id")) if doc.get("danh_muc_id") else None,
-                "so_luong_ton": doc["so_luong_ton"],  # <-- THÊM
-            },
-            status=201,
-        )
+        pricing.apply_change(new=(doc.get("danh_muc_id"), doc["gia"]))
+        bump_version()
+        if spooled:
+            schedule_finalize(res.inserted_id, doc["xu_ly_anh"], spooled)
+        return FastJsonResponse(_serialize_product(doc), status=201)
 
     # ---- JSON ----
     err = _json_required(request)
@@ -198,26 +290,42 @@ def products_create(request):
         doc["danh_muc_id"] = oid
 
     res = san_pham.insert_one(doc)
+    pricing.apply_change(new=(doc.get("danh_muc_id"), doc["gia"]))
+    bump_version()
     created = san_pham.find_one({"_id": res.inserted_id})
-    return JsonResponse(
-        {
-            "id": str(created["_id"]),
-            "ten_san_pham": created.get("ten_san_pham", ""),
-            "mo_ta": created.get("mo_ta", ""),
-            "gia": created.get("gia", 0),
-            "hinh_anh": created.get("hinh_anh", []),
-            "danh_muc_id": str(created["danh_muc_id"]) if created.get("danh_muc_id") else None,
-            "so_luong_ton": int(created.get("so_luong_ton", 0)),  # <-- THÊM
-        },
-        status=201,
+    return FastJsonResponse(_serialize_product(created), status=201)
+
+
+# ============ IMPORT (CSV / JSONL) ============
+@csrf_exempt
+@require_http_methods(["POST"])
+def products_import(request):
+    """
+    POST /api/products/import/   (multipart: file, format?, create_categories?)
+    - Chỉ admin. Upsert theo lô, trả về báo cáo lỗi theo từng dòng.
+    """
+    if (request.session.get("user_role") or "").lower() != "admin":
+        return JsonResponse({"error": "Forbidden"}, status=403)
+
+    upload = request.FILES.get("file")
+    if not upload:
+        return JsonResponse({"error": "Thiếu file"}, status=400)
+    fmt = (request.POST.get("format") or guess_format(upload.name)).strip().lower()
+    if fmt not in FORMATS:
+        return JsonResponse({"error": "format phải là csv hoặc jsonl"}, status=400)
+
+    report = import_products(
+        upload.file, fmt=fmt,
+        create_categories=request.POST.get("create_categories") in ("1", "true", "on"),
     )
+    return JsonResponse(report, status=200 if not report["failed"] else 207)
 
 
 # ============ DETAIL (GET/PUT/DELETE/POST _method=PUT) ============
 @csrf_exempt
 def product_detail(request, id):
     """
-    GET    /api/products/<id>/
+    GET    /api/products/<id>/?fields=gia,hinh_anh
     PUT    /api/products/<id>/        (JSON)
     POST   /api/products/<id>/?_method=PUT  (multipart/form-data update with files)
     DELETE /api/products/<id>/
@@ -228,20 +336,13 @@ def product_detail(request, id):
 
     # ----- GET -----
     if request.method == "GET":
-        sp = san_pham.find_one({"_id": oid})
+        fields, err = _parse_fields(request)
+        if err:
+            return err
+        sp = san_pham.find_one({"_id": oid}, _projection(fields))
         if not sp:
             return JsonResponse({"error": "Not found"}, status=404)
-        return JsonResponse(
-            {
-                "id": str(sp["_id"]),
-                "ten_san_pham": sp.get("ten_san_pham", ""),
-                "mo_ta": sp.get("mo_ta", ""),
-                "gia": sp.get("gia", 0),
-                "hinh_anh": sp.get("hinh_anh", []),
-                "danh_muc_id": str(sp["danh_muc_id"]) if sp.get("danh_muc_id") else None,
-                "so_luong_ton": int(sp.get("so_luong_ton", 0)),  # <-- THÊM
-            }
-        )
+        return FastJsonResponse(_serialize_product(sp, fields))
 
     # ----- POST (multipart override to PUT) -----
     if request.method == "POST" and (request.POST.get("_method") or "").upper() == "PUT":
@@ -276,13 +377,6 @@ def product_detail(request, id):
                 return JsonResponse({"error": "so_luong_ton phải là số >= 0"}, status=400)
             update["so_luong_ton"] = slt  # <-- THÊM
 
-        new_imgs = _save_uploaded_images(request.FILES)
-        text_img = (request.POST.get("hinh_anh_text") or "").strip()
-        if text_img:
-            new_imgs.append(text_img)
-        if new_imgs:
-            update["hinh_anh"] = new_imgs
-
         if "danh_muc_id" in request.POST:
             dm = request.POST.get("danh_muc_id")
             if dm:
@@ -293,25 +387,32 @@ def product_detail(request, id):
             else:
                 update["danh_muc_id"] = None
 
+        # Ảnh mới: spool + xử lý nền (chỉ sau khi đã validate xong); ảnh dạng text (path/URL) gắn kèm khi job xong
+        text_img = (request.POST.get("hinh_anh_text") or "").strip()
+        spooled = spool_uploaded_images(request.FILES) if has_uploads(request.FILES) else []
+        if spooled:
+            update["xu_ly_anh"] = processing_state(len(spooled))
+        elif text_img:
+            update["hinh_anh"] = [text_img]
+
         if not update:
             return JsonResponse({"error": "No fields to update"}, status=400)
 
         result = san_pham.update_one({"_id": oid}, {"$set": update})
         if result.matched_count == 0:
+            discard_spooled(spooled)  # sản phẩm vừa bị xoá -> không để file mồ côi trong spool
             return JsonResponse({"error": "Not found"}, status=404)
+        if touches_facets(update):
+            pricing.apply_change(
+                old=(sp.get("danh_muc_id"), sp.get("gia")),
+                new=(update.get("danh_muc_id", sp.get("danh_muc_id")), update.get("gia", sp.get("gia"))),
+            )
+            bump_version()
+        if spooled:
+            schedule_finalize(oid, update["xu_ly_anh"], spooled, extra=[text_img] if text_img else [])
 
         sp = san_pham.find_one({"_id": oid})
-        return JsonResponse(
-            {
-                "id": str(sp["_id"]),
-                "ten_san_pham": sp.get("ten_san_pham", ""),
-                "mo_ta": sp.get("mo_ta", ""),
-                "gia": sp.get("gia", 0),
-                "hinh_anh": sp.get("hinh_anh", []),
-                "danh_muc_id": str(sp["danh_muc_id"]) if sp.get("danh_muc_id") else None,
-                "so_luong_ton": int(sp.get("so_luong_ton", 0)),  # <-- THÊM
-            }
-        )
+        return FastJsonResponse(_serialize_product(sp))
 
     # ----- PUT (JSON) -----
     elif request.method == "PUT":
@@ -352,28 +453,30 @@ def product_detail(request, id):
         if not update:
             return JsonResponse({"error": "No fields to update"}, status=400)
 
-        result = san_pham.update_one({"_id": oid}, {"$set": update})
-        if result.matched_count == 0:
+        # bản trước khi ghi -> biết gia / danh_muc_id cũ cho histogram giá
+        before = san_pham.find_one_and_update(
+            {"_id": oid}, {"$set": update},
+            projection={"gia": 1, "danh_muc_id": 1}, return_document=ReturnDocument.BEFORE,
+        )
+        if before is None:
             return JsonResponse({"error": "Not found"}, status=404)
+        if touches_facets(update):
+            pricing.apply_change(
+                old=(before.get("danh_muc_id"), before.get("gia")),
+                new=(update.get("danh_muc_id", before.get("danh_muc_id")), update.get("gia", before.get("gia"))),
+            )
+            bump_version()
 
         sp = san_pham.find_one({"_id": oid})
-        return JsonResponse(
-            {
-                "id": str(sp["_id"]),
-                "ten_san_pham": sp.get("ten_san_pham", ""),
-                "mo_ta": sp.get("mo_ta", ""),
-                "gia": sp.get("gia", 0),
-                "hinh_anh": sp.get("hinh_anh", []),
-                "danh_muc_id": str(sp["danh_muc_id"]) if sp.get("danh_muc_id") else None,
-                "so_luong_ton": int(sp.get("so_luong_ton", 0)),  # <-- THÊM
-            }
-        )
+        return FastJsonResponse(_serialize_product(sp))
 
     # ----- DELETE -----
     elif request.method == "DELETE":
-        deleted = san_pham.delete_one({"_id": oid})
-        if deleted.deleted_count == 0:
+        deleted = san_pham.find_one_and_delete({"_id": oid}, projection={"gia": 1, "danh_muc_id": 1})
+        if deleted is None:
             return JsonResponse({"error": "Not found"}, status=404)
+        pricing.apply_change(old=(deleted.get("danh_muc_id"), deleted.get("gia")))
+        bump_version()
         return HttpResponse(status=204)
 
     # ----- Method khác -----